@@ -0,0 +1,423 @@
+"""
+A simulated Discord for load tests: synthetic gateway payloads are parsed by pycord's own
+ConnectionState, REST calls are answered locally, and voice goes through a fake voice
+client that plays sources in real time and feeds synthetic PCM into recording sinks.
+"""
+import asyncio
+import io
+import itertools
+import logging
+import threading
+import time
+import wave
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+import discord
+
+_ids = itertools.count(900_000_000_000_000_000)
+_TIMESTAMP = "2024-01-01T00:00:00+00:00"
+
+
+def snowflake() -> int:
+    return next(_ids)
+
+
+def _user_payload(user_id: int, name: str, bot: bool = False) -> dict:
+    return {"id": str(user_id), "username": name, "discriminator": "0", "global_name": name, "avatar": None, "bot": bot}
+
+
+def _member_payload(user_id: int, name: str) -> dict:
+    return {"user": _user_payload(user_id, name), "roles": [], "joined_at": _TIMESTAMP, "deaf": False, "mute": False}
+
+
+class LatencyTracker:
+    '''Collects per-guild latencies and errors for every simulated operation'''
+
+    def __init__(self) -> None:
+        self.samples: Dict[str, Dict[int, List[float]]] = {}
+        self.errors: Dict[str, int] = {}
+        self._expect_text: Dict[int, List[tuple]] = {}   # channel id -> [(op, guild id, start)]
+        self._expect_audio: Dict[int, List[tuple]] = {}  # guild id -> [(op, start)]
+
+    def record(self, op: str, guild_id: int, seconds: float) -> None:
+        self.samples.setdefault(op, {}).setdefault(guild_id, []).append(seconds)
+
+    def error(self, op: str) -> None:
+        self.errors[op] = self.errors.get(op, 0) + 1
+
+    def expect_text(self, channel_id: int, op: str, guild_id: int, count: int = 1) -> None:
+        """Time the next `count` messages the bot sends to a channel against now"""
+        start = time.perf_counter()
+        self._expect_text.setdefault(channel_id, []).extend([(op, guild_id, start)] * count)
+
+    def expect_audio(self, guild_id: int, op: str) -> None:
+        self._expect_audio.setdefault(guild_id, []).append((op, time.perf_counter()))
+
+    def text_sent(self, channel_id: int) -> None:
+        pending = self._expect_text.get(channel_id)
+        if pending:
+            op, guild_id, start = pending.pop(0)
+            self.record(op, guild_id, time.perf_counter() - start)
+
+    def audio_started(self, guild_id: int) -> None:
+        pending = self._expect_audio.get(guild_id)
+        if pending:
+            op, start = pending.pop(0)
+            self.record(op, guild_id, time.perf_counter() - start)
+
+    def unanswered(self) -> int:
+        return sum(len(v) for v in self._expect_text.values()) + sum(len(v) for v in self._expect_audio.values())
+
+
+class FakeHTTP:
+    '''Answers the REST calls the cogs make, without a network'''
+
+    def __init__(self, bot: discord.Bot, tracker: LatencyTracker, bot_user: dict) -> None:
+        self.bot = bot
+        self.tracker = tracker
+        self.bot_user = bot_user
+        self.calls: Dict[str, int] = {}
+
+    def install(self) -> None:
+        http = self.bot.http
+        for name in ("send_message", "send_files", "send_typing", "get_user", "edit_message", "delete_message"):
+            setattr(http, name, getattr(self, name))
+
+    def _count(self, name: str) -> None:
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    async def send_message(self, channel_id, content=None, **kwargs) -> dict:
+        self._count("send_message")
+        self.tracker.text_sent(int(channel_id))
+        return {
+            "id": str(snowflake()), "channel_id": str(channel_id), "author": self.bot_user, "content": content or "",
+            "timestamp": _TIMESTAMP, "edited_timestamp": None, "tts": False, "mention_everyone": False,
+            "mentions": [], "mention_roles": [], "attachments": [], "embeds": [], "pinned": False, "type": 0,
+        }
+
+    async def send_files(self, channel_id, *, files=None, content=None, **kwargs) -> dict:
+        return await self.send_message(channel_id, content)
+
+    async def send_typing(self, channel_id) -> None:
+        self._count("send_typing")
+
+    async def get_user(self, user_id) -> dict:
+        self._count("get_user")
+        return _user_payload(int(user_id), f"user{user_id}")
+
+    async def edit_message(self, channel_id, message_id, **fields) -> dict:
+        return await self.send_message(channel_id, fields.get("content"))
+
+    async def delete_message(self, channel_id, message_id, **kwargs) -> None:
+        self._count("delete_message")
+
+
+class FakeGuild:
+    '''Ids of one simulated guild and handles to the pycord objects built from them'''
+
+    def __init__(self, guild: discord.Guild, text_channel_id: int, voice_channel_id: int, member_ids: List[int]) -> None:
+        self.guild = guild
+        self.id = guild.id
+        self.text_channel = guild.get_channel(text_channel_id)
+        self.voice_channel = guild.get_channel(voice_channel_id)
+        self.member_ids = member_ids
+
+    def member(self, index: int = 0) -> discord.Member:
+        """The member as an interaction carries it (the member cache may not hold it)"""
+        user_id = self.member_ids[index % len(self.member_ids)]
+        return discord.Member(data=_member_payload(user_id, f"user{user_id}"), guild=self.guild, state=self.guild._state)
+
+
+class FakeGateway:
+    '''Builds guilds and dispatches events through the bot's real ConnectionState parsers'''
+
+    def __init__(self, bot: discord.Bot, tracker: LatencyTracker) -> None:
+        self.bot = bot
+        self.state = bot._connection
+        self.tracker = tracker
+        self.bot_id = snowflake()
+        self.bot_user = _user_payload(self.bot_id, "Lucia", bot=True)
+        self.http = FakeHTTP(bot, tracker, self.bot_user)
+        self.guilds: List[FakeGuild] = []
+
+    def connect(self) -> None:
+        """Act as if READY was received: set the bot user and answer REST calls locally"""
+        self.state.user = discord.ClientUser(state=self.state, data=self.bot_user)
+        self.http.install()
+
+    def add_guild(self, members: int = 20, in_voice: int = 3) -> FakeGuild:
+        guild_id, text_id, voice_id = snowflake(), snowflake(), snowflake()
+        member_ids = [snowflake() for _ in range(members)]
+        data = {
+            "id": str(guild_id), "name": f"guild-{len(self.guilds)}", "owner_id": str(member_ids[0]),
+            "member_count": members + 1, "large": False, "features": [], "emojis": [], "stickers": [],
+            "roles": [{"id": str(guild_id), "name": "@everyone", "permissions": "0", "position": 0, "color": 0,
+                       "colors": {"primary_color": 0, "secondary_color": None, "tertiary_color": None},
+                       "hoist": False, "managed": False, "mentionable": False}],
+            "channels": [
+                {"id": str(text_id), "type": 0, "name": "general", "position": 0, "permission_overwrites": []},
+                {"id": str(voice_id), "type": 2, "name": "voice", "position": 1, "permission_overwrites": [],
+                 "bitrate": 64000, "user_limit": 0},
+            ],
+            "members": [_member_payload(self.bot_id, "Lucia")] + [_member_payload(m, f"user{m}") for m in member_ids],
+            "voice_states": [
+                {"user_id": str(m), "channel_id": str(voice_id), "session_id": "x", "deaf": False, "mute": False,
+                 "self_deaf": False, "self_mute": False, "self_video": False, "suppress": False,
+                 "request_to_speak_timestamp": None}
+                for m in member_ids[:in_voice]
+            ],
+        }
+        guild = self.state._add_guild_from_data(data)
+        fake = FakeGuild(guild, text_id, voice_id, member_ids)
+        self.guilds.append(fake)
+        return fake
+
+    def mention(self, fake: FakeGuild, author_index: int, content: str) -> discord.Message:
+        """Build a MESSAGE_CREATE mentioning the bot, parsed as the gateway would, ready for on_message"""
+        author_id = fake.member_ids[author_index % len(fake.member_ids)]
+        data = {
+            "id": str(snowflake()), "channel_id": str(fake.text_channel.id), "guild_id": str(fake.id),
+            "author": _user_payload(author_id, f"user{author_id}"),
+            "member": {"roles": [], "joined_at": _TIMESTAMP, "deaf": False, "mute": False},
+            "content": f"<@{self.bot_id}> {content}", "timestamp": _TIMESTAMP, "edited_timestamp": None,
+            "tts": False, "mention_everyone": False, "mention_roles": [], "attachments": [], "embeds": [],
+            "pinned": False, "type": 0,
+            "mentions": [dict(self.bot_user, member={"roles": [], "joined_at": _TIMESTAMP, "deaf": False, "mute": False})],
+        }
+        message = discord.Message(channel=fake.text_channel, data=data, state=self.state)
+        if self.state._messages is not None:
+            self.state._messages.append(message)
+        return message
+
+
+class FakeContext:
+    '''Application context for invoking slash command callbacks against a simulated guild'''
+
+    def __init__(self, bot: discord.Bot, fake: FakeGuild, author: discord.Member, tracker: LatencyTracker, op: str) -> None:
+        self.bot = bot
+        self.guild = fake.guild
+        self.guild_id = fake.id
+        self.author = self.user = author
+        self.channel = fake.text_channel
+        self.tracker = tracker
+        self.op = op
+        self.start = time.perf_counter()
+        self.responded = False
+        self.followup = SimpleNamespace(send=self.respond)
+
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+
+    async def respond(self, content: str = None, **kwargs) -> None:
+        if not self.responded:
+            self.responded = True
+            self.tracker.record(self.op, self.guild_id, time.perf_counter() - self.start)
+
+    async def defer(self, **kwargs) -> None:
+        await self.respond()
+
+    async def send(self, content: str = None, **kwargs) -> None:
+        await self.channel.send(content)
+
+
+async def invoke(bot: discord.Bot, fake: FakeGuild, name: str, tracker: LatencyTracker, author_index: int = 0, **options) -> None:
+    """Run a slash command the way pycord would after parsing its interaction"""
+    command = next(c for c in bot.pending_application_commands if c.name == name)
+    ctx = FakeContext(bot, fake, fake.member(author_index), tracker, f"command.{name}")
+    try:
+        await command.call_before_hooks(ctx)
+        await command.callback(command.cog, ctx, **options)
+    except Exception as e:
+        logging.error(f"Simulated /{name} failed: {e}")
+        tracker.error(f"command.{name}")
+
+
+class FakeVoiceClient(discord.VoiceProtocol):
+    '''
+    Voice client that never opens a socket.
+
+    `play` reads the source in real time (one 20 ms frame per tick) on a thread, as the
+    real player does. Recording sinks receive synthetic 48 kHz stereo PCM for every
+    member speaking in the channel, and `stop_recording` formats the sink and runs the
+    callback on the bot's loop.
+    '''
+
+    FRAME = 3840  # 20 ms of 48 kHz 16-bit stereo
+    decoder = SimpleNamespace(CHANNELS=2, SAMPLE_SIZE=4, SAMPLING_RATE=48000)
+
+    def __init__(self, bot: discord.Bot, fake: FakeGuild, tracker: LatencyTracker) -> None:
+        super().__init__(bot, fake.voice_channel)
+        self.guild = fake.guild
+        self.fake = fake
+        self.tracker = tracker
+        self.loop = bot.loop
+        self.recording = False
+        self.paused = False
+        self._player: Optional[threading.Thread] = None
+        self._stop_playing = threading.Event()
+        self._sink = None
+        self._callback = None
+        self._callback_args = ()
+        self.frames_played = 0
+        self.format_errors = 0
+
+    def attach(self) -> "FakeVoiceClient":
+        self.client._connection._add_voice_client(self.guild.id, self)
+        return self
+
+    async def connect(self, *, timeout: float, reconnect: bool) -> None:
+        pass
+
+    async def disconnect(self, *, force: bool = False) -> None:
+        self.stop()
+        self.cleanup()
+
+    def is_connected(self) -> bool:
+        return True
+
+    def is_playing(self) -> bool:
+        return self._player is not None and self._player.is_alive()
+
+    def is_paused(self) -> bool:
+        return False
+
+    def play(self, source: discord.AudioSource, *, after: Optional[Callable] = None) -> None:
+        if self.is_playing():
+            raise discord.ClientException("Already playing audio.")
+        self._stop_playing.clear()
+        self._player = threading.Thread(target=self._play, args=(source, after), daemon=True, name="fake-voice-player")
+        self._player.start()
+
+    def _play(self, source: discord.AudioSource, after: Optional[Callable]) -> None:
+        error = None
+        first = True
+        next_tick = time.perf_counter()
+        try:
+            while not self._stop_playing.is_set():
+                data = source.read()
+                if not data:
+                    break
+                if first:
+                    first = False
+                    self.loop.call_soon_threadsafe(self.tracker.audio_started, self.guild.id)
+                self.frames_played += 1
+                next_tick += 0.02
+                time.sleep(max(0.0, next_tick - time.perf_counter()))
+        except Exception as e:
+            error = e
+        finally:
+            source.cleanup()
+        if after is not None:
+            try:
+                after(error)
+            except Exception as e:
+                logging.error(f"Fake voice after-callback failed: {e}")
+
+    def stop(self) -> None:
+        self._stop_playing.set()
+
+    def start_recording(self, sink, callback, *args) -> None:
+        self.recording = True
+        sink.init(self)
+        self._sink = sink
+        self._callback = callback
+        self._callback_args = args
+
+    def feed(self, speakers: List[int], frames: int, pcm_frame: bytes) -> None:
+        """Write `frames` 20 ms frames per speaker into the active sink"""
+        if self._sink is None:
+            return
+        for _ in range(frames):
+            for user_id in speakers:
+                self._sink.write(pcm_frame, user_id)
+
+    def stop_recording(self) -> None:
+        if not self.recording:
+            raise discord.sinks.RecordingException("Not currently recording audio.")
+        self.recording = False
+        sink, self._sink = self._sink, None
+        try:
+            sink.cleanup()
+        except Exception as e:
+            # MP3 sinks need FFmpeg; without it the callback still gets the raw PCM
+            self.format_errors += 1
+            logging.debug(f"Fake voice could not format recording: {e}")
+            for audio in sink.audio_data.values():
+                audio.file.seek(0)
+        asyncio.run_coroutine_threadsafe(self._callback(sink, *self._callback_args), self.loop)
+
+
+class SilentSource(discord.AudioSource):
+    '''PCM source of a fixed duration, used instead of FFmpeg when it is not installed'''
+
+    def __init__(self, seconds: float) -> None:
+        self.frames = max(1, int(seconds / 0.02))
+
+    def read(self) -> bytes:
+        if self.frames <= 0:
+            return b""
+        self.frames -= 1
+        return b"\x00" * FakeVoiceClient.FRAME
+
+
+def stub_ffmpeg(bot: discord.Bot, clip_seconds: float = 3.0) -> None:
+    """Replace FFmpeg process creation with silent PCM sources of a fixed length"""
+    async def create_source(source: Any, kind: str, guild_id: Optional[int] = None, pipe: bool = False,
+                            input_format: Optional[str] = None) -> discord.AudioSource:
+        bot.metrics.incr(f"ffmpeg.spawned.{kind}")
+        return bot.compute.realtime_source(SilentSource(clip_seconds))
+
+    bot.ffmpeg.create_source = create_source
+
+
+def silent_wav(seconds: float = 1.0, rate: int = 24000) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(b"\x00\x00" * int(seconds * rate))
+    return buffer.getvalue()
+
+
+def stub_tts(bot: discord.Bot, latency: float, audio: Optional[bytes] = None) -> None:
+    """Replace network TTS in both voice cogs with a fixed-latency synthesizer returning a WAV"""
+    audio = audio or silent_wav()
+
+    async def synthesize(text: str) -> bytes:
+        await asyncio.sleep(latency)
+        return audio
+
+    bot.get_cog("SimpleVoiceCog").synthesize = synthesize
+    bot.get_cog("RVCVoiceEnhancedCog")._generate_edge_tts = synthesize
+
+
+class SimulatedWhisper:
+    '''Stands in for a Whisper model: burns CPU for `rtf` x the clip length and returns fixed text'''
+
+    def __init__(self, rtf: float = 0.1, text: str = "what is the weather like today") -> None:
+        self.rtf = rtf
+        self.text = text
+
+    def transcribe(self, audio: Any, **kwargs) -> dict:
+        if isinstance(audio, str):
+            with wave.open(audio, "rb") as f:
+                duration = f.getnframes() / f.getframerate()
+        else:
+            duration = len(audio) / 16000
+        self._burn(duration * self.rtf)
+        return {"text": self.text, "segments": [{"start": 0.0, "end": duration, "text": self.text}]}
+
+    def transcribe_batch(self, audios: List[Any], **kwargs) -> List[dict]:
+        """A batch shares one pass over the weights: each extra clip adds a quarter of the longest one"""
+        durations = [len(audio) / 16000 for audio in audios]
+        self._burn(max(durations) * self.rtf * (1 + 0.25 * (len(audios) - 1)))
+        return [{"text": self.text, "segments": [{"start": 0.0, "end": d, "text": self.text}]} for d in durations]
+
+    @staticmethod
+    def _burn(seconds: float) -> None:
+        deadline = time.thread_time() + seconds
+        while time.thread_time() < deadline:
+            pass
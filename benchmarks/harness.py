@@ -0,0 +1,147 @@
+import asyncio
+import inspect
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+class SkipBenchmark(Exception):
+    '''Raised by a benchmark's setup when it cannot run here (missing model, no fixtures...)'''
+
+
+class Benchmark:
+    '''
+    One timed operation.
+
+    `setup` runs once and returns a context passed to every call; `before_each` (optional)
+    builds fresh per-call arguments outside the timed region, for operations that consume
+    their input. Both the operation and the hooks may be coroutines.
+    '''
+
+    def __init__(self, name: str, func: Callable, group: str, setup: Optional[Callable] = None,
+                 before_each: Optional[Callable] = None, iterations: int = 1, params: Optional[dict] = None) -> None:
+        self.name = name
+        self.func = func
+        self.group = group
+        self.setup = setup
+        self.before_each = before_each
+        self.iterations = iterations
+        self.params = params or {}
+
+
+REGISTRY: List[Benchmark] = []
+
+
+def benchmark(name: str, group: str, setup: Optional[Callable] = None, before_each: Optional[Callable] = None,
+              iterations: int = 1, **params) -> Callable:
+    """Register a benchmark function"""
+    def decorator(func: Callable) -> Callable:
+        REGISTRY.append(Benchmark(name, func, group, setup, before_each, iterations, params))
+        return func
+    return decorator
+
+
+async def _maybe_await(value: Any) -> Any:
+    return await value if inspect.isawaitable(value) else value
+
+
+def p95(samples: List[float]) -> float:
+    """95th percentile, interpolated between samples so it never falls below the median or above the max"""
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=20, method="inclusive")[-1]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "min": ordered[0],
+        "max": ordered[-1],
+        "mean": statistics.fmean(ordered),
+        "median": statistics.median(ordered),
+        "p95": p95(ordered),
+        "stdev": statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+        "ops_per_sec": 1.0 / statistics.fmean(ordered) if statistics.fmean(ordered) > 0 else float("inf"),
+    }
+
+
+async def run_benchmark(bench: Benchmark, rounds: int, warmup: int) -> Dict[str, Any]:
+    """Time one benchmark: `rounds` measured rounds of `iterations` calls each, after warm-up"""
+    result: Dict[str, Any] = {"name": bench.name, "group": bench.group, "params": bench.params}
+    try:
+        context = await _maybe_await(bench.setup()) if bench.setup else None
+    except SkipBenchmark as e:
+        result.update(status="skipped", reason=str(e))
+        return result
+
+    samples: List[float] = []
+    for round_index in range(warmup + rounds):
+        elapsed = 0.0
+        for _ in range(bench.iterations):
+            args = await _maybe_await(bench.before_each(context)) if bench.before_each else ()
+            start = time.perf_counter()
+            await _maybe_await(bench.func(context, *args))
+            elapsed += time.perf_counter() - start
+        if round_index >= warmup:
+            samples.append(elapsed / bench.iterations)
+
+    result.update(status="ok", rounds=rounds, iterations=bench.iterations, seconds=summarize(samples))
+    return result
+
+
+def environment() -> Dict[str, Any]:
+    """Describe the machine and revision so results from different runs can be compared"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Return one line per benchmark present in both runs with the relative change in median"""
+    old = {r["name"]: r for r in baseline.get("results", []) if r.get("status") == "ok"}
+    lines = []
+    for entry in current["results"]:
+        previous = old.get(entry["name"])
+        if entry.get("status") != "ok" or previous is None:
+            continue
+        before, after = previous["seconds"]["median"], entry["seconds"]["median"]
+        change = (after - before) / before * 100 if before else 0.0
+        lines.append(f"{entry['name']:<40} {before * 1000:10.3f}ms -> {after * 1000:10.3f}ms  {change:+7.1f}%")
+    return lines
+
+
+def run_all(selected: List[Benchmark], rounds: int, warmup: int) -> Dict[str, Any]:
+    loop = asyncio.get_event_loop()
+    results = []
+    for bench in selected:
+        print(f"  {bench.name} ...", end="", flush=True)
+        entry = loop.run_until_complete(run_benchmark(bench, rounds, warmup))
+        if entry["status"] == "ok":
+            print(f" median {entry['seconds']['median'] * 1000:.3f}ms")
+        else:
+            print(f" skipped ({entry['reason']})")
+        results.append(entry)
+    return {"environment": environment(), "results": results}
+
+
+def write_results(report: Dict[str, Any], path: str) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
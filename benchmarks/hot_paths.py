@@ -0,0 +1,221 @@
+import io
+import os
+import tempfile
+from types import SimpleNamespace
+
+from harness import SkipBenchmark, benchmark
+from stubs import FakeContext, FakeMessage, fake_fetch_user, fake_sink, load_wav_float32, synth_speech_pcm
+
+_bot = None
+
+
+def get_bot():
+    """Build one offline Lucia instance shared by the benchmarks (never logs in)"""
+    global _bot
+    if _bot is None:
+        from lucia import Lucia
+        _bot = Lucia()
+        _bot.fetch_user = fake_fetch_user
+    return _bot
+
+
+LONG_REPLY = "lorem ipsum dolor sit amet " * 450  # ~12 KB, seven Discord messages
+SHORT_REPLY = "lorem ipsum dolor sit amet " * 20
+
+
+# LLM ------------------------------------------------------------------------
+
+def _worker():
+    from utils.service.Ollama_worker import OllamaWorker
+    return OllamaWorker()
+
+
+@benchmark("ollama.generate", "llm", setup=_worker, iterations=10, reply_words=200)
+def ollama_generate(worker):
+    text, tokens = worker.generate("Say something", max_tokens=200)
+    assert tokens == 200, text
+
+
+@benchmark("reply.chunk_short", "llm", iterations=1000, chars=len(SHORT_REPLY))
+def chunk_short(_):
+    from lucia import chunk_reply
+    chunk_reply(SHORT_REPLY)
+
+
+@benchmark("reply.chunk_long", "llm", iterations=1000, chars=len(LONG_REPLY))
+def chunk_long(_):
+    from lucia import chunk_reply
+    chunk_reply(LONG_REPLY)
+
+
+def _classified_mention():
+    from utils.service.message_dispatcher import ClassifiedMessage, MessageKind
+    message = FakeMessage("<@1> tell me a story")
+    return (ClassifiedMessage(message, MessageKind.MENTION, "tell me a story", [], MessageKind.MENTION),)
+
+
+@benchmark("reply.pipeline", "llm", setup=get_bot, before_each=lambda _: _classified_mention(), iterations=5)
+async def reply_pipeline(bot, classified):
+    await bot._reply_with_llm(classified)
+    assert classified.message.channel.sent
+
+
+# TTS bytes ------------------------------------------------------------------
+
+TTS_CHUNKS = [os.urandom(4096) for _ in range(64)]  # ~256 KB, roughly 40 s of 48 kbit/s MP3
+
+
+@benchmark("tts.collect_in_memory", "tts", iterations=200, chunk_bytes=4096, chunks=len(TTS_CHUNKS))
+def tts_collect(_):
+    audio = bytearray()
+    for chunk in TTS_CHUNKS:
+        audio.extend(chunk)
+    io.BytesIO(bytes(audio)).read()
+
+
+@benchmark("tts.temp_file_roundtrip", "tts", iterations=50, chunk_bytes=4096, chunks=len(TTS_CHUNKS))
+def tts_temp_file(_):
+    with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as temp_file:
+        for chunk in TTS_CHUNKS:
+            temp_file.write(chunk)
+        path = temp_file.name
+    try:
+        with open(path, "rb") as f:
+            f.read()
+    finally:
+        os.unlink(path)
+
+
+# Music queue ----------------------------------------------------------------
+
+QUEUE_LENGTH = 500
+GUILD_ID = 1  # FakeContext's guild; not connected to voice, so nothing starts playing
+
+
+def _music():
+    cog = get_bot().get_cog("MusicCog")
+    cog._music(GUILD_ID).playlist[:] = [f"https://www.youtube.com/watch?v={i:011d}" for i in range(QUEUE_LENGTH)]
+    return cog
+
+
+def _reset_queue(cog):
+    del cog._music(GUILD_ID).playlist[QUEUE_LENGTH:]
+    return (FakeContext(guild_id=GUILD_ID),)
+
+
+@benchmark("music.addsong", "music", setup=_music, before_each=_reset_queue, iterations=200, queue=QUEUE_LENGTH)
+async def music_addsong(cog, ctx):
+    await cog.addsong.callback(cog, ctx, "https://www.youtube.com/watch?v=dQw4w9WgXcQ")
+
+
+@benchmark("music.show_playlist", "music", setup=_music, before_each=_reset_queue, iterations=200, queue=QUEUE_LENGTH)
+async def music_show_playlist(cog, ctx):
+    await cog.show_playlist.callback(cog, ctx)
+
+
+@benchmark("music.save_queue", "music", setup=_music, iterations=200, queue=QUEUE_LENGTH)
+def music_save_queue(cog):
+    cog._save_queue(GUILD_ID)
+
+
+# Recording callbacks ----------------------------------------------------------
+
+RECORD_USERS = 4
+RECORD_PCM = synth_speech_pcm(1.0, rate=48000) * 5  # 5 s per user
+
+
+def _record_setup():
+    os.chdir(tempfile.mkdtemp(prefix="lucia-bench-"))  # _record_callback writes into ./recordings
+    return get_bot()
+
+
+def _sink_and_ctx(_):
+    return fake_sink({1000 + i: RECORD_PCM for i in range(RECORD_USERS)}), FakeContext()
+
+
+@benchmark("recording.record_callback", "recording", setup=_record_setup, before_each=_sink_and_ctx,
+           iterations=5, users=RECORD_USERS, seconds_per_user=5)
+async def record_callback(bot, sink, ctx):
+    await bot.get_cog("MusicCog")._record_callback(sink, ctx)
+
+
+def _live_setup():
+    bot = _record_setup()
+    cog = bot.get_cog("SpeechToTextCog")
+
+    async def transcribe_stub(audio, guild_id=None, user_id=None):
+        return "hello there"
+
+    cog._transcribe = transcribe_stub  # Measure the callback's own overhead, not the model
+    return cog
+
+
+RECORD_FRAME = 3840  # 20 ms of 48 kHz stereo, as the decoder hands it to a sink
+RECORD_STEREO = b"".join(RECORD_PCM[i:i + 2] * 2 for i in range(0, len(RECORD_PCM), 2))
+
+
+async def _streaming_sink_and_ctx(cog):
+    ctx = FakeContext()
+    voice_channel = SimpleNamespace(id=10, guild=ctx.guild)
+    return cog._streaming_sink(voice_channel, ctx.channel), ctx
+
+
+@benchmark("recording.live_transcription_stream", "recording", setup=_live_setup, before_each=_streaming_sink_and_ctx,
+           iterations=5, users=RECORD_USERS, seconds_per_user=5)
+async def live_transcription_stream(cog, sink, ctx):
+    # Segment every user's speech with the VAD, then caption the utterances
+    for offset in range(0, len(RECORD_STEREO), RECORD_FRAME):
+        for user_id in range(1000, 1000 + RECORD_USERS):
+            sink.write(RECORD_STEREO[offset:offset + RECORD_FRAME], user_id)
+    await cog._live_transcription_callback(sink, ctx)
+    assert len(ctx.channel.sent) == RECORD_USERS, ctx.channel.sent
+
+
+# Whisper ----------------------------------------------------------------------
+
+def register_whisper(clips, model_name: str) -> None:
+    """Register one transcription benchmark per fixture clip"""
+    models = {}
+
+    def load():
+        if model_name not in models:
+            try:
+                import whisper
+                download_root = os.path.join(os.path.expanduser("~"), ".cache", "whisper")
+                if not os.path.exists(os.path.join(download_root, f"{model_name}.pt")):
+                    raise SkipBenchmark(f"Whisper '{model_name}' weights not cached")
+                models[model_name] = whisper.load_model(model_name, device="cpu")
+            except ImportError as e:
+                raise SkipBenchmark(f"whisper not installed: {e}")
+        return models[model_name]
+
+    for path in clips:
+        def setup(path=path):
+            audio = load_wav_float32(path)
+            if audio is None:
+                raise SkipBenchmark(f"{os.path.basename(path)} is not 16 kHz mono 16-bit")
+            return load(), audio
+
+        def transcribe(context):
+            model, audio = context
+            model.transcribe(audio, fp16=False, language="en")
+
+        name = os.path.splitext(os.path.basename(path))[0]
+        benchmark(f"whisper.{model_name}.{name}", "whisper", setup=setup, model=model_name, clip=os.path.basename(path))(transcribe)
+
+    # The same clips decoded as one padded batch, for throughput per clip against the sequential runs
+    def batch_setup():
+        from utils.service.whisper_models import BATCH_SAMPLES
+        audios = [load_wav_float32(path) for path in clips]
+        audios = [audio[:BATCH_SAMPLES] for audio in audios if audio is not None]
+        if not audios:
+            raise SkipBenchmark("no 16 kHz mono 16-bit fixture clips")
+        return load(), audios
+
+    for size in (1, 4, 8):
+        def transcribe_batch(context, size=size):
+            from utils.service.whisper_models import decode_batch
+            model, audios = context
+            decode_batch(model, [audios[i % len(audios)] for i in range(size)], fp16=False, language="en")
+
+        benchmark(f"whisper.{model_name}.batch{size}", "whisper", setup=batch_setup, model=model_name, clips=size)(transcribe_batch)
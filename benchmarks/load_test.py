@@ -0,0 +1,301 @@
+"""
+Multi-guild load test against a simulated Discord.
+
+    python benchmarks/load_test.py --guilds 200 --duration 60
+    python benchmarks/load_test.py --guilds 50 --voice-guilds 20 --transcriber whisper
+
+Every guild gets chat mentions and slash commands (music queue, settings) at Poisson
+rates. Some guilds also run live-transcription sessions fed with synthetic PCM, or voice
+AI that answers mentions with speech on a fake voice client. The report gives
+end-to-end latency per operation, CPU and memory per guild, and the bot's own metrics,
+and is written as JSON.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import statistics
+import struct
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, HERE)
+
+from fake_discord import FakeGateway, FakeVoiceClient, LatencyTracker, invoke, stub_ffmpeg, stub_tts  # noqa: E402
+from harness import environment, p95, write_results  # noqa: E402
+from stubs import StubOllamaServer  # noqa: E402
+
+
+def speech_frame() -> bytes:
+    """One 20 ms frame of 48 kHz stereo tone, standing in for a user speaking"""
+    samples = []
+    for n in range(960):
+        value = int(8000 * math.sin(2 * math.pi * 180 * n / 48000))
+        samples += [value, value]
+    return struct.pack(f"<{len(samples)}h", *samples)
+
+
+def burn_cpu(seconds: float) -> str:
+    """Spin for a while on the heavy pool, like a model transcribing"""
+    deadline = time.thread_time() + seconds
+    while time.thread_time() < deadline:
+        pass
+    return "this is a simulated transcription"
+
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.tracker = LatencyTracker()
+        self.cpu_by_guild = {}
+        self.deadline = 0.0
+
+    def build(self) -> None:
+        from lucia import Lucia
+        from utils.service.resource_manager import process_rss_bytes
+
+        self.rss = process_rss_bytes
+        self.rss_start = process_rss_bytes()
+        self.bot = Lucia()
+        self.rss_bot = process_rss_bytes()
+        self.gateway = FakeGateway(self.bot, self.tracker)
+        self.gateway.connect()
+        self._stub_engines()
+        for _ in range(self.args.guilds):
+            self.gateway.add_guild(members=self.args.members, in_voice=max(self.args.speakers, 1))
+        self.rss_guilds = process_rss_bytes()
+
+    def _stub_engines(self) -> None:
+        """Stand in for network TTS, model weights and FFmpeg where the run asks for it"""
+        bot, args = self.bot, self.args
+        stub_tts(bot, args.tts_ms / 1000)
+        if args.stub_ffmpeg:
+            stub_ffmpeg(bot, clip_seconds=args.clip_seconds)
+        if args.transcriber == "stub":
+            stt = bot.get_cog("SpeechToTextCog")
+
+            async def transcribe(audio, guild_id=None, user_id=None):
+                return await bot.transcription.run(
+                    "whisper", burn_cpu, args.transcribe_ms / 1000, guild_id=guild_id, user_id=user_id
+                )
+
+            stt._transcribe = transcribe
+
+    def spawn(self, coro, name: str, guild_id: int) -> None:
+        """Run one simulated operation, charging its event-loop CPU time to the guild"""
+        supervisor = self.bot.task_supervisor
+        task = supervisor.spawn(coro, name, owner="loadtest", guild_id=guild_id)
+        record = next(r for r in supervisor.tasks("loadtest", guild_id) if r.task is task)
+        task.add_done_callback(
+            lambda _: self.cpu_by_guild.__setitem__(guild_id, self.cpu_by_guild.get(guild_id, 0.0) + record.cpu_time)
+        )
+
+    async def _arrivals(self, rate_per_minute: float):
+        """Yield at Poisson arrival times until the run ends"""
+        if rate_per_minute <= 0:
+            return
+        while True:
+            # Never sleep past the end of the run, or short runs overshoot by minutes
+            await asyncio.sleep(min(self.random.expovariate(rate_per_minute / 60), max(0.0, self.deadline - time.perf_counter())))
+            if time.perf_counter() >= self.deadline:
+                return
+            yield
+
+    async def chat(self, fake) -> None:
+        async for _ in self._arrivals(self.args.chat_rate):
+            message = self.gateway.mention(fake, self.random.randrange(len(fake.member_ids)), "what should I listen to?")
+            self.tracker.expect_text(fake.text_channel.id, "chat.first_reply", fake.id)
+            self.spawn(self.bot.on_message(message), "mention", fake.id)
+
+    async def commands(self, fake) -> None:
+        choices = [
+            ("addsong", {"song": "https://www.youtube.com/watch?v=dQw4w9WgXcQ"}),
+            ("playlist", {}),
+            ("volume", {"level": 7}),
+            ("transcribe_status", {}),
+            ("voice_ai_status", {}),
+        ]
+        async for _ in self._arrivals(self.args.command_rate):
+            name, options = self.random.choice(choices)
+            self.spawn(invoke(self.bot, fake, name, self.tracker, **options), name, fake.id)
+
+    async def voice_transcription(self, fake) -> None:
+        """Repeated live-transcription sessions: talk for a while, stop, wait for transcripts"""
+        frame = speech_frame()
+        speakers = fake.member_ids[:self.args.speakers]
+        voice = FakeVoiceClient(self.bot, fake, self.tracker).attach()
+        while time.perf_counter() < self.deadline:
+            await invoke(self.bot, fake, "transcribe_live", self.tracker)
+            spoken = 0.0
+            while spoken < self.args.utterance and time.perf_counter() < self.deadline:
+                await asyncio.sleep(0.1)
+                voice.feed(speakers, 5, frame)
+                spoken += 0.1
+            self.tracker.expect_text(fake.text_channel.id, "stt.transcript", fake.id, count=len(speakers))
+            await invoke(self.bot, fake, "transcribe_stop", self.tracker)
+            await asyncio.sleep(self.random.uniform(0.5, 2.0))
+
+    async def voice_ai(self, fake) -> None:
+        """Mentions in a voice-AI guild: answered in text, then spoken on the fake voice client"""
+        FakeVoiceClient(self.bot, fake, self.tracker).attach()
+        await invoke(self.bot, fake, "voice_ai", self.tracker)
+        async for _ in self._arrivals(self.args.chat_rate):
+            message = self.gateway.mention(fake, 0, "tell me a joke")
+            self.tracker.expect_text(fake.text_channel.id, "voice_ai.text_reply", fake.id)
+            self.tracker.expect_audio(fake.id, "voice_ai.first_audio")
+            self.spawn(self.bot.on_message(message), "voice_mention", fake.id)
+
+    async def run(self) -> dict:
+        args = self.args
+        guilds = self.gateway.guilds
+        voice_guilds = guilds[:args.voice_guilds]
+        ai_guilds = guilds[args.voice_guilds:args.voice_guilds + args.voice_ai_guilds]
+
+        # The bot starts its degradation controller on ready, which the simulated gateway never fires
+        controller = self.bot.task_supervisor.spawn(self.bot.degradation.run(), "controller", owner="degradation")
+
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        self.deadline = wall_start + args.duration
+        drivers = []
+        for fake in guilds:
+            if fake not in ai_guilds:
+                drivers.append(self.chat(fake))
+            drivers.append(self.commands(fake))
+        drivers += [self.voice_transcription(fake) for fake in voice_guilds]
+        drivers += [self.voice_ai(fake) for fake in ai_guilds]
+        await asyncio.gather(*drivers)
+
+        # Let in-flight work finish, bounded so a stuck pipeline shows up as unanswered
+        grace = time.perf_counter() + args.drain
+        while self.bot.task_supervisor.tasks("loadtest") and time.perf_counter() < grace:
+            await asyncio.sleep(0.1)
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        controller.cancel()
+        return self.report(wall, cpu)
+
+    def report(self, wall: float, cpu: float) -> dict:
+        args = self.args
+        guild_count = len(self.gateway.guilds)
+        operations = {}
+        for op, per_guild in sorted(self.tracker.samples.items()):
+            values = sorted(v for samples in per_guild.values() for v in samples)
+            guild_p95 = sorted(p95(s) for s in per_guild.values())
+            operations[op] = {
+                "count": len(values),
+                "guilds": len(per_guild),
+                "p50_ms": statistics.median(values) * 1000,
+                "p95_ms": p95(values) * 1000,
+                "max_ms": values[-1] * 1000,
+                "worst_guild_p95_ms": guild_p95[-1] * 1000,
+                "errors": self.tracker.errors.get(op, 0),
+            }
+        loop_cpu = sorted(self.cpu_by_guild.values())
+        rss_end = self.rss()
+        footprint = self.bot.cache_profile.footprint(self.bot)
+        savings = self.bot.cache_profile.savings(self.bot)
+        return {
+            "environment": environment(),
+            "config": vars(args),
+            "wall_seconds": wall,
+            "cpu": {
+                "process_seconds": cpu,
+                "process_utilisation": cpu / wall if wall else 0.0,
+                "per_guild_ms_per_second": cpu / guild_count / wall * 1000 if guild_count and wall else 0.0,
+                "loop_per_guild_ms": {
+                    "median": statistics.median(loop_cpu) * 1000 if loop_cpu else 0.0,
+                    "max": loop_cpu[-1] * 1000 if loop_cpu else 0.0,
+                },
+            },
+            "memory": {
+                "rss_start_mb": self.rss_start / 1048576,
+                "rss_bot_mb": self.rss_bot / 1048576,
+                "rss_after_guilds_mb": self.rss_guilds / 1048576,
+                "rss_end_mb": rss_end / 1048576,
+                "per_guild_cached_kb": (self.rss_guilds - self.rss_bot) / guild_count / 1024 if guild_count else 0.0,
+                "per_guild_under_load_kb": (rss_end - self.rss_bot) / guild_count / 1024 if guild_count else 0.0,
+                "low_memory_mode": self.bot.cache_profile.low_memory,
+                "discord_cache_per_guild_kb": sum(size for _, _, size in footprint.values()) / guild_count / 1024 if guild_count else 0.0,
+                "estimated_saving_per_guild_kb": sum(savings.values()) / guild_count / 1024 if guild_count and savings else 0.0,
+            },
+            "operations": operations,
+            "unanswered": self.tracker.unanswered(),
+            "degradation": {"final_level": self.bot.degradation.level, "transitions": self.bot.degradation.transitions},
+            "rest_calls": self.gateway.http.calls,
+            "bot_metrics": self.bot.metrics.snapshot(),
+        }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load-test Lucia against a simulated multi-guild Discord")
+    parser.add_argument("--guilds", type=int, default=100)
+    parser.add_argument("--members", type=int, default=20, help="Members per guild")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of load")
+    parser.add_argument("--drain", type=float, default=15.0, help="Seconds to wait for in-flight work afterwards")
+    parser.add_argument("--chat-rate", type=float, default=2.0, help="Mentions per guild per minute")
+    parser.add_argument("--command-rate", type=float, default=2.0, help="Slash commands per guild per minute")
+    parser.add_argument("--voice-guilds", type=int, default=10, help="Guilds running live transcription")
+    parser.add_argument("--voice-ai-guilds", type=int, default=5, help="Guilds with voice AI answering mentions")
+    parser.add_argument("--speakers", type=int, default=2, help="Members talking in each voice session")
+    parser.add_argument("--utterance", type=float, default=3.0, help="Seconds of speech per transcription session")
+    parser.add_argument("--transcriber", choices=["stub", "whisper"], default="stub",
+                        help="stub burns --transcribe-ms of CPU on the Whisper pool instead of loading a model")
+    parser.add_argument("--transcribe-ms", type=float, default=300.0)
+    parser.add_argument("--tts-ms", type=float, default=150.0, help="Simulated TTS synthesis latency")
+    parser.add_argument("--clip-seconds", type=float, default=3.0, help="Length of spoken replies when FFmpeg is stubbed")
+    parser.add_argument("--stub-ffmpeg", action="store_true", help="Play silent PCM instead of spawning FFmpeg")
+    parser.add_argument("--llm-words", type=int, default=120, help="Words in each stub Ollama reply")
+    parser.add_argument("--low-memory", action="store_true", help="Run the bot with LOW_MEMORY_MODE=true")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/load-<timestamp>.json)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    server = StubOllamaServer(reply_words=args.llm_words).start()
+    os.environ["OLLAMA_URL"] = server.url
+    scratch = tempfile.mkdtemp(prefix="lucia-load-")
+    os.environ.setdefault("STATE_DB_PATH", os.path.join(scratch, "state.db"))
+    os.environ.setdefault("TRANSCRIPT_CACHE_PATH", os.path.join(scratch, "transcripts.db"))
+    os.environ["LOW_MEMORY_MODE"] = "true" if args.low_memory else "false"
+    if not args.stub_ffmpeg and not any(
+        os.access(os.path.join(p, "ffmpeg"), os.X_OK) for p in os.environ.get("PATH", "").split(os.pathsep)
+    ):
+        print("FFmpeg not found; playing silent PCM instead (--stub-ffmpeg)")
+        args.stub_ffmpeg = True
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    test = LoadTest(args)
+    test.build()
+    print(f"Simulating {args.guilds} guilds for {args.duration:g}s "
+          f"({args.voice_guilds} transcribing, {args.voice_ai_guilds} with voice AI)")
+    try:
+        report = loop.run_until_complete(test.run())
+    finally:
+        server.stop()
+
+    output = args.output or os.path.join(HERE, "results", time.strftime("load-%Y%m%d-%H%M%S") + ".json")
+    write_results(report, output)
+    for op, stats in report["operations"].items():
+        print(f"{op:<28} n={stats['count']:<6} p50={stats['p50_ms']:8.1f}ms p95={stats['p95_ms']:8.1f}ms "
+              f"worst guild p95={stats['worst_guild_p95_ms']:8.1f}ms errors={stats['errors']}")
+    print(f"CPU {report['cpu']['process_utilisation'] * 100:.0f}% of one core, "
+          f"{report['cpu']['per_guild_ms_per_second']:.2f} ms/s per guild; "
+          f"RSS {report['memory']['per_guild_cached_kb']:.1f} KiB per cached guild "
+          f"({report['memory']['discord_cache_per_guild_kb']:.1f} KiB in discord caches); "
+          f"{report['unanswered']} unanswered")
+    degradation = report["degradation"]
+    print(f"Degradation: {degradation['transitions']} transitions, ended at level {degradation['final_level']}")
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
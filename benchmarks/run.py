@@ -0,0 +1,76 @@
+"""
+Offline benchmarks for Lucia's hot paths.
+
+    python benchmarks/run.py                       # run everything, write benchmarks/results/<time>.json
+    python benchmarks/run.py -k music -k reply     # only benchmarks whose name contains a filter
+    python benchmarks/run.py --compare old.json    # print median changes against an earlier run
+
+Ollama is replaced by a local stub server and Discord by fake contexts, so no network,
+token or voice connection is needed. Whisper benchmarks use the WAVs in --fixtures
+(16 kHz mono) and generate synthetic clips there if none exist.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, HERE)
+
+from harness import REGISTRY, compare, run_all, write_results  # noqa: E402
+from stubs import StubOllamaServer, ensure_fixture_clips  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run Lucia's offline microbenchmarks")
+    parser.add_argument("-k", "--filter", action="append", default=[], help="Only run benchmarks whose name contains this")
+    parser.add_argument("--rounds", type=int, default=5, help="Measured rounds per benchmark")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured warm-up rounds")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    parser.add_argument("--fixtures", default=os.path.join(HERE, "fixtures"), help="Directory of WAV clips for Whisper")
+    parser.add_argument("--whisper-model", default="tiny", help="Whisper model to benchmark (must already be downloaded)")
+    parser.add_argument("--list", action="store_true", help="List benchmarks and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    server = StubOllamaServer().start()
+    os.environ["OLLAMA_URL"] = server.url
+    os.environ.setdefault("STATE_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="lucia-bench-"), "state.db"))
+    asyncio.set_event_loop(asyncio.new_event_loop())
+
+    import hot_paths
+    hot_paths.register_whisper(ensure_fixture_clips(args.fixtures), args.whisper_model)
+
+    selected = [b for b in REGISTRY if not args.filter or any(f in b.name for f in args.filter)]
+    if args.list:
+        for bench in selected:
+            print(f"{bench.group:<10} {bench.name}")
+        return 0
+
+    print(f"Running {len(selected)} benchmark(s), {args.rounds} rounds each")
+    try:
+        report = run_all(selected, args.rounds, args.warmup)
+    finally:
+        server.stop()
+
+    output = args.output or os.path.join(HERE, "results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    write_results(report, output)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nMedian change vs {args.compare}:")
+        for line in compare(report, baseline):
+            print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
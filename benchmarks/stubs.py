@@ -0,0 +1,161 @@
+import io
+import json
+import math
+import os
+import struct
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+
+class _OllamaHandler(BaseHTTPRequestHandler):
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        words = payload.get("options", {}).get("num_predict") or server.reply_words
+        body = json.dumps({
+            "model": payload.get("model"),
+            "response": " ".join(["lorem"] * words),
+            "done": True,
+            "eval_count": words,
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+class StubOllamaServer:
+    '''Local HTTP server answering /api/generate like Ollama, with a fixed-size reply after a fixed delay'''
+
+    def __init__(self, reply_words: int = 200, latency: float = 0.0) -> None:
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _OllamaHandler)
+        self.httpd.reply_words = reply_words
+        self.httpd.latency = latency  # Seconds of simulated generation per request
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="stub-ollama", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubOllamaServer":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FakeChannel:
+    '''Text channel that records what would have been sent'''
+
+    def __init__(self) -> None:
+        self.sent: List[str] = []
+
+    async def send(self, content: str = None, **kwargs) -> None:
+        self.sent.append(content)
+
+    def typing(self) -> "FakeChannel":
+        return self
+
+    async def __aenter__(self) -> None:
+        return None
+
+    async def __aexit__(self, *exc) -> None:
+        return None
+
+
+class FakeMessage:
+    def __init__(self, content: str, guild_id: int = 1, author_id: int = 100) -> None:
+        self.id = 1
+        self.content = content
+        self.guild = SimpleNamespace(id=guild_id)
+        self.author = SimpleNamespace(id=author_id, bot=False, display_name=f"user{author_id}")
+        self.channel = FakeChannel()
+        self.attachments = []
+        self.mentions = []
+        self.reference = None
+
+    async def reply(self, content: str = None, **kwargs) -> None:
+        self.channel.sent.append(content)
+
+
+class FakeContext:
+    '''Just enough of an ApplicationContext for cog command callbacks'''
+
+    def __init__(self, guild_id: int = 1, author_id: int = 100) -> None:
+        self.guild = SimpleNamespace(id=guild_id)
+        self.author = SimpleNamespace(id=author_id, voice=None, display_name=f"user{author_id}")
+        self.channel = FakeChannel()
+        self.responses: List[str] = []
+
+    async def respond(self, content: str = None, **kwargs) -> None:
+        self.responses.append(content)
+
+    async def send(self, content: str = None, **kwargs) -> None:
+        self.channel.sent.append(content)
+
+
+def fake_sink(users: Dict[int, bytes]) -> SimpleNamespace:
+    """A recording sink whose per-user audio is already captured, as pycord hands it to callbacks"""
+    return SimpleNamespace(audio_data={user_id: SimpleNamespace(file=io.BytesIO(data)) for user_id, data in users.items()})
+
+
+async def fake_fetch_user(user_id: int) -> SimpleNamespace:
+    return SimpleNamespace(id=user_id, display_name=f"user{user_id}")
+
+
+def synth_speech_pcm(seconds: float, rate: int = 16000, seed: int = 0) -> bytes:
+    """Deterministic speech-like 16-bit mono PCM: gliding harmonics with a syllable envelope"""
+    samples = []
+    base = 120 + 15 * seed
+    for n in range(int(seconds * rate)):
+        t = n / rate
+        pitch = base * (1 + 0.1 * math.sin(2 * math.pi * 0.7 * t))
+        envelope = max(0.0, math.sin(2 * math.pi * 3 * t)) ** 0.5
+        value = sum(math.sin(2 * math.pi * pitch * k * t) / k for k in (1, 2, 3))
+        samples.append(int(9000 * envelope * value / 1.8))
+    return struct.pack(f"<{len(samples)}h", *samples)
+
+
+def write_wav(path: str, pcm: bytes, rate: int = 16000, channels: int = 1) -> None:
+    with wave.open(path, "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(pcm)
+
+
+def ensure_fixture_clips(directory: str, durations=(2.0, 5.0, 10.0)) -> List[str]:
+    """Return the fixture WAVs in a directory, generating synthetic ones if there are none"""
+    os.makedirs(directory, exist_ok=True)
+    clips = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".wav"))
+    if clips:
+        return clips
+    for index, seconds in enumerate(durations):
+        path = os.path.join(directory, f"synthetic_{seconds:g}s.wav")
+        write_wav(path, synth_speech_pcm(seconds, seed=index))
+        clips.append(path)
+    return clips
+
+
+def load_wav_float32(path: str) -> Optional["object"]:
+    """Read a 16 kHz mono 16-bit WAV into the float32 array Whisper expects (no FFmpeg needed)"""
+    import numpy as np
+    with wave.open(path, "rb") as f:
+        if f.getframerate() != 16000 or f.getnchannels() != 1 or f.getsampwidth() != 2:
+            return None
+        data = f.readframes(f.getnframes())
+    return np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
@@ -0,0 +1,211 @@
+"""
+End-to-end voice-turn latency: from a user finishing a sentence to Lucia starting to speak.
+
+    python benchmarks/voice_turn.py                               # offline: simulated Whisper, stub Ollama and TTS
+    python benchmarks/voice_turn.py --ollama-url http://localhost:11434 --tts edge
+    python benchmarks/voice_turn.py --stt whisper --whisper-model base
+
+Each fixture clip is replayed as a finished utterance. It goes through
+VoiceInteractionCog's transcription, then the voice AI pipeline: the LLM reply
+(`generate_reply`), the text post, TTS in RVCVoiceEnhancedCog (falling back to
+SimpleVoiceCog), and the FFmpeg clip player. Playback is on a fake voice client,
+whose first 20 ms frame marks time-to-first-audio. Per-stage and total times are
+written as JSON for trend tracking.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, HERE)
+
+from fake_discord import FakeGateway, FakeVoiceClient, LatencyTracker, SimulatedWhisper, stub_ffmpeg, stub_tts  # noqa: E402
+from harness import environment, p95, write_results  # noqa: E402
+from stubs import StubOllamaServer, ensure_fixture_clips  # noqa: E402
+
+STAGES = ["stt", "llm", "post_text", "tts", "playback_start"]
+
+
+class Timeline:
+    '''Start and end times of each stage of the current turn'''
+
+    def __init__(self) -> None:
+        self.start = 0.0
+        self.marks: Dict[str, List[float]] = {}
+
+    def reset(self) -> None:
+        self.start = time.perf_counter()
+        self.marks = {}
+
+    def instrument(self, obj, attr: str, stage: str) -> None:
+        """Wrap an async method so each call records when the stage began and ended"""
+        original = getattr(obj, attr)
+
+        async def timed(*args, **kwargs):
+            began = time.perf_counter()
+            try:
+                return await original(*args, **kwargs)
+            finally:
+                self.marks.setdefault(stage, [began, 0.0])[1] = time.perf_counter()
+
+        setattr(obj, attr, timed)
+
+    def stages(self, first_audio: float) -> Dict[str, float]:
+        """Split time-to-first-audio into consecutive stages"""
+        stt, llm, tts = self.marks.get("stt"), self.marks.get("llm"), self.marks.get("tts")
+        result = {}
+        if stt:
+            result["stt"] = stt[1] - stt[0]
+        if llm:
+            result["llm"] = llm[1] - llm[0]
+        if llm and tts:
+            result["post_text"] = tts[0] - llm[1]
+        if tts:
+            result["tts"] = tts[1] - tts[0]
+            result["playback_start"] = first_audio - (tts[1] - self.start)
+        result["time_to_first_audio"] = first_audio
+        return result
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": statistics.median(ordered) * 1000,
+        "p95_ms": p95(ordered) * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+async def run_turns(args: argparse.Namespace, clips: List[str]) -> dict:
+    from lucia import Lucia
+
+    tracker = LatencyTracker()
+    bot = Lucia()
+    gateway = FakeGateway(bot, tracker)
+    gateway.connect()
+    fake = gateway.add_guild(members=5, in_voice=1)
+    voice = FakeVoiceClient(bot, fake, tracker).attach()
+
+    cog = bot.get_cog("VoiceInteractionCog")
+    bot.whisper.default_name, bot.whisper.default_device = args.whisper_model, "cpu"
+    if args.stt == "simulated":
+        bot.whisper.loader = lambda name, device: SimulatedWhisper(rtf=args.stt_rtf)
+    # Each clip is replayed many times: time the transcription, not transcript cache hits
+    bot.transcripts.max_entries, bot.transcripts.path = 0, ""
+    if args.tts == "stub":
+        stub_tts(bot, args.tts_ms / 1000)
+    if args.stub_ffmpeg:
+        stub_ffmpeg(bot, clip_seconds=args.clip_seconds)
+
+    timeline = Timeline()
+    timeline.instrument(cog, "_transcribe_audio", "stt")
+    timeline.instrument(bot, "generate_reply", "llm")
+    timeline.instrument(bot.get_cog("SimpleVoiceCog"), "synthesize", "tts")
+    rvc = bot.get_cog("RVCVoiceEnhancedCog")
+    timeline.instrument(rvc, "_generate_edge_tts", "tts")
+    timeline.instrument(rvc, "_speak_with_rvc_api", "tts")
+
+    turns = []
+    for clip in clips:
+        with open(clip, "rb") as f:
+            audio = f.read()
+        for turn in range(args.warmup + args.turns):
+            message = gateway.mention(fake, 0, "voice turn")
+            timeline.reset()
+            tracker.expect_audio(fake.id, "time_to_first_audio")
+            text = await cog._transcribe_audio(audio, fake.id, fake.member_ids[0])
+            if not text:
+                logging.error(f"Transcription of {clip} returned nothing")
+                tracker.error("stt")
+                continue
+            await cog._process_voice_interaction(message, text)
+            while voice.is_playing():
+                await asyncio.sleep(0.01)
+            samples = tracker.samples.pop("time_to_first_audio", {}).get(fake.id)
+            if not samples:
+                tracker.error("no_audio")
+                tracker._expect_audio.clear()
+                continue
+            if turn >= args.warmup:
+                turns.append(dict(clip=os.path.basename(clip), **timeline.stages(samples[0])))
+
+    aggregate = {}
+    for stage in STAGES + ["time_to_first_audio"]:
+        values = [t[stage] for t in turns if stage in t]
+        if values:
+            aggregate[stage] = summarize(values)
+    per_clip = {}
+    for clip in sorted({t["clip"] for t in turns}):
+        per_clip[clip] = summarize([t["time_to_first_audio"] for t in turns if t["clip"] == clip])
+    return {
+        "environment": environment(),
+        "config": vars(args),
+        "stages": aggregate,
+        "per_clip": per_clip,
+        "turns": turns,
+        "errors": tracker.errors,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure time from end of speech to Lucia's first audio")
+    parser.add_argument("--fixtures", default=os.path.join(HERE, "fixtures"), help="Directory of utterance WAVs")
+    parser.add_argument("--turns", type=int, default=5, help="Measured turns per clip")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured turns per clip")
+    parser.add_argument("--stt", choices=["simulated", "whisper"], default="simulated")
+    parser.add_argument("--stt-rtf", type=float, default=0.15, help="Real-time factor of the simulated transcriber")
+    parser.add_argument("--whisper-model", default="base")
+    parser.add_argument("--ollama-url", help="Use a real Ollama server instead of the stub")
+    parser.add_argument("--llm-ms", type=float, default=800.0, help="Stub Ollama generation time")
+    parser.add_argument("--llm-words", type=int, default=40, help="Words in each stub Ollama reply")
+    parser.add_argument("--tts", choices=["stub", "edge"], default="stub", help="edge uses the real Edge TTS service")
+    parser.add_argument("--tts-ms", type=float, default=250.0, help="Stub TTS synthesis time")
+    parser.add_argument("--clip-seconds", type=float, default=0.5, help="Reply length when FFmpeg is stubbed")
+    parser.add_argument("--stub-ffmpeg", action="store_true", help="Play silent PCM instead of spawning FFmpeg")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/voice-turn-<timestamp>.json)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    server = None
+    if args.ollama_url:
+        os.environ["OLLAMA_URL"] = args.ollama_url
+    else:
+        server = StubOllamaServer(reply_words=args.llm_words, latency=args.llm_ms / 1000).start()
+        os.environ["OLLAMA_URL"] = server.url
+    os.environ.setdefault("STATE_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="lucia-turn-"), "state.db"))
+    if not args.stub_ffmpeg and not any(
+        os.access(os.path.join(p, "ffmpeg"), os.X_OK) for p in os.environ.get("PATH", "").split(os.pathsep)
+    ):
+        print("FFmpeg not found; playing silent PCM instead (--stub-ffmpeg)")
+        args.stub_ffmpeg = True
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    clips = ensure_fixture_clips(args.fixtures)
+    try:
+        report = loop.run_until_complete(run_turns(args, clips))
+    finally:
+        if server:
+            server.stop()
+
+    output = args.output or os.path.join(HERE, "results", time.strftime("voice-turn-%Y%m%d-%H%M%S") + ".json")
+    write_results(report, output)
+    for stage, stats in report["stages"].items():
+        print(f"{stage:<20} p50={stats['p50_ms']:8.1f}ms p95={stats['p95_ms']:8.1f}ms max={stats['max_ms']:8.1f}ms")
+    if report["errors"]:
+        print(f"Errors: {report['errors']}")
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
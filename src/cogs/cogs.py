@@ -1,3 +1,6 @@
+class DuplicateCommandError(Exception):
+    '''Raised when two cogs register an application command with the same name'''
+
 def setup_cogs(bot):
     cogs_list = [
         'music',
@@ -7,7 +10,16 @@ def setup_cogs(bot):
         'simple_voice',
         'rvc_voice_enhanced',
         'voice_interaction',
+        'diagnostics',
     ]
 
+    # Discord rejects the whole sync on a duplicate name, so catch it while building the tree
+    owners = {}
     for cog in cogs_list:
+        start = len(bot.pending_application_commands)
         bot.load_extension(f"cogs.{cog}")
+        for command in bot.pending_application_commands[start:]:
+            key = (command.type, command.name, tuple(sorted(command.guild_ids or ())))
+            if key in owners:
+                raise DuplicateCommandError(f"/{command.name} is defined in both cogs.{owners[key]} and cogs.{cog}")
+            owners[key] = cog
@@ -0,0 +1,321 @@
+import discord
+from discord.ext import commands
+import asyncio
+import io
+import logging
+import time
+
+import numpy as np
+
+from cogs.defaults import default_params
+from utils.service.audio_decode import WHISPER_RATE, AudioDecodeError
+from utils.service.cpu_profiler import SamplingProfiler
+from utils.service.memory_profiler import MemoryProfiler
+from utils.service.resource_manager import process_rss_bytes
+from utils.service.stt_engines import cpu_capability
+from utils.service.usage_quota import RESOURCES
+
+class DiagnosticsCog(commands.Cog):
+    '''
+    Owner-only commands for inspecting the running bot
+    '''
+
+    def __init__(self, bot: discord.Bot) -> None:
+        self.bot = bot
+        self.memory_profiler = MemoryProfiler()
+        self.cpu_profiler = SamplingProfiler()
+
+    async def _is_owner(self, ctx) -> bool:
+        '''Return whether the invoking user owns the bot, replying if not'''
+        app_info = await self.bot.application_info()
+        if ctx.author.id != app_info.owner.id:
+            await ctx.respond("You do not have permission to use this command.", ephemeral=True)
+            return False
+        return True
+
+    @staticmethod
+    def _chunk(text: str) -> list:
+        '''Split a long message into Discord-sized chunks on line boundaries'''
+        chunks, current = [], ""
+        for line in text.splitlines(keepends=True):
+            if len(current) + len(line) > 1990:
+                chunks.append(current)
+                current = ""
+            current += line
+        if current:
+            chunks.append(current)
+        return chunks
+
+    async def _respond_long(self, ctx, text: str) -> None:
+        chunks = self._chunk(text)
+        await ctx.respond(chunks[0], ephemeral=True)
+        for chunk in chunks[1:]:
+            await ctx.followup.send(chunk, ephemeral=True)
+
+    @discord.slash_command(name="tasks", description="List live background tasks (owner only)", **default_params)
+    @discord.option("owner", description="Only show tasks of this owner", required=False)
+    @discord.option("cancel", type=bool, description="Cancel the listed tasks", required=False)
+    async def list_tasks(self, ctx, owner: str = None, cancel: bool = False):
+        """List supervised background tasks with their age and CPU time"""
+        try:
+            if not await self._is_owner(ctx):
+                return
+            supervisor = self.bot.task_supervisor
+            records = supervisor.tasks(owner=owner)
+
+            status_msg = f"🧵 **Background Tasks:** {len(records)} live, {supervisor.spawned} spawned\n\n"
+            for record in records:
+                guild = f" guild={record.guild_id}" if record.guild_id else ""
+                status_msg += (
+                    f"• `{record.owner}:{record.name}`{guild} — {record.state}, "
+                    f"age {record.age:.1f}s, cpu {record.cpu_time * 1000:.1f}ms\n"
+                )
+            if supervisor.failures:
+                status_msg += "\n**Recent failures:**\n"
+                for failure in list(supervisor.failures)[-5:]:
+                    status_msg += f"• `{failure['owner']}:{failure['name']}` — {failure['error']}\n"
+            if cancel:
+                cancelled = supervisor.cancel(owner=owner)
+                status_msg += f"\n🛑 Cancelled {cancelled} task(s)."
+
+            await self._respond_long(ctx, status_msg)
+
+        except Exception as e:
+            logging.error(f"Error listing tasks: {e}")
+            await ctx.respond(f"❌ Error listing tasks: {str(e)}", ephemeral=True)
+
+    @discord.slash_command(name="metrics", description="Show runtime metrics (owner only)", **default_params)
+    @discord.option("prefix", description="Only show metrics starting with this prefix", required=False)
+    async def show_metrics(self, ctx, prefix: str = None):
+        """Show counters, gauges and timing summaries"""
+        try:
+            if not await self._is_owner(ctx):
+                return
+            snapshot = self.bot.metrics.snapshot()
+            prefix = prefix or ""
+
+            status_msg = "📈 **Metrics**\n"
+            counters = {k: v for k, v in sorted(snapshot['counters'].items()) if k.startswith(prefix)}
+            gauges = {k: v for k, v in sorted(snapshot['gauges'].items()) if k.startswith(prefix)}
+            timings = {k: v for k, v in sorted(snapshot['timings'].items()) if k.startswith(prefix)}
+            if counters:
+                status_msg += "\n**Counters:**\n" + "".join(f"• `{k}` = {v:g}\n" for k, v in counters.items())
+            if gauges:
+                status_msg += "\n**Gauges:**\n" + "".join(f"• `{k}` = {v}\n" for k, v in gauges.items())
+            if timings:
+                status_msg += "\n**Timings (ms):**\n" + "".join(
+                    f"• `{k}` n={t['count']} avg={t['avg'] * 1000:.1f} p95={t['p95'] * 1000:.1f} max={t['max'] * 1000:.1f}\n"
+                    for k, t in timings.items()
+                )
+            if not (counters or gauges or timings):
+                status_msg += "\nNo metrics recorded yet."
+
+            await self._respond_long(ctx, status_msg)
+
+        except Exception as e:
+            logging.error(f"Error showing metrics: {e}")
+            await ctx.respond(f"❌ Error showing metrics: {str(e)}", ephemeral=True)
+
+    @discord.slash_command(name="memprofile", description="Profile memory with tracemalloc (owner only)", **default_params)
+    @discord.option("action", description="What to do", choices=["start", "snapshot", "diff", "objects", "caches", "stop"])
+    @discord.option("name", description="Snapshot name (snapshot) or older snapshot (diff)", required=False)
+    @discord.option("other", description="Newer snapshot to diff against (default: now)", required=False)
+    @discord.option("top", type=int, min_value=1, max_value=50, description="Number of diff lines", required=False)
+    async def memprofile(self, ctx, action: str, name: str = None, other: str = None, top: int = 15):
+        """Start tracing, take named snapshots, diff them and report per-cog structures"""
+        try:
+            if not await self._is_owner(ctx):
+                return
+            profiler = self.memory_profiler
+            rss = process_rss_bytes()
+            rss_line = f"**RSS:** {rss / 1048576:.1f} MB\n" if rss else ""
+
+            if action == "start":
+                profiler.start()
+                await ctx.respond(f"🧠 **Memory tracing started.**\n{rss_line}Take snapshots with `/memprofile snapshot`.", ephemeral=True)
+            elif action == "stop":
+                profiler.stop()
+                await ctx.respond("🛑 **Memory tracing stopped** and snapshots discarded.", ephemeral=True)
+            elif action == "snapshot":
+                if not profiler.tracing:
+                    await ctx.respond("❌ Tracing is not running. Use `/memprofile start` first.", ephemeral=True)
+                    return
+                await ctx.defer(ephemeral=True)
+                snap_name = await profiler.take_snapshot(name)
+                current, peak = profiler.current()
+                await ctx.followup.send(
+                    f"📸 **Snapshot `{snap_name}` taken.**\n{rss_line}"
+                    f"**Traced:** {current / 1048576:.1f} MB (peak {peak / 1048576:.1f} MB)\n"
+                    f"**Stored:** {', '.join(profiler.snapshots)}",
+                    ephemeral=True
+                )
+            elif action == "diff":
+                if not name or name not in profiler.snapshots:
+                    await ctx.respond(f"❌ Unknown snapshot. Stored: {', '.join(profiler.snapshots) or 'none'}", ephemeral=True)
+                    return
+                await ctx.defer(ephemeral=True)
+                lines = await profiler.diff(name, other, limit=top)
+                status_msg = f"🧠 **Top {top} allocation changes since `{name}`:**\n```\n"
+                status_msg += "\n".join(lines) if lines else "no changes"
+                status_msg += "\n```"
+                await ctx.followup.send(status_msg[:2000], ephemeral=True)
+            elif action == "caches":
+                cache_profile = self.bot.cache_profile
+                footprint = cache_profile.footprint(self.bot)
+                savings = cache_profile.savings(self.bot)
+                mode = "low-memory" if cache_profile.low_memory else "default"
+                status_msg = f"🧠 **Discord caches** ({mode} mode, {len(self.bot.users)} users cached)\n{rss_line}\n"
+                largest = sorted(footprint.items(), key=lambda item: -item[1][2])[:top]
+                for gid, (members, messages, size) in largest:
+                    guild = self.bot.get_guild(gid)
+                    saved = f", ~{savings[gid] / 1024:.1f} KiB saved" if gid in savings else ""
+                    status_msg += f"• **{guild.name if guild else gid}:** {members} members, {messages} messages, {size / 1024:.1f} KiB{saved}\n"
+                if savings:
+                    status_msg += f"\n**Estimated saving:** {sum(savings.values()) / max(len(savings), 1) / 1024:.1f} KiB per guild"
+                await self._respond_long(ctx, status_msg)
+            else:
+                report = profiler.structure_report(self.bot)
+                status_msg = f"🧠 **In-memory structures**\n{rss_line}\n"
+                for cog_name, stats in report.items():
+                    status_msg += f"**{cog_name}:**\n"
+                    for key, (count, size) in stats.items():
+                        status_msg += f"• `{key}`: {count} item(s), {size / 1024:.1f} KiB\n"
+                for key, model in self.bot.whisper.report().items():
+                    status_msg += (
+                        f"• `{key}` loaded in {model['load_seconds']:.1f}s, {model['size_bytes'] / 1048576:.0f} MB, "
+                        f"{model['users']} user(s), {model['inferences']} transcription(s)\n"
+                    )
+                await self._respond_long(ctx, status_msg)
+
+        except Exception as e:
+            logging.error(f"Error in memprofile: {e}")
+            await ctx.respond(f"❌ Memory profiling failed: {str(e)}", ephemeral=True)
+
+    @discord.slash_command(name="cpuprofile", description="Sample where CPU time goes (owner only)", **default_params)
+    @discord.option("seconds", type=int, min_value=1, max_value=120, description="How long to sample", required=False)
+    @discord.option("interval_ms", type=int, min_value=1, max_value=100, description="Sampling interval", required=False)
+    @discord.option("include_idle", type=bool, description="Keep samples of threads blocked in waits", required=False)
+    async def cpuprofile(self, ctx, seconds: int = 10, interval_ms: int = 5, include_idle: bool = False):
+        """Sample all threads and attach collapsed-stack and speedscope files"""
+        try:
+            if not await self._is_owner(ctx):
+                return
+            if self.cpu_profiler.running:
+                await ctx.respond("❌ A profile is already running.", ephemeral=True)
+                return
+            await ctx.defer(ephemeral=True)
+
+            self.cpu_profiler.interval = interval_ms / 1000
+            result = await asyncio.to_thread(self.cpu_profiler.run, seconds)
+
+            busy = sum(result.busy_stacks(include_idle).values())
+            status_msg = (
+                f"🔥 **CPU profile:** {result.duration:.1f}s, {result.samples} samples every {interval_ms}ms, "
+                f"{busy} busy thread samples\n```\n{'self%':>6} {'total%':>6}  function\n"
+            )
+            for label, self_count, total_count in result.top_functions(include_idle=include_idle):
+                status_msg += f"{100 * self_count / max(busy, 1):6.1f} {100 * total_count / max(busy, 1):6.1f}  {label[:80]}\n"
+            status_msg += "```"
+
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            files = [
+                discord.File(io.BytesIO(result.collapsed(include_idle).encode()), filename=f"cpu-{stamp}.collapsed.txt"),
+                discord.File(io.BytesIO(result.speedscope(include_idle).encode()), filename=f"cpu-{stamp}.speedscope.json"),
+            ]
+            await ctx.followup.send(status_msg[:2000], files=files, ephemeral=True)
+
+        except Exception as e:
+            logging.error(f"Error in cpuprofile: {e}")
+            await ctx.respond(f"❌ CPU profiling failed: {str(e)}", ephemeral=True)  # A followup once deferred
+
+    @discord.slash_command(name="usage", description="Show resource usage and quotas per guild (owner only)", **default_params)
+    @discord.option("guild_id", description="Guild to inspect (default: this one, 'all' for every guild)", required=False)
+    async def show_usage(self, ctx, guild_id: str = None):
+        """Show transcription, LLM, TTS and RVC usage with remaining quota"""
+        try:
+            if not await self._is_owner(ctx):
+                return
+            usage = self.bot.usage
+
+            status_msg = "📊 **Resource Usage**\n\n**Quotas per guild/hour:** "
+            status_msg += ", ".join(
+                f"{resource} {limit:g}" if limit > 0 else f"{resource} unlimited"
+                for resource, limit in usage.limits.items()
+            ) + "\n"
+
+            if guild_id == "all":
+                guild_ids = sorted(usage.guild_usage, key=lambda g: -sum(usage.guild_usage[g].values()))[:15]
+            else:
+                guild_ids = [int(guild_id)] if guild_id else [ctx.guild.id if ctx.guild else 0]
+
+            for gid in guild_ids:
+                guild = self.bot.get_guild(gid)
+                status_msg += f"\n**{guild.name if guild else gid}:**\n"
+                totals = usage.guild_usage.get(gid, {})
+                for resource, label in RESOURCES.items():
+                    remaining = usage.remaining(gid, resource)
+                    left = f", {remaining:.0f} left" if remaining is not None else ""
+                    status_msg += f"• {label}: {totals.get(resource, 0):.0f}{left}\n"
+                    top = usage.top_users(gid, resource, limit=3) if len(guild_ids) == 1 else []
+                    if top:
+                        status_msg += "  " + ", ".join(f"<@{user_id}> {amount:.0f}" for user_id, amount in top) + "\n"
+
+            deferred = sum(count for (_, action), count in usage.decisions.items() if action != "allow")
+            status_msg += f"\n**Degraded/deferred decisions:** {deferred}"
+            await self._respond_long(ctx, status_msg)
+
+        except Exception as e:
+            logging.error(f"Error showing usage: {e}")
+            await ctx.respond(f"❌ Error showing usage: {str(e)}", ephemeral=True)
+
+    @staticmethod
+    def _test_clip(seconds: float = 10.0) -> np.ndarray:
+        '''Voiced-sounding harmonics in syllable-length bursts, for timing when no file is given'''
+        t = np.arange(int(seconds * WHISPER_RATE)) / WHISPER_RATE
+        voice = sum(np.sin(2 * np.pi * 140 * k * t) / k for k in range(1, 8))
+        envelope = np.clip(np.sin(2 * np.pi * 2.5 * t), 0, None)
+        return (0.1 * voice * envelope).astype(np.float32)
+
+    @discord.slash_command(name="stt_compare", description="Compare speech-to-text backends on this host (owner only)", **default_params)
+    @discord.option("file", type=discord.Attachment, description="Audio to transcribe (default: a 10s test clip)", required=False)
+    @discord.option("model", description="Whisper model size (default: the configured one)", required=False)
+    async def stt_compare(self, ctx, file: discord.Attachment = None, model: str = None):
+        """Report the real-time factor of every Whisper backend available here"""
+        try:
+            if not await self._is_owner(ctx):
+                return
+            await ctx.defer(ephemeral=True)
+            if file:
+                try:
+                    audio = await self.bot.audio_decoder.decode(await file.read())
+                except AudioDecodeError as e:
+                    await ctx.followup.send(f"❌ Could not read that audio file: {e}", ephemeral=True)
+                    return
+            else:
+                audio = self._test_clip()
+
+            rows = await self.bot.whisper.compare(audio, model)
+            status_msg = (
+                f"🏁 **Speech-to-text backends** on a {cpu_capability()} CPU, "
+                f"{len(audio) / WHISPER_RATE:.1f}s clip (RTF below 1 is faster than real time)\n\n"
+            )
+            for row in rows:
+                if "error" in row:
+                    status_msg += f"• `{row['backend']}` — {row['error']}\n"
+                    continue
+                in_use = " ← in use" if row["default"] else ""
+                status_msg += (
+                    f"• `{row['key']}` — RTF **{row['rtf']:.2f}** (load {row['load_seconds']:.1f}s, "
+                    f"{row['size_bytes'] / 1048576:.0f} MB){in_use}\n"
+                )
+                if file and row["text"]:
+                    status_msg += f"  > {row['text'][:150]}\n"
+            status_msg += "\nSet `WHISPER_BACKEND` to choose one."
+            await ctx.followup.send(status_msg[:2000], ephemeral=True)
+
+        except Exception as e:
+            logging.error(f"Error comparing STT backends: {e}")
+            await ctx.followup.send(f"❌ Backend comparison failed: {str(e)}", ephemeral=True)
+
+def setup(bot: discord.Bot) -> None:
+    bot.add_cog(DiagnosticsCog(bot))
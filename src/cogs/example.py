@@ -21,9 +21,11 @@ class ExampleCog(commands.Cog):
             if user is None:
                 user = ctx.author
                 member = ctx.author if hasattr(ctx, 'author') else None
-            else:
-                # Try to get member object for join date and roles
-                member = ctx.guild.get_member(user.id) if ctx.guild else None
+            elif isinstance(user, discord.Member):
+                member = user
+            elif ctx.guild:
+                # Try to get member object for join date and roles; fetched when not cached (low-memory mode)
+                member = await discord.utils.get_or_fetch(ctx.guild, discord.Member, user.id, default=None)
 
             embed = discord.Embed(
                 title=f"Who is {user.display_name}?",
@@ -8,10 +8,22 @@ import logging
 import time
 
 from cogs.defaults import default_params
+from utils.service.memory_profiler import deep_sizeof, sink_bytes
 
 class NotInVCException(Exception):
     pass
 
+class GuildMusic:
+    '''
+    Queue and playback state of one guild
+    '''
+
+    def __init__(self, playlist: list, volume: float) -> None:
+        self.playlist = playlist  # Song queue
+        self.volume = volume
+        self.current = None  # Entry now playing
+        self.is_playing = False
+
 class MusicCog(commands.Cog):
     '''
     Add music and voice functionality to the bot
@@ -19,28 +31,52 @@ class MusicCog(commands.Cog):
 
     def __init__(self, bot: discord.Bot) -> None:
         self.bot = bot
-        self.vc = None
-        self.volume = 1.0  # Default volume (max)
-        self.playlist = []  # Song queue
-        self.is_playing = False
-        self.recording = False  # Track recording state
-        
-    def _check_connected(self) -> bool:
-        '''Return whether the bot is connected to a voice channel'''
-        return self.vc is not None and self.vc.is_connected()
+        self.guilds = {}  # guild id -> GuildMusic, loaded on first use
+
+    def _music(self, guild_id: int) -> GuildMusic:
+        '''Return a guild's queue; it survives restarts and an interrupted song goes back to the front'''
+        music = self.guilds.get(guild_id)
+        if music is None:
+            saved = self.bot.state
+            playlist = list(saved.get(guild_id, "music", "playlist", []))
+            current = saved.get(guild_id, "music", "current")
+            if current:
+                playlist.insert(0, current)
+            music = self.guilds[guild_id] = GuildMusic(playlist, saved.get(guild_id, "music", "volume", 1.0))
+        return music
+
+    def _save_queue(self, guild_id: int) -> None:
+        '''Queue the playlist and the song now playing for persistence'''
+        music = self._music(guild_id)
+        self.bot.state.set(guild_id, "music", "playlist", list(music.playlist))
+        self.bot.state.set(guild_id, "music", "current", music.current)
+
+    def memory_stats(self) -> dict:
+        '''Report (count, bytes) of this cog's in-memory structures'''
+        playlists = [music.playlist for music in self.guilds.values()]
+        sinks = [
+            sink_bytes(getattr(self.bot.voice_sessions.voice_client(guild_id), 'sink', None))
+            for guild_id in self.guilds if self.bot.voice_sessions.recorder(guild_id) == "music"
+        ]
+        return {
+            'playlist': (sum(len(p) for p in playlists), deep_sizeof(playlists)),
+            'recording_sink': (sum(users for users, _ in sinks), sum(size for _, size in sinks)),
+        }
+
+    def _voice_client(self, guild_id: int):
+        '''Return the guild's voice client, or None when not connected'''
+        return self.bot.voice_sessions.voice_client(guild_id)
+
+    def _check_connected(self, guild_id: int) -> bool:
+        '''Return whether the bot is connected to a voice channel in the guild'''
+        return self._voice_client(guild_id) is not None
     
-    async def _disconnect_client_if_connected(self) -> bool:
-        '''Disconnect the bot from the voice channel if it is connected'''
-        if self._check_connected():
-            try:
-                await self.vc.disconnect()
-                self.vc = None
-                return True
-            except Exception as e:
-                logging.error(f"Error disconnecting from voice: {e}")
-                self.vc = None
-                return False
-        else:
+    async def _disconnect_client_if_connected(self, guild_id: int) -> bool:
+        '''Disconnect the bot from the guild's voice channel if it is connected'''
+        try:
+            return await self.bot.voice_sessions.disconnect(guild_id)
+        except Exception as e:
+            logging.error(f"Error disconnecting from voice: {e}")
             return False
         
     @discord.slash_command(name="join", description="Join a voice channel", **default_params)
@@ -50,11 +86,6 @@ class MusicCog(commands.Cog):
         try:
             await ctx.respond("🎤 Attempting to join voice channel...")
             
-            # Check if bot is already in a voice channel
-            if self._check_connected():
-                await self.vc.disconnect()
-                await asyncio.sleep(1)  # Small delay to ensure clean disconnect
-            
             # Check bot permissions
             if not channel.permissions_for(ctx.guild.me).connect:
                 await ctx.followup.send(f"❌ I don't have permission to connect to {channel.name}")
@@ -64,9 +95,9 @@ class MusicCog(commands.Cog):
                 await ctx.followup.send(f"❌ I don't have permission to speak in {channel.name}")
                 return
             
-            # Try to connect with timeout
+            # Connect, or move the guild's existing connection, with timeout
             try:
-                self.vc = await asyncio.wait_for(channel.connect(), timeout=30.0)
+                await self.bot.voice_sessions.connect(channel, move=True)
                 await ctx.followup.send(f"✅ Successfully joined {channel.name}!")
             except asyncio.TimeoutError:
                 await ctx.followup.send(f"❌ Connection to {channel.name} timed out. Please try again.")
@@ -93,7 +124,7 @@ class MusicCog(commands.Cog):
     async def leave_vc(self, ctx) -> None:
         '''Leave the voice channel'''
         try:
-            if not await self._disconnect_client_if_connected():
+            if not await self._disconnect_client_if_connected(ctx.guild.id):
                 raise NotInVCException
             await ctx.respond("✅ Left the voice channel!")
         except NotInVCException:
@@ -105,20 +136,21 @@ class MusicCog(commands.Cog):
             await ctx.respond("❌ Failed to leave voice channel...")
             return
 
+    @discord.guild_only()
     @discord.slash_command(name="play", description="Play a song", **default_params)
     async def play_sound(self, ctx) -> None:
         '''Play a song'''
         try:
-            if not self._check_connected():
+            if await self.bot.voice_sessions.ensure_connected(ctx.guild.id) is None:
                 raise NotInVCException
-            if not self.is_playing and self.playlist:
-                await self.play_next(ctx)
-            elif not self.playlist:
+            music = self._music(ctx.guild.id)
+            if not music.is_playing and music.playlist:
+                await self.play_next(ctx.guild.id, ctx)
+            elif not music.playlist:
                 await ctx.respond("Playlist is empty. Add songs with /addsong.")
             else:
                 await ctx.respond("Already playing.")
         except NotInVCException:
-            print(err)
             await ctx.respond("I'm not in a voice channel!")
             return
         except Exception as err:
@@ -130,10 +162,10 @@ class MusicCog(commands.Cog):
     async def record_start(self, ctx) -> None:
         '''Start recording current voice channel audio'''
         try:
-            if not self._check_connected():
+            if not self._check_connected(ctx.guild.id):
                 raise NotInVCException
             
-            if self.recording:
+            if self.bot.voice_sessions.recorder(ctx.guild.id):
                 await ctx.respond("❌ Already recording! Use /record_stop to stop first.")
                 return
                 
@@ -143,8 +175,7 @@ class MusicCog(commands.Cog):
                 return
             
             sink = discord.sinks.MP3Sink()
-            self.vc.start_recording(sink, self._record_callback, ctx)
-            self.recording = True
+            self.bot.voice_sessions.start_recording(ctx.guild.id, "music", sink, self._record_callback, ctx)
             
             await ctx.respond("🎤 **Recording started!**\n\nI'm now recording everything said in the voice channel. Use `/record_stop` to stop recording.")
             
@@ -164,7 +195,6 @@ class MusicCog(commands.Cog):
     async def _record_callback(self, sink: discord.sinks.Sink, ctx) -> None:
         '''Store audio from sink into one audio file per user'''
         try:
-            self.recording = False
             os.makedirs("recordings", exist_ok=True)
             
             if not sink.audio_data:
@@ -173,7 +203,7 @@ class MusicCog(commands.Cog):
             
             for user_id, audio in sink.audio_data.items():
                 try:
-                    user = await self.bot.fetch_user(int(user_id))
+                    user = await self.bot.get_or_fetch_user(int(user_id))
                     user_name = user.display_name if user else f"User_{user_id}"
                     filename = f"recordings/{user_name}_{int(time.time())}.mp3"
                     
@@ -194,16 +224,13 @@ class MusicCog(commands.Cog):
     async def record_stop(self, ctx) -> None:
         '''Stop recording current voice channel audio'''
         try:
-            if not self._check_connected():
+            if not self._check_connected(ctx.guild.id):
                 raise NotInVCException
             
-            if not self.recording:
+            if not self.bot.voice_sessions.stop_recording(ctx.guild.id, owner="music"):
                 await ctx.respond("❌ Not currently recording! Use `/record_start` to start recording.")
                 return
             
-            self.vc.stop_recording()
-            self.recording = False
-            
             await ctx.respond("🛑 **Recording stopped!**\n\nProcessing recordings...")
             
         except NotInVCException:
@@ -219,19 +246,27 @@ class MusicCog(commands.Cog):
             await ctx.respond("❌ Failed to stop recording!")
             return
         
+    @discord.guild_only()
     @discord.slash_command(name="volume", description="Set playback volume (1-10)", **default_params)
     @discord.option("level", type=int, min_value=1, max_value=10, description="Volume level (1-10)")
     async def set_volume(self, ctx, level: int):
         '''Set the playback volume for future plays.'''
-        self.volume = level / 10.0
+        self._music(ctx.guild.id).volume = level / 10.0
+        self.bot.state.set(ctx.guild.id, "music", "volume", level / 10.0)
         await ctx.respond(f"Volume set to {level}/10")
 
-    async def play_next(self, ctx=None):
-        if not self.playlist:
-            self.is_playing = False
+    async def play_next(self, guild_id: int, ctx=None):
+        music = self._music(guild_id)
+        voice_client = self._voice_client(guild_id)
+        if not music.playlist or voice_client is None:
+            music.is_playing = False
+            music.current = None
+            self._save_queue(guild_id)
             return
-        self.is_playing = True
-        entry = self.playlist.pop(0)
+        music.is_playing = True
+        entry = music.playlist.pop(0)
+        music.current = entry
+        self._save_queue(guild_id)
         try:
             if entry.startswith('http://') or entry.startswith('https://'):
                 # Stream directly from URL using yt-dlp
@@ -248,23 +283,28 @@ class MusicCog(commands.Cog):
                     title = info.get('title', entry)
                     url = info['url']
                 logging.info(f"[API] Audio stream ready: {title}")
-                source = discord.FFmpegPCMAudio(url)
+                source = await self.bot.ffmpeg.create_source(url, "stream", guild_id=guild_id)
             else:
                 title = entry
-                source = discord.FFmpegPCMAudio(entry)
+                source = await self.bot.ffmpeg.create_source(entry, "file", guild_id=guild_id)
             
-            source = discord.PCMVolumeTransformer(source, volume=self.volume)
+            source = discord.PCMVolumeTransformer(source, volume=music.volume)
             def after_playing(error):
-                fut = self.bot.loop.create_task(self.play_next())
-            self.vc.play(source, after=after_playing)
+                if error:
+                    logging.error(f"[API] Playback error: {error}")
+                self.bot.task_supervisor.spawn_threadsafe(
+                    self.bot.loop, self.play_next(guild_id), "play_next", owner="music", guild_id=guild_id
+                )
+            voice_client.play(source, after=after_playing)
+            self.bot.voice_sessions.session(guild_id).touch()
             if ctx:
                 await ctx.respond(f"Now playing: {title}")
         except Exception as err:
             logging.error(f"[API] Error playing entry: {entry} | {err}")
             if ctx:
                 await ctx.respond(f"Failed to play: {entry}")
-            self.is_playing = False
-            await self.play_next()
+            music.is_playing = False
+            await self.play_next(guild_id)
 
     async def _extract_playlist_videos(self, url: str) -> list:
         '''Extract all video URLs from a YouTube playlist'''
@@ -286,39 +326,46 @@ class MusicCog(commands.Cog):
             logging.error(f"[API] Error extracting playlist: {e}")
             return [url]
 
+    @discord.guild_only()
     @discord.slash_command(name="addsong", description="Add a song (file path or URL) to the playlist", **default_params)
     @discord.option("song", description="File path or URL")
     async def addsong(self, ctx, song: str):
         logging.info(f"[USER] {ctx.author} used /addsong: {song}")
+        music = self._music(ctx.guild.id)
         if song.startswith('http://') or song.startswith('https://'):
             if 'youtube.com/playlist' in song or 'youtu.be/playlist' in song:
                 await ctx.respond("Processing playlist...")
                 logging.info(f"[API] Fetching YouTube playlist: {song}")
                 videos = await self._extract_playlist_videos(song)
-                self.playlist.extend(videos)
+                music.playlist.extend(videos)
                 await ctx.respond(f"Added {len(videos)} songs from the playlist!")
             else:
-                self.playlist.append(song)
+                music.playlist.append(song)
                 await ctx.respond(f"Added to playlist: {song}")
         else:
-            self.playlist.append(song)
+            music.playlist.append(song)
             await ctx.respond(f"Added to playlist: {song}")
+        self._save_queue(ctx.guild.id)
         
-        if not self.is_playing and self._check_connected():
-            await self.play_next(ctx)
+        if not music.is_playing and self._check_connected(ctx.guild.id):
+            await self.play_next(ctx.guild.id, ctx)
 
+    @discord.guild_only()
     @discord.slash_command(name="playlist", description="Show the current playlist", **default_params)
     async def show_playlist(self, ctx):
-        if not self.playlist:
+        playlist = self._music(ctx.guild.id).playlist
+        if not playlist:
             await ctx.respond("The playlist is empty.")
         else:
-            msg = "\n".join(f"{i+1}. {s}" for i, s in enumerate(self.playlist))
+            msg = "\n".join(f"{i+1}. {s}" for i, s in enumerate(playlist))
             await ctx.respond(f"Current playlist:\n{msg}")
 
+    @discord.guild_only()
     @discord.slash_command(name="skip", description="Skip the current song", **default_params)
     async def skip(self, ctx):
-        if self.vc and self.vc.is_playing():
-            self.vc.stop()
+        voice_client = self._voice_client(ctx.guild.id)
+        if voice_client and voice_client.is_playing():
+            voice_client.stop()
             await ctx.respond("Skipped!")
         else:
             await ctx.respond("Nothing is playing.")
@@ -330,11 +377,14 @@ class MusicCog(commands.Cog):
             status_msg = "🎤 **Voice Status:**\n\n"
             
             # Check if connected
-            if self._check_connected():
-                status_msg += f"✅ **Connected to:** {self.vc.channel.name}\n"
-                status_msg += f"🔊 **Playing:** {'Yes' if self.vc.is_playing() else 'No'}\n"
-                status_msg += f"📝 **Recording:** {'Yes' if self.recording else 'No'}\n"
-                status_msg += f"🎵 **Playlist:** {len(self.playlist)} songs\n"
+            if self._check_connected(ctx.guild.id):
+                session = self.bot.voice_sessions.session(ctx.guild.id).describe()
+                status_msg += f"✅ **Connected to:** {session['channel']} for {session['connected_for'] / 60:.0f} min\n"
+                status_msg += f"🔊 **Playing:** {'Yes' if session['playing'] else 'No'}\n"
+                status_msg += f"📝 **Recording:** {session['recording'] or 'No'}\n"
+                status_msg += f"🎵 **Playlist:** {len(self._music(ctx.guild.id).playlist)} songs\n"
+                if session['reconnects']:
+                    status_msg += f"🔁 **Reconnects:** {session['reconnects']}\n"
             else:
                 status_msg += "❌ **Not connected to any voice channel**\n"
             
@@ -136,18 +136,17 @@ class RVCVoiceCog(commands.Cog):
                 "--protect", "0.33"  # Voice protection
             ]
 
-            # Change to RVC directory
-            original_dir = os.getcwd()
-            os.chdir(self.rvc_path)
-
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-
-            stdout, stderr = await process.communicate()
-            os.chdir(original_dir)
+            async with self.bot.compute.slot("rvc"):
+                # Run from the RVC directory without changing the whole process's working directory
+                process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    cwd=self.rvc_path,
+                    **self.bot.compute.subprocess_kwargs()
+                )
+
+                stdout, stderr = await process.communicate()
 
             if process.returncode == 0 and os.path.exists(output_audio):
                 logging.info(f"Voice conversion successful: {output_audio}")
@@ -189,7 +188,7 @@ class RVCVoiceCog(commands.Cog):
 
                 # Step 3: Play the converted audio
                 logging.info("Playing converted audio")
-                source = discord.FFmpegPCMAudio(rvc_file)
+                source = await self.bot.ffmpeg.create_source(rvc_file, "file", guild_id=voice_channel.guild.id)
                 voice_channel.play(source)
 
                 # Wait for audio to finish
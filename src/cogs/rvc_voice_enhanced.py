@@ -1,9 +1,7 @@
 import discord
 from discord.ext import commands
-import asyncio
 import logging
 import os
-import tempfile
 import subprocess
 import json
 import requests
@@ -11,6 +9,13 @@ from typing import Optional, Dict, List
 import edge_tts
 
 from cogs.defaults import default_params
+from utils.service.degradation import EDGE_TTS
+from utils.service.usage_quota import trim_text
+
+# Edge TTS returns 24 kHz / 48 kbit/s mono MP3
+EDGE_TTS_BYTES_PER_SECOND = 6000
+# Rough speaking rate used to estimate how long a text takes to say
+CHARS_PER_SPOKEN_SECOND = 15
 
 class RVCVoiceEnhancedCog(commands.Cog):
     '''
@@ -20,9 +25,10 @@ class RVCVoiceEnhancedCog(commands.Cog):
     def __init__(self, bot: discord.Bot) -> None:
         self.bot = bot
         self.rvc_path = os.getenv("RVC_PATH", "./rvc")
-        self.current_voice_model = os.getenv("DEFAULT_RVC_MODEL", "default")
+        # Choices made with /set_rvc_model and /toggle_rvc override the environment defaults
+        self.current_voice_model = bot.state.get(None, "rvc", "model", os.getenv("DEFAULT_RVC_MODEL", "default"))
         self.available_models = self._scan_voice_models()
-        self.use_rvc = os.getenv("USE_RVC", "false").lower() == "true"
+        self.use_rvc = bot.state.get(None, "rvc", "enabled", os.getenv("USE_RVC", "false").lower() == "true")
         self.edge_voice = "en-US-AriaNeural"  # Fallback voice
         
         # RVC API settings (if using RVC WebUI)
@@ -98,6 +104,7 @@ class RVCVoiceEnhancedCog(commands.Cog):
                 return
                 
             self.current_voice_model = model_found['name']
+            self.bot.state.set(None, "rvc", "model", self.current_voice_model)
             await ctx.respond(f"✅ **RVC Model Set!**\n\nNow using: **{self.current_voice_model}**\n\nUse `/test_rvc_voice` to test it!")
             
         except Exception as e:
@@ -109,6 +116,7 @@ class RVCVoiceEnhancedCog(commands.Cog):
         """Toggle RVC voice conversion on/off"""
         try:
             self.use_rvc = not self.use_rvc
+            self.bot.state.set(None, "rvc", "enabled", self.use_rvc)
             
             if self.use_rvc:
                 await ctx.respond("✅ **RVC Voice Conversion Enabled!**\n\nI'll now use custom RVC voices for speech!")
@@ -127,8 +135,8 @@ class RVCVoiceEnhancedCog(commands.Cog):
                 await ctx.respond("❌ You need to be in a voice channel to test voice!")
                 return
 
-            # Check if bot is in voice channel
-            if not hasattr(self.bot, 'voice_clients') or not self.bot.voice_clients:
+            # Check if bot is in a voice channel in this server
+            if not self.bot.voice_sessions.voice_client(ctx.guild.id):
                 await ctx.respond("❌ I need to join your voice channel first! Use `/join`")
                 return
 
@@ -157,7 +165,20 @@ class RVCVoiceEnhancedCog(commands.Cog):
     async def speak_text(self, text: str, voice_client) -> bool:
         """Main method to speak text using RVC or Edge TTS"""
         try:
-            if self.use_rvc and self.available_models:
+            guild = getattr(voice_client, 'guild', None)
+            guild_id = guild.id if guild else None
+            decision = self.bot.usage.check(guild_id, "tts_chars", len(text))
+            if decision.deferred:
+                logging.info(f"TTS quota exhausted for guild {guild_id}, skipping speech")
+                return False
+            if not decision.allowed:
+                text = trim_text(text, int(decision.remaining))
+            self.bot.usage.record(guild_id, None, "tts_chars", len(text))
+
+            # Over the RVC quota or under heavy load, speak with the plain Edge TTS voice instead of converting
+            rvc_allowed = self.bot.usage.check(guild_id, "rvc_seconds", len(text) / CHARS_PER_SPOKEN_SECOND).allowed
+            rvc_allowed = rvc_allowed and not self.bot.degradation.active(EDGE_TTS)
+            if self.use_rvc and self.available_models and rvc_allowed:
                 return await self._speak_with_rvc(text, voice_client)
             else:
                 return await self._speak_with_edge_tts(text, voice_client)
@@ -187,24 +208,31 @@ class RVCVoiceEnhancedCog(commands.Cog):
     async def _speak_with_rvc_api(self, text: str, ctx) -> bool:
         """Speak using RVC WebUI API"""
         try:
-            # First generate TTS audio using Edge TTS
-            tts_audio = await self._generate_edge_tts(text)
-            if not tts_audio:
-                return False
-                
-            # Send to RVC API for voice conversion
-            rvc_payload = {
-                "audio": tts_audio,
-                "model": self.current_voice_model,
-                "pitch": 0,
-                "index_rate": 0.5,
-                "filter_radius": 3,
-                "resample_sr": 0,
-                "rms_mix_rate": 0.25
-            }
-            
-            response = requests.post(f"{self.rvc_api_url}/voice-conversion", json=rvc_payload, timeout=30)
+            with self.bot.degradation.track("tts"):
+                # First generate TTS audio using Edge TTS
+                tts_audio = await self._generate_edge_tts(text)
+                if not tts_audio:
+                    return False
+
+                # Send to RVC API for voice conversion
+                rvc_payload = {
+                    "audio": tts_audio,
+                    "model": self.current_voice_model,
+                    "pitch": 0,
+                    "index_rate": 0.5,
+                    "filter_radius": 3,
+                    "resample_sr": 0,
+                    "rms_mix_rate": 0.25
+                }
+
+                response = await self.bot.compute.run(
+                    "rvc", requests.post, f"{self.rvc_api_url}/voice-conversion", json=rvc_payload, timeout=30
+                )
             if response.status_code == 200:
+                guild = getattr(ctx, 'guild', None)
+                self.bot.usage.record(
+                    guild.id if guild else None, None, "rvc_seconds", len(tts_audio) / EDGE_TTS_BYTES_PER_SECOND
+                )
                 # Play the converted audio
                 return await self._play_audio(response.content, ctx)
             else:
@@ -230,7 +258,8 @@ class RVCVoiceEnhancedCog(commands.Cog):
         """Speak text using Edge TTS (fallback)"""
         try:
             # Generate TTS audio
-            tts_audio = await self._generate_edge_tts(text)
+            with self.bot.degradation.track("tts"):
+                tts_audio = await self._generate_edge_tts(text)
             if not tts_audio:
                 return False
                 
@@ -244,42 +273,30 @@ class RVCVoiceEnhancedCog(commands.Cog):
     async def _generate_edge_tts(self, text: str) -> Optional[bytes]:
         """Generate TTS audio using Edge TTS"""
         try:
+            audio_data = bytearray()
             communicate = edge_tts.Communicate(text, self.edge_voice)
-            audio_data = await communicate.get_audio()
-            return audio_data
+            async for chunk in communicate.stream():
+                if chunk["type"] == "audio":
+                    audio_data.extend(chunk["data"])
+            return bytes(audio_data) or None
             
         except Exception as e:
             logging.error(f"Edge TTS generation error: {e}")
             return None
 
     async def _play_audio(self, audio_data: bytes, ctx) -> bool:
-        """Play audio in voice channel"""
+        """Play audio in the voice channel of the guild `ctx` (context, message or voice client) belongs to"""
         try:
-            # Create temporary audio file
-            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as temp_file:
-                temp_file.write(audio_data)
-                temp_file.flush()
-                
-                # Get voice client
-                voice_client = None
-                if hasattr(self.bot, 'voice_clients') and self.bot.voice_clients:
-                    voice_client = self.bot.voice_clients[0]
-                
-                if not voice_client:
-                    logging.error("No voice client available")
-                    return False
-                
-                # Play the audio
-                voice_client.play(discord.FFmpegPCMAudio(temp_file.name))
-                
-                # Wait for audio to finish
-                while voice_client.is_playing():
-                    await asyncio.sleep(0.1)
-                
-                # Clean up
-                os.unlink(temp_file.name)
-                return True
-                
+            guild = getattr(ctx, 'guild', None)
+            voice_client = self.bot.voice_sessions.voice_client(guild.id if guild else None)
+
+            if not voice_client:
+                logging.error("No voice client available")
+                return False
+
+            # Play the audio straight from memory and wait for it to finish
+            return await self.bot.ffmpeg.play_clip(voice_client, audio_data)
+
         except Exception as e:
             logging.error(f"Audio playback error: {e}")
             return False
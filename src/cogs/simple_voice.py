@@ -1,13 +1,12 @@
 import discord
 from discord.ext import commands
-import asyncio
 import logging
 import os
-import tempfile
 import edge_tts
 from typing import Optional
 
 from cogs.defaults import default_params
+from utils.service.usage_quota import trim_text
 
 class SimpleVoiceCog(commands.Cog):
     '''
@@ -16,7 +15,7 @@ class SimpleVoiceCog(commands.Cog):
 
     def __init__(self, bot: discord.Bot) -> None:
         self.bot = bot
-        self.current_voice = "en-US-AriaNeural"
+        self.current_voice = bot.state.get(None, "tts", "voice", "en-US-AriaNeural")
         self.available_voices = [
             "en-US-AriaNeural",      # Female, clear
             "en-US-DavisNeural",     # Male, clear
@@ -41,6 +40,7 @@ class SimpleVoiceCog(commands.Cog):
         """Set the voice for TTS"""
         if voice in self.available_voices:
             self.current_voice = voice
+            self.bot.state.set(None, "tts", "voice", voice)
             await ctx.respond(f"✅ Voice set to: **{voice}**")
         else:
             await ctx.respond(f"❌ Voice '{voice}' not found. Use `/voices` to see available options.")
@@ -63,6 +63,15 @@ class SimpleVoiceCog(commands.Cog):
             logging.error(f"TTS error: {e}")
             return False
 
+    async def synthesize(self, text: str) -> bytes:
+        """Convert text to speech in memory, returning MP3 bytes"""
+        audio = bytearray()
+        communicate = edge_tts.Communicate(text, self.current_voice)
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                audio.extend(chunk["data"])
+        return bytes(audio)
+
     async def speak_text(self, text: str, voice_channel) -> bool:
         """Convert text to speech and play it in voice channel"""
         try:
@@ -70,32 +79,26 @@ class SimpleVoiceCog(commands.Cog):
                 logging.error("Not connected to voice channel")
                 return False
 
-            # Create temporary file for TTS
-            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as temp_file:
-                tts_file = temp_file.name
-
-            try:
-                # Step 1: Convert text to speech
-                logging.info(f"Converting text to speech: {text[:50]}...")
-                if not await self.text_to_speech(text, tts_file):
-                    logging.error("TTS conversion failed")
-                    return False
-
-                # Step 2: Play the audio
-                logging.info("Playing TTS audio")
-                source = discord.FFmpegPCMAudio(tts_file)
-                voice_channel.play(source)
-
-                # Wait for audio to finish
-                while voice_channel.is_playing():
-                    await asyncio.sleep(0.1)
-
-                return True
+            guild_id = voice_channel.guild.id
+            decision = self.bot.usage.check(guild_id, "tts_chars", len(text))
+            if decision.deferred:
+                logging.info(f"TTS quota exhausted for guild {guild_id}, skipping speech")
+                return False
+            if not decision.allowed:
+                text = trim_text(text, int(decision.remaining))
+
+            # Step 1: Convert text to speech
+            logging.info(f"Converting text to speech: {text[:50]}...")
+            with self.bot.degradation.track("tts"):
+                audio = await self.synthesize(text)
+            if not audio:
+                logging.error("TTS conversion failed")
+                return False
+            self.bot.usage.record(guild_id, None, "tts_chars", len(text))
 
-            finally:
-                # Cleanup temporary file
-                if os.path.exists(tts_file):
-                    os.unlink(tts_file)
+            # Step 2: Play the audio and wait for it to finish
+            logging.info("Playing TTS audio")
+            return await self.bot.ffmpeg.play_clip(voice_channel, audio, "mp3")
 
         except Exception as e:
             logging.error(f"Error in speak_text: {e}")
@@ -111,15 +114,16 @@ class SimpleVoiceCog(commands.Cog):
 
             voice_channel = ctx.author.voice.channel
             
-            # Check if bot is in the same voice channel
-            if not hasattr(self.bot, 'voice_clients') or not self.bot.voice_clients:
+            # Check if bot is in a voice channel in this server
+            voice_client = self.bot.voice_sessions.voice_client(ctx.guild.id)
+            if not voice_client:
                 await ctx.respond("❌ I need to join your voice channel first! Use `/join`")
                 return
 
             await ctx.respond("🎤 Testing voice...")
             
             test_text = f"Hello! This is a test of the {self.current_voice} voice."
-            success = await self.speak_text(test_text, self.bot.voice_clients[0])
+            success = await self.speak_text(test_text, voice_client)
             
             if success:
                 await ctx.followup.send("✅ Voice test completed successfully!")
@@ -141,14 +145,15 @@ class SimpleVoiceCog(commands.Cog):
 
             voice_channel = ctx.author.voice.channel
             
-            # Check if bot is in the same voice channel
-            if not hasattr(self.bot, 'voice_clients') or not self.bot.voice_clients:
+            # Check if bot is in a voice channel in this server
+            voice_client = self.bot.voice_sessions.voice_client(ctx.guild.id)
+            if not voice_client:
                 await ctx.respond("❌ I need to join your voice channel first! Use `/join`")
                 return
 
             await ctx.respond("🎤 Speaking...")
             
-            success = await self.speak_text(text, self.bot.voice_clients[0])
+            success = await self.speak_text(text, voice_client)
             
             if success:
                 await ctx.followup.send("✅ Finished speaking!")
@@ -2,13 +2,16 @@ import discord
 from discord.ext import commands
 import asyncio
 import os
-import tempfile
 import logging
+import sys
 import speech_recognition as sr
-import whisper
 import io
+import time
 
 from cogs.defaults import default_params
+from utils.service.audio_decode import WHISPER_RATE, AudioDecodeError, float32_to_pcm16
+from utils.service.memory_profiler import deep_sizeof, sink_bytes
+from utils.service.vad_sink import StreamingVADSink, Utterance
 
 class SpeechToTextCog(commands.Cog):
     '''
@@ -18,20 +21,18 @@ class SpeechToTextCog(commands.Cog):
     def __init__(self, bot: discord.Bot) -> None:
         self.bot = bot
         self.recognizer = sr.Recognizer()
-        self.whisper_model = None
         self.voice_channels = {}  # Track voice channels for real-time transcription
-        self.auto_transcribe = {}  # Track servers with auto-transcription enabled
+        self.auto_transcribe = bot.state.mapping("speech_to_text", "auto_transcribe")  # Servers with auto-transcription enabled, persisted
         
-    async def _load_whisper_model(self):
-        """Load Whisper model for offline transcription"""
-        if self.whisper_model is None:
-            try:
-                logging.info("Loading Whisper model...")
-                self.whisper_model = whisper.load_model("base")
-                logging.info("Whisper model loaded successfully")
-            except Exception as e:
-                logging.error(f"Failed to load Whisper model: {e}")
-                self.whisper_model = None
+    def memory_stats(self) -> dict:
+        """Report (count, bytes) of this cog's in-memory structures"""
+        sinks = [sink_bytes(data.get('sink')) for data in self.voice_channels.values()]
+        return {
+            # Entries reference shared discord objects, so only the tracking dicts themselves are counted
+            'voice_channels': (len(self.voice_channels), sys.getsizeof(self.voice_channels) + sum(sys.getsizeof(v) for v in self.voice_channels.values())),
+            'sink_audio_buffers': (sum(users for users, _ in sinks), sum(size for _, size in sinks)),
+            'auto_transcribe': (len(self.auto_transcribe), deep_sizeof(dict(self.auto_transcribe))),
+        }
 
     @discord.slash_command(name="auto_transcribe", description="Enable automatic transcription for voice channels", **default_params)
     async def enable_auto_transcribe(self, ctx):
@@ -66,7 +67,7 @@ class SpeechToTextCog(commands.Cog):
             # Check if currently transcribing any voice channels
             active_channels = []
             for channel_id, data in self.voice_channels.items():
-                if data.get('ctx', {}).guild.id == ctx.guild.id:
+                if data['voice_client'].guild.id == ctx.guild.id:
                     channel = ctx.guild.get_channel(channel_id)
                     if channel:
                         active_channels.append(channel.name)
@@ -78,6 +79,31 @@ class SpeechToTextCog(commands.Cog):
                 status_msg += f"**Active transcriptions:** {', '.join(active_channels)}\n"
             else:
                 status_msg += "**Active transcriptions:** None\n"
+
+            pending = self.bot.transcription.pending(guild_id)
+            running = sum(1 for job in pending if job.state == "running")
+            status_msg += f"**Transcription queue:** {running} running, {len(pending) - running} waiting\n"
+            for model in self.bot.whisper.readiness():
+                key = model["key"]
+                if model["state"] == "loading":
+                    line = f"⏳ loading for {model['seconds']:.0f}s"
+                elif model["state"] == "warming up":
+                    line = f"⏳ warming up (loaded in {model['seconds']:.1f}s)"
+                elif model["state"] == "ready":
+                    line = f"✅ ready (loaded in {model['seconds']:.1f}s)"
+                elif model["state"] == "failed":
+                    line = f"❌ failed to load: {model['error'][:100]}"
+                else:
+                    line = "💤 not loaded, loads on the next transcription"
+                if model["waiting"]:
+                    line += f", {model['waiting']} transcription(s) waiting for it"
+                status_msg += f"**Whisper {key.name}** ({key.backend}, {key.precision}): {line}\n"
+
+            if self.bot.degradation.level:
+                status_msg += f"**Under load:** {self.bot.degradation.describe()}\n"
+            batching = self.bot.whisper_batcher.report()
+            if batching["batches"]:
+                status_msg += f"**Whisper batching:** {batching['mean_batch']:.1f} clips per batch on average\n"
             
             status_msg += f"\n**Commands:**\n"
             status_msg += "• `/transcribe_live` - Start manual transcription\n"
@@ -96,9 +122,8 @@ class SpeechToTextCog(commands.Cog):
         """Transcribe an audio file or voice message"""
         try:
             # Check if there's a file attachment or if we should use the last recording
-            if file:
-                audio_file = file
-            else:
+            recording_path = None
+            if not file:
                 # Check if there are any recent recordings
                 recordings_dir = "recordings"
                 if not os.path.exists(recordings_dir):
@@ -113,69 +138,83 @@ class SpeechToTextCog(commands.Cog):
                 
                 # Use the most recent recording
                 latest_recording = max(recordings, key=lambda x: os.path.getctime(os.path.join(recordings_dir, x)))
-                audio_file = discord.Attachment(
-                    filename=latest_recording,
-                    url=f"file://{os.path.join(recordings_dir, latest_recording)}"
-                )
+                recording_path = os.path.join(recordings_dir, latest_recording)
             
+            decision = self.bot.usage.check(ctx.guild.id if ctx.guild else None, "audio_seconds")
+            if decision.deferred:
+                await ctx.respond(f"⏳ This server has used its transcription quota for now. Try again in {decision.retry_after / 60:.0f} minutes.")
+                return
+
             await ctx.respond("Processing audio transcription...")
             
-            # Download the audio file
-            audio_data = await audio_file.read()
-            
-            # Save to temporary file
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                temp_file.write(audio_data)
-                temp_file_path = temp_file.name
-            
+            # Download the audio file, then decode and transcribe it in memory unless it was transcribed before
+            if file:
+                audio_data = await file.read()
+            else:
+                audio_data = await asyncio.to_thread(self._read_file, recording_path)
             try:
-                # Try using Whisper for transcription
-                await self._load_whisper_model()
-                if self.whisper_model:
-                    transcription = await self._transcribe_with_whisper(temp_file_path)
-                else:
-                    # Fallback to Google Speech Recognition
-                    transcription = await self._transcribe_with_google(temp_file_path)
-                
-                if transcription:
-                    # Split long transcriptions
-                    if len(transcription) > 2000:
-                        chunks = [transcription[i:i+1990] for i in range(0, len(transcription), 1990)]
-                        for i, chunk in enumerate(chunks):
-                            if i == 0:
-                                await ctx.followup.send(f"**Transcription:**\n{chunk}\n[1/{len(chunks)}]")
-                            else:
-                                await ctx.followup.send(f"{chunk}\n[{i+1}/{len(chunks)}]")
-                    else:
-                        await ctx.followup.send(f"**Transcription:**\n{transcription}")
+                transcription = await self._transcribe_bytes(audio_data, ctx.guild.id if ctx.guild else None, ctx.author.id)
+            except AudioDecodeError as e:
+                await ctx.followup.send(f"Could not read that audio file: {e}")
+                return
+            
+            if transcription:
+                # Split long transcriptions
+                if len(transcription) > 2000:
+                    chunks = [transcription[i:i+1990] for i in range(0, len(transcription), 1990)]
+                    for i, chunk in enumerate(chunks):
+                        if i == 0:
+                            await ctx.followup.send(f"**Transcription:**\n{chunk}\n[1/{len(chunks)}]")
+                        else:
+                            await ctx.followup.send(f"{chunk}\n[{i+1}/{len(chunks)}]")
                 else:
-                    await ctx.followup.send("Could not transcribe the audio. Please try again with clearer audio.")
-                    
-            finally:
-                # Clean up temporary file
-                if os.path.exists(temp_file_path):
-                    os.unlink(temp_file_path)
+                    await ctx.followup.send(f"**Transcription:**\n{transcription}")
+            else:
+                await ctx.followup.send("Could not transcribe the audio. Please try again with clearer audio.")
                     
         except Exception as e:
             logging.error(f"Error in transcribe_audio: {e}")
             await ctx.followup.send(f"Error transcribing audio: {str(e)}")
 
-    async def _transcribe_with_whisper(self, audio_file_path: str):
-        """Transcribe audio using Whisper"""
+    @staticmethod
+    def _read_file(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    async def _transcribe_bytes(self, audio_data, guild_id=None, user_id=None):
+        """Decode and transcribe attachment bytes through the transcript cache; raises AudioDecodeError"""
+        async def transcribe():
+            audio = await self.bot.audio_decoder.decode(audio_data)
+            return await self._transcribe_with_engine(audio, guild_id, user_id)
+
+        return await self.bot.transcripts.get_or_transcribe(audio_data, transcribe)
+
+    async def _transcribe(self, audio, guild_id=None, user_id=None):
+        """Transcribe 16 kHz mono samples with Whisper (or Google as a fallback), accounting the audio seconds"""
+        text, _ = await self._transcribe_with_engine(audio, guild_id, user_id)
+        return text
+
+    async def _transcribe_with_engine(self, audio, guild_id=None, user_id=None):
+        """Like `_transcribe`, returning (text, Whisper engine id or None) so only Whisper output gets cached"""
         try:
-            result = self.whisper_model.transcribe(audio_file_path)
-            return result["text"].strip()
+            result = await self.bot.whisper_batcher.transcribe(audio, guild_id, user_id)
         except Exception as e:
             logging.error(f"Whisper transcription error: {e}")
-            return None
+            return None, None
+        if result is None:
+            return await self._transcribe_with_google(audio, guild_id, user_id), None
+        if result.get("segments"):
+            self.bot.usage.record(guild_id, user_id, "audio_seconds", result["segments"][-1]["end"])
+        return result["text"].strip(), result.get("engine")
 
-    async def _transcribe_with_google(self, audio_file_path: str):
-        """Transcribe audio using Google Speech Recognition"""
+    async def _transcribe_with_google(self, audio, guild_id=None, user_id=None):
+        """Transcribe audio using Google Speech Recognition, in the transcription pool"""
         try:
-            with sr.AudioFile(audio_file_path) as source:
-                audio = self.recognizer.record(source)
-                text = self.recognizer.recognize_google(audio)
-                return text
+            self.bot.usage.record(guild_id, user_id, "audio_seconds", len(audio) / WHISPER_RATE)
+            return await self.bot.transcription.run(
+                "google", self.recognizer.recognize_google, sr.AudioData(float32_to_pcm16(audio), WHISPER_RATE, 2),
+                guild_id=guild_id, user_id=user_id
+            )
         except sr.UnknownValueError:
             logging.warning("Google Speech Recognition could not understand audio")
             return None
@@ -202,14 +241,12 @@ class SpeechToTextCog(commands.Cog):
                 await ctx.respond("Already transcribing this voice channel!")
                 return
             
-            # Join the voice channel if not already connected
-            voice_client = ctx.guild.voice_client
-            if not voice_client or voice_client.channel != voice_channel:
-                voice_client = await voice_channel.connect()
+            # Join the voice channel, reusing the guild's connection if there is one
+            voice_client = await self.bot.voice_sessions.connect(voice_channel)
             
-            # Start recording for transcription
-            sink = discord.sinks.MP3Sink()
-            voice_client.start_recording(sink, self._live_transcription_callback, ctx)
+            # Stream each speaker's utterances to transcription as soon as they pause
+            sink = self._streaming_sink(voice_channel, ctx.channel)
+            self.bot.voice_sessions.start_recording(ctx.guild.id, "speech_to_text", sink, self._live_transcription_callback, ctx)
             
             self.voice_channels[voice_channel.id] = {
                 'sink': sink,
@@ -224,44 +261,41 @@ class SpeechToTextCog(commands.Cog):
             logging.error(f"Error starting live transcription: {e}")
             await ctx.respond(f"Error starting live transcription: {str(e)}")
 
-    async def _live_transcription_callback(self, sink: discord.sinks.Sink, ctx):
-        """Handle live transcription callback - sends transcriptions to text chat"""
+    def _streaming_sink(self, voice_channel, text_channel) -> StreamingVADSink:
+        """A VAD sink that captions each utterance in `text_channel` as soon as the speaker pauses"""
+        guild_id = voice_channel.guild.id
+
+        async def caption(utterance: Utterance):
+            await self._caption_utterance(utterance, guild_id, voice_channel.id, text_channel)
+
+        return StreamingVADSink(self.bot, guild_id, caption)
+
+    async def _caption_utterance(self, utterance: Utterance, guild_id, voice_channel_id, text_channel):
+        """Transcribe one utterance and post it, unless the server is out of transcription quota"""
+        if self.bot.usage.check(guild_id, "audio_seconds").deferred:
+            data = self.voice_channels.get(voice_channel_id)
+            if data is not None and not data.get('quota_notified'):
+                data['quota_notified'] = True
+                await text_channel.send("⏳ Transcription quota reached for this server; speech is not being transcribed for now.")
+            return
+
+        # Downmixed 48 kHz PCM to 16 kHz float32 off the loop, then recycle the capture buffer
+        audio = await asyncio.to_thread(self.bot.audio_decoder.from_pcm, utterance.samples, utterance.sample_rate)
+        utterance.release()
+        transcription = await self._transcribe(audio, guild_id, utterance.user_id)
+
+        if transcription and transcription.strip():
+            user = await self.bot.get_or_fetch_user(utterance.user_id)
+            user_name = user.display_name if user else f"User {utterance.user_id}"
+            await text_channel.send(f"**{user_name}:** {transcription}")
+            # From the speaker's last word to the caption appearing
+            self.bot.metrics.observe("transcription.live.caption_latency", time.monotonic() - utterance.ended)
+
+    async def _live_transcription_callback(self, sink: StreamingVADSink, ctx):
+        """Recording stopped: caption what was still being said, then stop tracking the channel"""
         try:
-            # Process each user's audio
-            for user_id, audio in sink.audio_data.items():
-                # Save audio to temporary file
-                with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                    temp_file.write(audio.file.read())
-                    temp_file_path = temp_file.name
-                
-                try:
-                    # Transcribe the audio
-                    await self._load_whisper_model()
-                    if self.whisper_model:
-                        transcription = await self._transcribe_with_whisper(temp_file_path)
-                    else:
-                        transcription = await self._transcribe_with_google(temp_file_path)
-                    
-                    if transcription and transcription.strip():
-                        # Get user info
-                        user = await self.bot.fetch_user(int(user_id))
-                        user_name = user.display_name if user else f"User {user_id}"
-                        
-                        # Send transcription to the text channel
-                        # Find the correct text channel from the stored data
-                        text_channel = ctx.channel  # Default to the context channel
-                        for channel_id, data in self.voice_channels.items():
-                            if data.get('ctx') == ctx:
-                                text_channel = data.get('text_channel', ctx.channel)
-                                break
-                        
-                        await text_channel.send(f"**{user_name}:** {transcription}")
-                        
-                finally:
-                    # Clean up temporary file
-                    if os.path.exists(temp_file_path):
-                        os.unlink(temp_file_path)
-            
+            await sink.drain()
+
             # Remove from tracking
             voice_channel = ctx.author.voice.channel if ctx.author.voice else None
             if voice_channel and voice_channel.id in self.voice_channels:
@@ -287,8 +321,7 @@ class SpeechToTextCog(commands.Cog):
                 return
             
             # Stop recording
-            voice_client = self.voice_channels[voice_channel.id]['voice_client']
-            voice_client.stop_recording()
+            self.bot.voice_sessions.stop_recording(ctx.guild.id, owner="speech_to_text")
             
             await ctx.respond("🛑 **Live transcription stopped!**\n\nI'm no longer transcribing voice chat to text.")
             
@@ -317,30 +350,25 @@ class SpeechToTextCog(commands.Cog):
                 await ctx.respond("No voice message found in the recent messages. Please send a voice message first.")
                 return
             
+            decision = self.bot.usage.check(ctx.guild.id if ctx.guild else None, "audio_seconds")
+            if decision.deferred:
+                await ctx.respond(f"⏳ This server has used its transcription quota for now. Try again in {decision.retry_after / 60:.0f} minutes.")
+                return
+
             await ctx.respond("Processing voice message transcription...")
             
-            # Download and transcribe
+            # Download, decode in memory and transcribe (or reuse an earlier transcript)
             audio_data = await voice_message.read()
-            
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                temp_file.write(audio_data)
-                temp_file_path = temp_file.name
-            
             try:
-                await self._load_whisper_model()
-                if self.whisper_model:
-                    transcription = await self._transcribe_with_whisper(temp_file_path)
-                else:
-                    transcription = await self._transcribe_with_google(temp_file_path)
-                
-                if transcription:
-                    await ctx.followup.send(f"**Voice Message Transcription:**\n{transcription}")
-                else:
-                    await ctx.followup.send("Could not transcribe the voice message. Please try again.")
-                    
-            finally:
-                if os.path.exists(temp_file_path):
-                    os.unlink(temp_file_path)
+                transcription = await self._transcribe_bytes(audio_data, ctx.guild.id if ctx.guild else None, ctx.author.id)
+            except AudioDecodeError as e:
+                await ctx.followup.send(f"Could not read that voice message: {e}")
+                return
+            
+            if transcription:
+                await ctx.followup.send(f"**Voice Message Transcription:**\n{transcription}")
+            else:
+                await ctx.followup.send("Could not transcribe the voice message. Please try again.")
                     
         except Exception as e:
             logging.error(f"Error transcribing voice message: {e}")
@@ -352,6 +380,7 @@ class SpeechToTextCog(commands.Cog):
         try:
             # Check if auto-transcription is enabled for this server
             guild_id = member.guild.id
+            await self.bot.state.load_guild(guild_id)  # After a restart nothing else may have loaded it yet
             if guild_id not in self.auto_transcribe:
                 return
             
@@ -362,6 +391,11 @@ class SpeechToTextCog(commands.Cog):
                 # Don't start if already transcribing this channel
                 if voice_channel.id in self.voice_channels:
                     return
+
+                # Never pull the bot out of a channel where it is already playing or recording
+                current = self.bot.voice_sessions.voice_client(guild_id)
+                if current is not None and current.channel.id != voice_channel.id:
+                    return
                 
                 # Find the general text channel to send transcriptions to
                 text_channel = None
@@ -378,12 +412,14 @@ class SpeechToTextCog(commands.Cog):
                 
                 if text_channel:
                     try:
-                        # Join the voice channel
-                        voice_client = await voice_channel.connect()
+                        # Join the voice channel, reusing the guild's connection if there is one
+                        voice_client = await self.bot.voice_sessions.connect(voice_channel)
                         
-                        # Start recording for transcription
-                        sink = discord.sinks.MP3Sink()
-                        voice_client.start_recording(sink, self._auto_transcription_callback, text_channel)
+                        # Stream each speaker's utterances to transcription as soon as they pause
+                        sink = self._streaming_sink(voice_channel, text_channel)
+                        self.bot.voice_sessions.start_recording(
+                            member.guild.id, "speech_to_text", sink, self._auto_transcription_callback, text_channel
+                        )
                         
                         self.voice_channels[voice_channel.id] = {
                             'sink': sink,
@@ -401,37 +437,11 @@ class SpeechToTextCog(commands.Cog):
         except Exception as e:
             logging.error(f"Error in voice state update: {e}")
 
-    async def _auto_transcription_callback(self, sink: discord.sinks.Sink, text_channel):
-        """Handle auto-transcription callback"""
+    async def _auto_transcription_callback(self, sink: StreamingVADSink, text_channel):
+        """Auto-transcription stopped: caption what was still being said, then stop tracking"""
         try:
-            # Process each user's audio
-            for user_id, audio in sink.audio_data.items():
-                # Save audio to temporary file
-                with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                    temp_file.write(audio.file.read())
-                    temp_file_path = temp_file.name
-                
-                try:
-                    # Transcribe the audio
-                    await self._load_whisper_model()
-                    if self.whisper_model:
-                        transcription = await self._transcribe_with_whisper(temp_file_path)
-                    else:
-                        transcription = await self._transcribe_with_google(temp_file_path)
-                    
-                    if transcription and transcription.strip():
-                        # Get user info
-                        user = await self.bot.fetch_user(int(user_id))
-                        user_name = user.display_name if user else f"User {user_id}"
-                        
-                        # Send transcription to the text channel
-                        await text_channel.send(f"**{user_name}:** {transcription}")
-                        
-                finally:
-                    # Clean up temporary file
-                    if os.path.exists(temp_file_path):
-                        os.unlink(temp_file_path)
-            
+            await sink.drain()
+
             # Remove from tracking
             for channel_id, data in list(self.voice_channels.items()):
                 if data.get('text_channel') == text_channel:
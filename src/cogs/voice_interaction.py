@@ -2,15 +2,17 @@ import discord
 from discord.ext import commands
 import asyncio
 import logging
+import sys
 import os
-import tempfile
 import speech_recognition as sr
-import whisper
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 import json
 
 from cogs.defaults import default_params
-from utils.service.Ollama_worker import OllamaWorker
+from utils.service.audio_decode import WHISPER_RATE, float32_to_pcm16
+from utils.service.degradation import TEXT_ONLY
+from utils.service.memory_profiler import deep_sizeof, sink_bytes
+from utils.service.message_dispatcher import ClassifiedMessage, MessageKind
 
 class VoiceInteractionCog(commands.Cog):
     '''
@@ -20,21 +22,24 @@ class VoiceInteractionCog(commands.Cog):
     def __init__(self, bot: discord.Bot) -> None:
         self.bot = bot
         self.recognizer = sr.Recognizer()
-        self.whisper_model = None
         self.voice_channels = {}  # Track active voice interactions
-        self.ai_worker = OllamaWorker()
-        self.interaction_enabled = {}  # Track servers with voice interaction enabled
+        self.ai_worker = bot.llm_worker  # Share the bot's worker so Ollama residency is tracked once
+        self.interaction_enabled = bot.state.mapping("voice_interaction", "enabled")  # Servers with voice interaction enabled, persisted
+        # Voice AI takes over mentions, replies and voice messages in guilds where it is enabled
+        dispatcher = bot.message_dispatcher
+        dispatcher.register(MessageKind.AUDIO_ATTACHMENT, "voice_ai", self._handle_voice_message, self._voice_ai_enabled, priority=10)
+        dispatcher.register(MessageKind.MENTION, "voice_ai", self._handle_mention, self._voice_ai_enabled, priority=10)
+        dispatcher.register(MessageKind.REPLY, "voice_ai", self._handle_mention, self._voice_ai_enabled, priority=10)
         
-    async def _load_whisper_model(self):
-        """Load Whisper model for offline transcription"""
-        if self.whisper_model is None:
-            try:
-                logging.info("Loading Whisper model...")
-                self.whisper_model = whisper.load_model("base")
-                logging.info("Whisper model loaded successfully")
-            except Exception as e:
-                logging.error(f"Failed to load Whisper model: {e}")
-                self.whisper_model = None
+    def memory_stats(self) -> dict:
+        """Report (count, bytes) of this cog's in-memory structures"""
+        sinks = [sink_bytes(data.get('sink')) for data in self.voice_channels.values()]
+        return {
+            # Entries reference shared discord objects, so only the tracking dicts themselves are counted
+            'voice_channels': (len(self.voice_channels), sys.getsizeof(self.voice_channels) + sum(sys.getsizeof(v) for v in self.voice_channels.values())),
+            'sink_audio_buffers': (sum(users for users, _ in sinks), sum(size for _, size in sinks)),
+            'interaction_enabled': (len(self.interaction_enabled), deep_sizeof(dict(self.interaction_enabled))),
+        }
 
     @discord.slash_command(name="voice_ai", description="Enable voice AI interaction", **default_params)
     async def enable_voice_ai(self, ctx):
@@ -104,8 +109,8 @@ class VoiceInteractionCog(commands.Cog):
 
             voice_channel = ctx.author.voice.channel
             
-            # Check if bot is in the same voice channel
-            if not hasattr(self.bot, 'voice_clients') or not self.bot.voice_clients:
+            # Check if bot is in a voice channel in this server
+            if not self.bot.voice_sessions.voice_client(ctx.guild.id):
                 await ctx.respond("❌ I need to join your voice channel first! Use `/join`")
                 return
 
@@ -135,7 +140,7 @@ class VoiceInteractionCog(commands.Cog):
             test_query = "Hello! Can you tell me a short joke?"
             logging.info(f"Testing AI with query: {test_query}")
             
-            ai_response = await self._get_ai_response(test_query)
+            ai_response = await self._get_ai_response(test_query, ctx)
             if ai_response:
                 await ctx.followup.send(f"✅ **AI Test Successful!**\n\n**Query:** {test_query}\n**Response:** {ai_response}")
             else:
@@ -151,7 +156,7 @@ class VoiceInteractionCog(commands.Cog):
             logging.info(f"Processing voice interaction: {user_query[:50]}...")
             
             # Step 1: Get AI response
-            ai_response = await self._get_ai_response(user_query)
+            ai_response = await self._get_ai_response(user_query, ctx)
             if not ai_response:
                 await ctx.followup.send("❌ Failed to get AI response")
                 return False
@@ -162,7 +167,10 @@ class VoiceInteractionCog(commands.Cog):
             else:
                 await ctx.channel.send(f"🤖 **AI Response:** {ai_response}")
 
-            # Step 3: Convert response to voice and play it
+            # Step 3: Convert response to voice and play it, unless the bot is shedding load
+            if self.bot.degradation.active(TEXT_ONLY):
+                logging.info("Voice AI answering in text only while the bot is overloaded")
+                return True
             voice_success = await self._speak_ai_response(ai_response, ctx)
             
             if voice_success:
@@ -176,12 +184,19 @@ class VoiceInteractionCog(commands.Cog):
             logging.error(f"Error in voice interaction: {e}")
             return False
 
-    async def _get_ai_response(self, query: str) -> Optional[str]:
+    async def _get_ai_response(self, query: str, ctx=None) -> Optional[str]:
         """Get AI response using Ollama or other AI service"""
         try:
             logging.info(f"Getting AI response for: {query[:50]}...")
-            # Use the existing Ollama worker
-            response = self.ai_worker.generate_response(query)
+            # Use the existing Ollama worker, within the guild's token quota
+            guild = getattr(ctx, 'guild', None)
+            author = getattr(ctx, 'author', None)
+            response, decision = await self.bot.generate_reply(
+                query, guild.id if guild else None, author.id if author else None
+            )
+            if decision.deferred:
+                logging.info("Voice AI skipped: LLM quota exhausted")
+                return None
             if response:
                 logging.info(f"AI response received: {response[:100]}...")
                 return response
@@ -211,12 +226,12 @@ class VoiceInteractionCog(commands.Cog):
                 logging.error("No voice cog found")
                 return False
 
-            # Check if bot is in voice channel
-            if not hasattr(self.bot, 'voice_clients') or not self.bot.voice_clients:
+            # Check if bot is in a voice channel in this guild
+            guild = getattr(ctx, 'guild', None)
+            voice_client = self.bot.voice_sessions.voice_client(guild.id if guild else None)
+            if not voice_client:
                 logging.error("Bot not in voice channel")
                 return False
-
-            voice_client = self.bot.voice_clients[0]
             
             # Use the simple voice cog to speak the text
             success = await voice_cog.speak_text(text, voice_client)
@@ -226,58 +241,77 @@ class VoiceInteractionCog(commands.Cog):
             logging.error(f"Error speaking AI response: {e}")
             return False
 
-    async def _transcribe_audio(self, audio_data: bytes) -> Optional[str]:
-        """Transcribe audio data to text"""
+    async def _transcribe_audio(self, audio_data: bytes, guild_id=None, user_id=None) -> Optional[str]:
+        """Transcribe audio bytes, reusing the transcript if the same audio was transcribed before"""
+        return await self.bot.transcripts.get_or_transcribe(
+            audio_data, lambda: self._transcribe_uncached(audio_data, guild_id, user_id)
+        )
+
+    async def _transcribe_uncached(self, audio_data: bytes, guild_id=None, user_id=None) -> Tuple[Optional[str], Optional[str]]:
+        """Decode audio bytes in memory and transcribe them in the bot's transcription pool.
+
+        Returns (text, Whisper engine id), with no engine for the online fallback so it is not cached.
+        """
         try:
-            # Try Whisper first (offline)
-            if self.whisper_model:
-                with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                    temp_file.write(audio_data)
-                    temp_file.flush()
-                    
-                    result = self.whisper_model.transcribe(temp_file.name)
-                    os.unlink(temp_file.name)
-                    
-                    if result and result.get('text'):
-                        return result['text'].strip()
+            audio = await self.bot.audio_decoder.decode(audio_data)
+
+            # Try Whisper first (offline), batched with other speakers' clips on the shared model
+            result = await self.bot.whisper_batcher.transcribe(audio, guild_id, user_id)
+            if result and result.get('segments'):
+                self.bot.usage.record(guild_id, user_id, "audio_seconds", result['segments'][-1]['end'])
+            if result and result.get('text'):
+                return result['text'].strip(), result.get('engine')
 
             # Fallback to Google Speech Recognition (online)
-            audio = sr.AudioData(audio_data, sample_rate=16000, sample_width=2)
-            text = self.recognizer.recognize_google(audio)
-            return text
+            audio = sr.AudioData(float32_to_pcm16(audio), sample_rate=WHISPER_RATE, sample_width=2)
+            self.bot.usage.record(guild_id, user_id, "audio_seconds", len(audio.frame_data) / (WHISPER_RATE * 2))
+            text = await self.bot.transcription.run(
+                "google", self.recognizer.recognize_google, audio, guild_id=guild_id, user_id=user_id
+            )
+            return text, None
 
         except Exception as e:
             logging.error(f"Transcription failed: {e}")
-            return None
+            return None, None
 
-    async def _handle_voice_message(self, message: discord.Message):
+    def _voice_ai_enabled(self, classified: ClassifiedMessage) -> bool:
+        """Only take over messages from guilds that turned voice AI on"""
+        guild = classified.message.guild
+        return guild is not None and guild.id in self.interaction_enabled
+
+    async def _handle_voice_message(self, classified: ClassifiedMessage):
         """Handle voice messages for transcription and AI processing"""
         try:
-            if not message.attachments:
-                return
-
-            # Simplified: process voice messages if voice AI is enabled anywhere
-            if not self.interaction_enabled:
-                return
-
-            # Process voice attachments
-            for attachment in message.attachments:
-                if attachment.content_type and 'audio' in attachment.content_type:
-                    await self._process_voice_attachment(message, attachment)
+            for attachment in classified.audio_attachments:
+                await self._process_voice_attachment(classified.message, attachment)
 
         except Exception as e:
             logging.error(f"Error handling voice message: {e}")
 
+    async def _handle_mention(self, classified: ClassifiedMessage):
+        """Answer a mention or reply through the voice AI pipeline"""
+        if classified.content:
+            await self._process_voice_interaction(classified.message, classified.content)
+
+    def cog_unload(self) -> None:
+        self.bot.message_dispatcher.unregister("voice_ai")
+
     async def _process_voice_attachment(self, message: discord.Message, attachment: discord.Attachment):
         """Process a voice attachment for AI interaction"""
         try:
+            guild_id = message.guild.id if message.guild else None
+            decision = self.bot.usage.check(guild_id, "audio_seconds")
+            if decision.deferred:
+                await message.channel.send(f"⏳ This server has used its transcription quota for now. Try again in {decision.retry_after / 60:.0f} minutes.")
+                return
+
             await message.channel.send("🎤 Processing voice message...")
             
             # Download the audio file
             audio_data = await attachment.read()
             
             # Transcribe the audio
-            transcription = await self._transcribe_audio(audio_data)
+            transcription = await self._transcribe_audio(audio_data, guild_id, message.author.id)
             if not transcription:
                 await message.channel.send("❌ Failed to transcribe voice message")
                 return
@@ -292,23 +326,5 @@ class VoiceInteractionCog(commands.Cog):
             logging.error(f"Error processing voice attachment: {e}")
             await message.channel.send(f"❌ Error processing voice message: {str(e)}")
 
-    async def on_message(self, message: discord.Message):
-        """Handle incoming messages for voice AI processing"""
-        if message.author.bot:
-            return
-
-        # Handle voice messages
-        if message.attachments:
-            await self._handle_voice_message(message)
-
-        # Handle mentions for voice AI
-        if self.bot.user in message.mentions:
-            # Simplified: process mentions if voice AI is enabled anywhere
-            if self.interaction_enabled:
-                # Process text query through voice AI
-                query = message.content.replace(f'<@{self.bot.user.id}>', '').strip()
-                if query:
-                    await self._process_voice_interaction(message, query)
-
 def setup(bot: discord.Bot) -> None:
     bot.add_cog(VoiceInteractionCog(bot))
@@ -1,22 +1,116 @@
 import discord
+import asyncio
 import logging
+import os
 from discord.ext import commands
 from utils.service.Ollama_worker import OllamaWorker
+from utils.service.task_supervisor import TaskSupervisor
+from utils.service.resource_manager import ResourceManager
+from utils.service.metrics import Metrics
+from utils.service.compute import ComputeCoordinator
+from utils.service.ffmpeg_manager import FFmpegManager
+from utils.service.voice_sessions import VoiceSessionManager
+from utils.service.message_dispatcher import ClassifiedMessage, MessageDispatcher, MessageKind
+from utils.service.usage_quota import QuotaDecision, UsageTracker
+from utils.service.state_store import StateStore
+from utils.service.whisper_models import WhisperModelManager
+from utils.service.transcription_pool import TranscriptionPool
+from utils.service.whisper_batcher import WhisperBatcher
+from utils.service.transcript_cache import TranscriptCache
+from utils.service.degradation import DegradationController
+from utils.service.audio_decode import AudioDecoder
+from utils.service.cache_profile import CacheProfile
+from utils.service.command_sync import CommandSync
 from cogs.cogs import setup_cogs
-from typing import Any
+from typing import Any, Optional, Tuple
+
+def chunk_reply(response: str, size: int = 1990) -> list:
+    """Split a reply into numbered chunks that fit in a Discord message"""
+    if len(response) <= 2000:
+        return [response]
+    chunks = [response[i:i + size] for i in range(0, len(response), size)]
+    return [f"{chunk}\n[{i + 1}/{len(chunks)}]" for i, chunk in enumerate(chunks)]
 
 class Lucia(discord.Bot):
     def __init__(self) -> None:
-        intents = discord.Intents.default()
-        intents.message_content = True
-        intents.voice_states = True  # Required for voice functionality
-        intents.guilds = True  # Required for voice channels
-        super().__init__(intents=intents)
-        self.llm_worker = OllamaWorker()
+        cache_profile = CacheProfile()
+        # Commands are synced by CommandSync on connect, only when they changed
+        super().__init__(auto_sync_commands=False, **cache_profile.client_options())
+        self.cache_profile = cache_profile
+        self.metrics = Metrics()
+        self.state = StateStore()
+        try:
+            self.state.open()
+        except Exception as e:
+            logging.error(f"Could not open state store, settings will not persist: {e}")
+        self.compute = ComputeCoordinator(self.metrics)
+        self.ffmpeg = FFmpegManager(self)
+        self.voice_sessions = VoiceSessionManager(self)
+        self.add_listener(self.voice_sessions.on_voice_state_update, "on_voice_state_update")
+        self.task_supervisor = TaskSupervisor()
+        self.resource_manager = ResourceManager()
+        self.llm_worker = OllamaWorker(resource_manager=self.resource_manager)
+        self.whisper = WhisperModelManager(self)
+        self.transcription = TranscriptionPool(self)
+        self.whisper_batcher = WhisperBatcher(self)
+        self.degradation = DegradationController(self)
+        self.transcripts = TranscriptCache(self)
+        self.audio_decoder = AudioDecoder(self)
+        self.usage = UsageTracker()
+        self.llm_reply_tokens = int(os.getenv("LLM_REPLY_TOKENS_ESTIMATE", "256"))
+        self._background = {}
+        self.message_dispatcher = MessageDispatcher(self)
+        self.message_dispatcher.register(MessageKind.MENTION, "chat", self._reply_with_llm)
+        self.message_dispatcher.register(MessageKind.REPLY, "chat", self._reply_with_llm)
+        self.before_invoke(self._before_command)
         setup_cogs(self)
+        self.command_sync = CommandSync(self)
+
+    async def close(self) -> None:
+        await self.task_supervisor.close()
+        await asyncio.to_thread(self.state.close)
+        await asyncio.to_thread(self.transcripts.close)
+        self.compute.shutdown()
+        await super().close()
+
+    def _start_background_tasks(self) -> None:
+        """Start periodic maintenance loops once; on_ready fires again after reconnects"""
+        loops = {
+            ("resources", "sweep"): lambda: self.resource_manager.run(self),
+            ("ffmpeg", "reaper"): lambda: self.ffmpeg.run(),
+            ("state", "flush"): lambda: self.state.run(),
+            ("degradation", "controller"): lambda: self.degradation.run(),
+        }
+        for (owner, name), factory in loops.items():
+            task = self._background.get((owner, name))
+            if task is None or task.done():
+                self._background[(owner, name)] = self.task_supervisor.spawn(factory(), name, owner=owner)
+
+    async def _before_command(self, ctx) -> None:
+        """Make sure the invoking guild's saved settings are in memory before a command runs"""
+        self.cache_profile.observe_invoker(ctx)
+        if ctx.guild is not None:
+            await self.state.load_guild(ctx.guild.id)
+
+    async def on_connect(self) -> None:
+        try:
+            await self.command_sync.sync()
+        except Exception as e:
+            logging.error(f"Failed to sync slash commands: {e}", exc_info=True)
+
+    async def on_guild_remove(self, guild: discord.Guild) -> None:
+        cancelled = self.whisper_batcher.cancel(guild.id) + self.transcription.cancel(guild.id)
+        if cancelled:
+            logging.info(f"Cancelled {cancelled} transcription(s) for removed guild {guild.id}")
+
+    async def on_unknown_application_command(self, interaction: discord.Interaction) -> None:
+        await self.command_sync.handle_unknown(interaction)
 
     async def on_ready(self) -> None:
         logging.info("on_ready event triggered")
+        self._start_background_tasks()
+        self.whisper.start_preload()
+        self.cache_profile.log_summary(self)
         try:
             logging.info(f"Lucia is awake, User: {self.user}")
             await self.change_presence(
@@ -39,31 +133,49 @@ class Lucia(discord.Bot):
             logging.exception("Exception in on_ready")
         logging.info("on_ready event completed")
 
+    async def generate_reply(self, prompt: str, guild_id: Optional[int],
+                             user_id: Optional[int]) -> Tuple[Optional[str], QuotaDecision]:
+        """Generate an LLM reply within the guild's token quota (None when the quota is exhausted)"""
+        decision = self.usage.check(guild_id, "llm_tokens", self.llm_reply_tokens)
+        if decision.deferred:
+            logging.info(f"LLM quota exhausted for guild {guild_id}, retry in {decision.retry_after:.0f}s")
+            return None, decision
+        # Near the limit, or while the bot is overloaded, ask for a shorter answer instead of refusing
+        max_tokens = max(32, int(decision.remaining)) if decision.action == QuotaDecision.DEGRADE else None
+        max_tokens = self.degradation.reply_tokens(max_tokens)
+        with self.degradation.track("llm"):
+            text, tokens = await asyncio.to_thread(self.llm_worker.generate, prompt, max_tokens)
+        self.usage.record(guild_id, user_id, "llm_tokens", tokens)
+        return text, decision
+
     async def on_message(self, message: discord.Message) -> None:
-        if message.author.bot or not message.content:
-            return
-        is_mentioned = self.user in message.mentions
-        is_reply = message.reference and message.reference.resolved \
-                  and message.reference.resolved.author.id == self.user.id
-        if not (is_mentioned or is_reply):
+        self.cache_profile.observe_message(message)
+        await self.message_dispatcher.dispatch(message)
+
+    async def _reply_with_llm(self, classified: ClassifiedMessage) -> None:
+        """Default pipeline for mentions and replies: answer in text with the LLM"""
+        message = classified.message
+        content = classified.content
+        if not message.content:
             return
-        content = message.content.replace(f'<@{self.user.id}>', '').strip()
         if not content:
             await message.reply("Please provide a message for me to respond to!")
             return
         logging.debug(f"Processing message from {message.author}: {content}")
         try:
             async with message.channel.typing():
-                response = self.llm_worker.generate_response(content)
-                if len(response) > 2000:
-                    chunks = [response[i:i + 1990] for i in range(0, len(response), 1990)]
-                    for i, chunk in enumerate(chunks):
-                        if i == 0:
-                            await message.reply(f"{chunk}\n[1/{len(chunks)}]")
-                        else:
-                            await message.channel.send(f"{chunk}\n[{i+1}/{len(chunks)}]")
-                else:
-                    await message.reply(response)
+                response, decision = await self.generate_reply(
+                    content, message.guild.id if message.guild else None, message.author.id
+                )
+                if response is None:
+                    await message.reply(
+                        f"⏳ This server has used its AI quota for now. Try again in {decision.retry_after / 60:.0f} minutes."
+                    )
+                    return
+                chunks = chunk_reply(response)
+                await message.reply(chunks[0])
+                for chunk in chunks[1:]:
+                    await message.channel.send(chunk)
         except Exception as e:
             logging.exception("Error in message handling")
             await message.reply(
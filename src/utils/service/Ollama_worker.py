@@ -1,13 +1,27 @@
+import asyncio
 import requests
 import logging
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
 import json
+import os
+from typing import Optional, Tuple
 
 class OllamaWorker:
-    def __init__(self, model_name="mistral", max_retries=3):
-        self.base_url = "http://localhost:11434/api/generate"
+    def __init__(self, model_name="mistral", max_retries=3, resource_manager=None):
+        self.base_url = os.getenv("OLLAMA_URL", "http://localhost:11434").rstrip("/") + "/api/generate"
         self.model_name = model_name
+        # How long Ollama keeps the model resident after a request (e.g. "5m", "-1")
+        self.keep_alive = os.getenv("OLLAMA_KEEP_ALIVE")
+        self.resource_manager = resource_manager
+        self.resource_name = f"ollama:{model_name}"
+        if resource_manager:
+            resource_manager.register(
+                self.resource_name,
+                lambda: asyncio.to_thread(self.unload_model),
+                kind="llm",
+                in_process=False
+            )
         
         # Configure session with retries
         self.session = requests.Session()
@@ -21,12 +35,22 @@ class OllamaWorker:
         self.session.mount("https://", adapter)
         
     def generate_response(self, prompt: str) -> str:
+        return self.generate(prompt)[0]
+
+    def generate(self, prompt: str, max_tokens: Optional[int] = None) -> Tuple[str, int]:
+        """Generate a reply, returning the text and the number of tokens Ollama produced"""
         try:
             payload = {
                 "model": self.model_name,
                 "prompt": prompt,
                 "stream": False
             }
+            if max_tokens:
+                payload["options"] = {"num_predict": max_tokens}
+            if self.keep_alive:
+                payload["keep_alive"] = self.keep_alive
+            if self.resource_manager:
+                self.resource_manager.touch(self.resource_name)
             logging.debug(f"Sending request to Ollama with prompt: {prompt[:100]}...")
             
             response = self.session.post(self.base_url, json=payload, timeout=30)
@@ -35,27 +59,36 @@ class OllamaWorker:
             result = response.json()
             if "error" in result:
                 logging.error(f"Ollama API error: {result['error']}")
-                return f"I encountered an error: {result['error']}"
+                return f"I encountered an error: {result['error']}", 0
                 
             generated_text = result.get("response", "").strip()
             logging.debug(f"Generated response: {generated_text[:100]}...")
-            return generated_text
+            return generated_text, result.get("eval_count", 0)
             
         except requests.exceptions.Timeout:
             logging.error("Request to Ollama timed out")
-            return "I'm sorry, but the request timed out. Please try again."
+            return "I'm sorry, but the request timed out. Please try again.", 0
             
         except requests.exceptions.ConnectionError:
             logging.error("Failed to connect to Ollama service")
-            return "I'm sorry, but I couldn't connect to the language model service. Please ensure Ollama is running."
+            return "I'm sorry, but I couldn't connect to the language model service. Please ensure Ollama is running.", 0
             
         except json.JSONDecodeError:
             logging.error("Failed to parse Ollama response")
-            return "I received an invalid response from the language model service."
+            return "I received an invalid response from the language model service.", 0
             
         except Exception as e:
-            logging.exception("Unexpected error in generate_response")
-            return f"An unexpected error occurred: {str(e)}"
+            logging.exception("Unexpected error in generate")
+            return f"An unexpected error occurred: {str(e)}", 0
             
+    def unload_model(self) -> None:
+        """Ask Ollama to release the model from memory right away"""
+        payload = {"model": self.model_name, "keep_alive": 0}
+        try:
+            self.session.post(self.base_url, json=payload, timeout=10).raise_for_status()
+            logging.info(f"Ollama model {self.model_name} unloaded")
+        except requests.exceptions.RequestException as e:
+            logging.warning(f"Failed to unload Ollama model {self.model_name}: {e}")
+
     def __del__(self):
         self.session.close()
@@ -0,0 +1,209 @@
+import asyncio
+import functools
+import io
+import logging
+import math
+import os
+import shutil
+import tempfile
+import time
+import wave
+from typing import Optional
+
+import numpy as np
+
+WHISPER_RATE = 16000  # Whisper and the Google fallback both take 16 kHz mono
+
+
+class AudioDecodeError(Exception):
+    '''Raised when attachment bytes cannot be turned into samples'''
+
+
+def sniff_format(data: bytes) -> Optional[str]:
+    """Guess the container from its magic bytes (never from a file name)"""
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        return "wav"
+    if data[:4] == b"OggS":
+        return "ogg"
+    if data[:4] == b"fLaC":
+        return "flac"
+    if data[:4] == b"\x1a\x45\xdf\xa3":
+        return "matroska"
+    if data[4:8] == b"ftyp":
+        return "mp4"
+    if data[:3] == b"ID3" or (len(data) > 1 and data[0] == 0xFF and data[1] & 0xE0 == 0xE0):
+        return "mp3"
+    return None
+
+
+def pcm16_to_float32(pcm, channels: int = 1) -> np.ndarray:
+    """Interleaved 16-bit PCM (bytes or an int16 array view) to mono float32 in [-1, 1]"""
+    samples = np.frombuffer(pcm, dtype=np.int16) if not isinstance(pcm, np.ndarray) else pcm
+    if channels > 1:
+        samples = samples[: len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    return samples.astype(np.float32) / 32768.0
+
+
+def float32_to_pcm16(audio: np.ndarray) -> bytes:
+    """Mono float32 samples back to 16-bit PCM (for recognizers that take raw bytes)"""
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+
+
+class PolyphaseResampler:
+    '''
+    Rational-ratio resampler (e.g. 48 kHz -> 16 kHz is 1/3, 44.1 kHz -> 16 kHz is 160/441).
+
+    A Kaiser-windowed sinc low-pass is split into `up` phase filters, so each output sample is
+    one short dot product against a strided window of the input instead of filtering a
+    zero-stuffed signal at the upsampled rate.
+    '''
+
+    HALF_TAPS = 16  # Filter half-length in output-rate periods; ~85 dB stopband with beta 8.6
+    BLOCK = 16384  # Outputs per vectorized block, bounding temporary memory
+
+    def __init__(self, rate: int, target: int) -> None:
+        g = math.gcd(rate, target)
+        self.up, self.down = target // g, rate // g
+        factor = max(self.up, self.down)
+        length = 2 * self.HALF_TAPS * factor + 1
+        n = np.arange(length) - (length - 1) / 2
+        taps = np.sinc(n / factor) * np.kaiser(length, 8.6)
+        taps *= self.up / taps.sum()  # Unity gain once the zero-stuffing is accounted for
+        self.delay = (length - 1) // 2
+        self.width = -(-length // self.up)
+        bank = np.zeros(self.up * self.width)
+        bank[:length] = taps
+        # bank[p, k] = taps[k * up + p], reversed so it lines up with an ascending input window
+        self.bank = bank.reshape(self.width, self.up).T[:, ::-1].astype(np.float32).copy()
+
+    def __call__(self, audio: np.ndarray) -> np.ndarray:
+        if len(audio) == 0:
+            return audio.astype(np.float32)
+        count = -(-len(audio) * self.up // self.down)
+        padded = np.concatenate([
+            np.zeros(self.width - 1, dtype=np.float32), np.asarray(audio, dtype=np.float32),
+            np.zeros(self.width + self.delay // self.up + 1, dtype=np.float32),
+        ])
+        windows = np.lib.stride_tricks.sliding_window_view(padded, self.width)  # Views, no copies
+        out = np.empty(count, dtype=np.float32)
+        if self.up == 1:
+            # Pure decimation: every output uses the same filter on an evenly strided window
+            strided = windows[self.delay::self.down][:count]
+            for start in range(0, count, self.BLOCK):
+                np.matmul(strided[start:start + self.BLOCK], self.bank[0], out=out[start:start + self.BLOCK])
+            return out
+        for start in range(0, count, self.BLOCK):
+            positions = np.arange(start, min(count, start + self.BLOCK)) * self.down + self.delay
+            phases = positions % self.up
+            out[start:start + len(positions)] = np.einsum("ij,ij->i", windows[positions // self.up], self.bank[phases])
+        return out
+
+
+@functools.lru_cache(maxsize=16)
+def _resampler(rate: int, target: int) -> PolyphaseResampler:
+    return PolyphaseResampler(rate, target)
+
+
+def resample(audio: np.ndarray, rate: int, target: int = WHISPER_RATE) -> np.ndarray:
+    """Resample mono float32 samples with a cached polyphase filter"""
+    if rate == target or len(audio) == 0:
+        return audio
+    return _resampler(rate, target)(audio)
+
+
+def decode_wav(data: bytes) -> np.ndarray:
+    """Decode integer PCM WAV without FFmpeg; raises wave.Error for other encodings"""
+    with wave.open(io.BytesIO(data), "rb") as f:
+        channels, width, rate = f.getnchannels(), f.getsampwidth(), f.getframerate()
+        frames = f.readframes(f.getnframes())
+    if width == 2:
+        samples = np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32768.0
+    elif width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 4:
+        samples = np.frombuffer(frames, dtype=np.int32).astype(np.float32) / 2147483648.0
+    elif width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+        packed = raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8) | (raw[:, 2].astype(np.int32) << 16)
+        samples = ((packed << 8) >> 8).astype(np.float32) / 8388608.0  # Sign-extend 24-bit
+    else:
+        raise wave.Error(f"Unsupported sample width {width}")
+    if channels > 1:
+        samples = samples[: len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    return resample(samples, rate)
+
+
+class AudioDecoder:
+    '''
+    Turns attachment bytes into the 16 kHz mono float32 arrays Whisper consumes.
+
+    Integer PCM WAV is decoded natively. Everything else (Ogg/Opus voice messages, MP3,
+    M4A, WebM, float WAV) is piped through FFmpeg under the "ffmpeg" compute limit, with the
+    container named from its magic bytes. Nothing touches the disk, except MP4/M4A files
+    whose index sits at the end, which FFmpeg can only read from a seekable file.
+    '''
+
+    def __init__(self, bot) -> None:
+        self.bot = bot
+        self.ffmpeg = os.getenv("FFMPEG_PATH") or shutil.which("ffmpeg") or "ffmpeg"
+        self.timeout = float(os.getenv("AUDIO_DECODE_TIMEOUT", "30"))
+
+    def from_pcm(self, pcm, rate: int, channels: int = 1) -> np.ndarray:
+        """Raw 16-bit PCM (bytes, or an int16 view of a recording buffer) to 16 kHz mono float32"""
+        return resample(pcm16_to_float32(pcm, channels), rate)
+
+    async def decode(self, data: bytes) -> np.ndarray:
+        """Decode attachment bytes to 16 kHz mono float32; raises AudioDecodeError"""
+        if not data:
+            raise AudioDecodeError("The audio file is empty")
+        fmt = sniff_format(data)
+        start = time.perf_counter()
+        if fmt == "wav":
+            try:
+                audio = await asyncio.to_thread(decode_wav, data)
+                self.bot.metrics.observe("audio.decode.native", time.perf_counter() - start)
+                return audio
+            except (wave.Error, EOFError) as e:
+                logging.debug(f"Native WAV decode failed ({e}), using FFmpeg")
+        audio = await self._decode_ffmpeg(data, fmt)
+        self.bot.metrics.observe(f"audio.decode.ffmpeg.{fmt or 'unknown'}", time.perf_counter() - start)
+        return audio
+
+    async def _run_ffmpeg(self, source: str, data: Optional[bytes], fmt: Optional[str]) -> bytes:
+        args = [self.ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error"]
+        if fmt and fmt != "mp4":
+            args += ["-f", fmt]
+        args += ["-i", source, "-vn", "-f", "s16le", "-ac", "1", "-ar", str(WHISPER_RATE), "pipe:1"]
+        async with self.bot.compute.slot("ffmpeg"):
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *args, stdin=asyncio.subprocess.PIPE if data is not None else asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+                )
+            except FileNotFoundError:
+                raise AudioDecodeError("FFmpeg is not installed, only WAV audio can be read") from None
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(data), self.timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                raise AudioDecodeError(f"Decoding took longer than {self.timeout:g}s") from None
+        if process.returncode != 0:
+            raise AudioDecodeError(stderr.decode(errors="replace").strip().splitlines()[-1] if stderr else "FFmpeg failed")
+        return stdout
+
+    async def _decode_ffmpeg(self, data: bytes, fmt: Optional[str]) -> np.ndarray:
+        try:
+            pcm = await self._run_ffmpeg("pipe:0", data, fmt)
+        except AudioDecodeError:
+            if fmt != "mp4":
+                raise
+            # The moov atom is at the end of the file, which a pipe cannot seek to
+            self.bot.metrics.incr("audio.decode.seekable_fallback")
+            with tempfile.NamedTemporaryFile(suffix=".m4a") as temp_file:
+                temp_file.write(data)
+                temp_file.flush()
+                pcm = await self._run_ffmpeg(temp_file.name, None, fmt)
+        if not pcm:
+            raise AudioDecodeError("The file contains no audio")
+        return pcm16_to_float32(pcm)
@@ -0,0 +1,138 @@
+import logging
+import os
+import sys
+from typing import Dict, Set, Tuple
+
+import discord
+
+DEFAULT_MAX_MESSAGES = 1000  # Size of discord's message cache when left at its default
+_SAMPLE_EVERY = 16  # Size one message in this many for the running average
+
+
+def _model_bytes(obj) -> int:
+    """Approximate the bytes held by one cached discord model, without following links to other models"""
+    total = sys.getsizeof(obj)
+    for cls in type(obj).__mro__:
+        slots = getattr(cls, "__slots__", ())
+        for slot in (slots,) if isinstance(slots, str) else slots:
+            value = getattr(obj, slot, None)
+            if isinstance(value, (str, bytes, list, tuple, dict, set, frozenset)):
+                total += sys.getsizeof(value)
+                if isinstance(value, (list, tuple, set, frozenset)):
+                    total += sum(sys.getsizeof(v) for v in value if isinstance(v, (str, int)))
+    return total
+
+
+class _RunningMean:
+    def __init__(self) -> None:
+        self.total = 0
+        self.count = 0
+
+    def add(self, value: int) -> None:
+        self.total += value
+        self.count += 1
+
+    @property
+    def value(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class CacheProfile:
+    '''
+    Discord client cache settings, and what they cost per guild.
+
+    With LOW_MEMORY_MODE=true only the intents Lucia uses are requested (guilds, voice states,
+    messages and their content), the message cache is off and only members sitting in voice
+    channels are cached. Cogs fetch users and members when a command needs them. To report the
+    saving, the profile keeps a cheap estimate of what the default caches would have held.
+    '''
+
+    def __init__(self) -> None:
+        self.low_memory = os.getenv("LOW_MEMORY_MODE", "false").lower() == "true"
+        self.max_messages = int(os.getenv("LOW_MEMORY_MAX_MESSAGES", "0")) if self.low_memory else DEFAULT_MAX_MESSAGES
+        self.messages_seen: Dict[int, int] = {}
+        self.invokers: Dict[int, Set[int]] = {}
+        self._message_bytes = _RunningMean()
+        self._member_bytes = _RunningMean()
+
+    def client_options(self) -> dict:
+        """Keyword arguments for discord.Bot matching the configured mode"""
+        if not self.low_memory:
+            intents = discord.Intents.default()
+            intents.message_content = True
+            intents.voice_states = True  # Required for voice functionality
+            intents.guilds = True  # Required for voice channels
+            return {"intents": intents}
+        intents = discord.Intents.none()
+        intents.guilds = True  # Channels and roles, needed to join voice
+        intents.voice_states = True  # Who is in which voice channel
+        intents.guild_messages = True  # Mentions, replies and voice messages
+        intents.dm_messages = True
+        intents.message_content = True
+        member_cache = discord.MemberCacheFlags.none()
+        member_cache.voice = True  # Listener checks and auto-transcription look at voice channel members
+        return {
+            "intents": intents,
+            "max_messages": self.max_messages or None,  # discord treats 0 as "use the default"
+            "member_cache_flags": member_cache,
+        }
+
+    def observe_message(self, message: discord.Message) -> None:
+        """Count a received message toward the estimate of what the default message cache would hold"""
+        if not self.low_memory:
+            return
+        guild_id = message.guild.id if message.guild else 0
+        seen = self.messages_seen.get(guild_id, 0)
+        self.messages_seen[guild_id] = seen + 1
+        if seen % _SAMPLE_EVERY == 0:
+            self._message_bytes.add(_model_bytes(message))
+
+    def observe_invoker(self, ctx) -> None:
+        """Remember a command invoker, whom the default member cache would have kept"""
+        if not self.low_memory or ctx.guild is None:
+            return
+        invokers = self.invokers.setdefault(ctx.guild.id, set())
+        if ctx.author.id not in invokers:
+            invokers.add(ctx.author.id)
+            self._member_bytes.add(_model_bytes(ctx.author))
+
+    def footprint(self, bot: discord.Bot) -> Dict[int, Tuple[int, int, int]]:
+        """Return (cached members, cached messages, approximate bytes) per guild"""
+        messages: Dict[int, list] = {}
+        for message in bot.cached_messages:
+            if message.guild is not None:
+                messages.setdefault(message.guild.id, []).append(message)
+        result = {}
+        for guild in bot.guilds:
+            members = guild._members.values()
+            cached = messages.get(guild.id, [])
+            size = sum(_model_bytes(m) for m in members) + sum(_model_bytes(m) for m in cached)
+            result[guild.id] = (len(members), len(cached), size)
+        return result
+
+    def savings(self, bot: discord.Bot) -> Dict[int, int]:
+        """Estimate the bytes per guild that default caching would hold on top of the low-memory caches"""
+        if not self.low_memory:
+            return {}
+        total_seen = sum(self.messages_seen.values())
+        default_window = min(total_seen, DEFAULT_MAX_MESSAGES)
+        kept = min(total_seen, self.max_messages)
+        result = {}
+        for guild in bot.guilds:
+            share = self.messages_seen.get(guild.id, 0) / total_seen if total_seen else 0.0
+            messages = share * (default_window - kept) * self._message_bytes.value
+            extra_members = len(self.invokers.get(guild.id, set()) - guild._members.keys())
+            result[guild.id] = int(messages + extra_members * self._member_bytes.value)
+        return result
+
+    def log_summary(self, bot: discord.Bot) -> None:
+        if not self.low_memory:
+            return
+        footprint = self.footprint(bot)
+        if not footprint:
+            return
+        cached = sum(size for _, _, size in footprint.values()) / len(footprint)
+        logging.info(
+            f"Low-memory mode: {len(footprint)} guilds, ~{cached / 1024:.1f} KiB cached per guild, "
+            f"message cache {self.max_messages or 'off'}, only voice members cached"
+        )
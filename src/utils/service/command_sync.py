@@ -0,0 +1,79 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict
+
+import discord
+
+
+def _command_key(command) -> str:
+    return f"{command.type}:{command.name}:{','.join(str(g) for g in sorted(command.guild_ids or ()))}"
+
+
+class CommandSync:
+    '''
+    Slash-command registration that is skipped when nothing changed.
+
+    The full command payload is hashed and stored in the state store with the ids Discord
+    assigned at the last sync. When the next connect produces the same hash, those ids are
+    restored locally and no HTTP call is made. Otherwise pycord's sync runs, which compares
+    with what Discord has and uploads only when something differs.
+    '''
+
+    def __init__(self, bot: discord.Bot) -> None:
+        self.bot = bot
+        self.force = os.getenv("FORCE_COMMAND_SYNC", "false").lower() == "true"
+        self.last_result = "not synced"
+        self._resynced = False
+
+    def payload_hash(self) -> str:
+        """Hash every pending command as it would be sent to Discord, plus the application it belongs to"""
+        payload = sorted(
+            (dict(command.to_dict(), guild_ids=sorted(command.guild_ids or ())) for command in self.bot.pending_application_commands),
+            key=lambda data: (data.get("type", 1), data["name"], data["guild_ids"]),
+        )
+        data = json.dumps({"application": self.bot.application_id, "commands": payload}, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def _restore_ids(self, ids: Dict[str, int]) -> bool:
+        """Give every pending command its id from the last sync; False if any is missing"""
+        commands = self.bot.pending_application_commands
+        if any(_command_key(command) not in ids for command in commands):
+            return False
+        for command in commands:
+            command.id = ids[_command_key(command)]
+            self.bot._application_commands[command.id] = command
+        return True
+
+    async def sync(self, force: bool = False) -> bool:
+        """Register commands unless they match the last sync; returns whether Discord was contacted"""
+        start = time.perf_counter()
+        digest = self.payload_hash()
+        saved = self.bot.state.get(None, "commands", "sync")
+        if not (force or self.force) and saved and saved.get("hash") == digest and self._restore_ids(saved.get("ids", {})):
+            self.last_result = f"skipped, unchanged since {time.strftime('%Y-%m-%d %H:%M', time.localtime(saved.get('synced_at', 0)))}"
+            self.bot.metrics.incr("commands.sync_skipped")
+            logging.info(f"Slash commands unchanged ({digest[:12]}), skipping sync")
+            return False
+
+        await self.bot.sync_commands()
+        ids = {_command_key(command): command.id for command in self.bot.pending_application_commands if command.id}
+        self.bot.state.set(None, "commands", "sync", {"hash": digest, "ids": ids, "synced_at": time.time()})
+        self.last_result = f"synced {len(ids)} command(s)"
+        self.bot.metrics.incr("commands.synced")
+        self.bot.metrics.observe("commands.sync", time.perf_counter() - start)
+        logging.info(f"Slash commands synced ({digest[:12]}) in {time.perf_counter() - start:.2f}s")
+        return True
+
+    async def handle_unknown(self, interaction: discord.Interaction) -> None:
+        """An interaction named a command id we do not know: the saved ids are stale, so sync once"""
+        if self._resynced:
+            return
+        self._resynced = True
+        logging.warning(f"Unknown application command {interaction.data.get('name') if interaction.data else None}, re-syncing")
+        try:
+            await self.sync(force=True)
+        except Exception as e:
+            logging.error(f"Command re-sync failed: {e}")
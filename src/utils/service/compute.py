@@ -0,0 +1,200 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Set
+
+from utils.service.metrics import Metrics
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+
+def detect_cores() -> Set[int]:
+    """Return the set of CPU cores this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return set(os.sched_getaffinity(0))
+    return set(range(os.cpu_count() or 1))
+
+
+class ComputeCoordinator:
+    '''
+    Share a CPU-only host between real-time audio and heavy inference.
+
+    Sizes torch's thread pools to the detected cores, caps how many CPU-heavy jobs of each
+    kind run at once, and keeps heavy worker threads off the core reserved for the event
+    loop and FFmpeg playback (and at a lower scheduling priority).
+    '''
+
+    KINDS = ("whisper", "rvc", "ffmpeg")
+
+    def __init__(self, metrics: Metrics) -> None:
+        self.metrics = metrics
+        self.cores = sorted(detect_cores())
+        count = len(self.cores)
+        # Keep one core for the event loop and playback once there are enough to spare
+        reserved = 1 if count > 2 else 0
+        self.realtime_cores = set(self.cores[:reserved])
+        self.heavy_cores = set(self.cores[reserved:]) or set(self.cores)
+        self.heavy_nice = int(os.getenv("COMPUTE_HEAVY_NICE", "10"))
+        self.torch_threads = int(os.getenv("TORCH_THREADS", str(max(1, len(self.heavy_cores)))))
+        self.torch_interop_threads = int(os.getenv("TORCH_INTEROP_THREADS", "1"))
+        default_limits = {
+            "whisper": max(1, len(self.heavy_cores) // 4),
+            "rvc": 1,
+            "ffmpeg": max(2, count * 2),
+        }
+        self.limits = {
+            kind: int(os.getenv(f"COMPUTE_LIMIT_{kind.upper()}", str(default)))
+            for kind, default in default_limits.items()
+        }
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._active = {kind: 0 for kind in self.KINDS}
+        self._waiting = {kind: 0 for kind in self.KINDS}
+        # Heavy jobs get their own threads so light default-executor work (DNS, file I/O) keeps normal priority
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.limits["whisper"] + self.limits["rvc"],
+            thread_name_prefix="compute-heavy",
+            initializer=self.prepare_heavy_thread
+        )
+
+        self.metrics.set_gauge("compute.cores", count)
+        self.metrics.set_gauge("compute.realtime_cores", sorted(self.realtime_cores))
+        for kind, limit in self.limits.items():
+            self.metrics.set_gauge(f"compute.{kind}.limit", limit)
+        self.configure_torch()
+        logging.info(
+            f"Compute coordinator: {count} cores, torch threads {self.torch_threads}/{self.torch_interop_threads}, "
+            f"limits {self.limits}, realtime cores {sorted(self.realtime_cores)}"
+        )
+
+    def configure_torch(self) -> None:
+        """Apply the intra/inter-op thread counts to torch, if it is installed"""
+        if torch is None:
+            return
+        torch.set_num_threads(self.torch_threads)
+        try:
+            torch.set_num_interop_threads(self.torch_interop_threads)
+        except RuntimeError:
+            # Can only be set before torch starts any inter-op work
+            logging.warning("torch inter-op thread count already fixed, leaving it unchanged")
+        self.metrics.set_gauge("compute.torch_threads", torch.get_num_threads())
+        self.metrics.set_gauge("compute.torch_interop_threads", torch.get_num_interop_threads())
+
+    def _semaphore(self, kind: str) -> asyncio.Semaphore:
+        if kind not in self._semaphores:
+            self._semaphores[kind] = asyncio.Semaphore(self.limits[kind])
+        return self._semaphores[kind]
+
+    async def _acquire(self, kind: str) -> None:
+        semaphore = self._semaphore(kind)
+        self._waiting[kind] += 1
+        self.metrics.set_gauge(f"compute.{kind}.waiting", self._waiting[kind])
+        start = time.perf_counter()
+        try:
+            await semaphore.acquire()
+        finally:
+            self._waiting[kind] -= 1
+            self.metrics.set_gauge(f"compute.{kind}.waiting", self._waiting[kind])
+        self.metrics.observe(f"compute.{kind}.wait", time.perf_counter() - start)
+        self._active[kind] += 1
+        self.metrics.set_gauge(f"compute.{kind}.active", self._active[kind])
+        self.metrics.incr(f"compute.{kind}.jobs")
+
+    def _release(self, kind: str) -> None:
+        self._active[kind] -= 1
+        self.metrics.set_gauge(f"compute.{kind}.active", self._active[kind])
+        self._semaphore(kind).release()
+
+    def waiting(self, kind: str) -> int:
+        return self._waiting[kind]
+
+    def active(self, kind: str) -> int:
+        return self._active[kind]
+
+    @contextlib.asynccontextmanager
+    async def slot(self, kind: str) -> AsyncIterator[None]:
+        """Hold one of the limited slots for a CPU-heavy job of the given kind"""
+        await self._acquire(kind)
+        try:
+            yield
+        finally:
+            self._release(kind)
+
+    def prepare_heavy_thread(self) -> None:
+        """Lower the calling worker thread's priority and move it off the realtime cores"""
+        if not sys.platform.startswith("linux"):
+            return
+        try:
+            if self.realtime_cores:
+                os.sched_setaffinity(0, self.heavy_cores)  # 0 = calling thread on Linux
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.heavy_nice)
+            self.metrics.incr("compute.heavy_threads_deprioritized")
+        except OSError as e:
+            logging.debug(f"Could not deprioritize worker thread: {e}")
+
+    def heavy_preexec(self) -> None:
+        """`preexec_fn` for CPU-heavy subprocesses (e.g. local RVC inference)"""
+        if self.realtime_cores:
+            os.sched_setaffinity(0, self.heavy_cores)
+        os.nice(self.heavy_nice)
+
+    def subprocess_kwargs(self) -> Dict[str, Any]:
+        """Extra subprocess arguments that deprioritize a CPU-heavy child process"""
+        if sys.platform.startswith("linux"):
+            return {"preexec_fn": self.heavy_preexec}
+        return {}
+
+    def prioritize_realtime(self, pid: Optional[int]) -> None:
+        """Give a real-time audio process (FFmpeg playback) the best priority we are allowed to"""
+        if pid is None or not sys.platform.startswith("linux"):
+            return
+        try:
+            os.setpriority(os.PRIO_PROCESS, pid, -5)
+            self.metrics.incr("compute.realtime_boosted")
+        except OSError:
+            # Unprivileged processes cannot raise priority; heavy work is niced instead
+            self.metrics.incr("compute.realtime_boost_denied")
+
+    def realtime_source(self, source):
+        """Apply real-time priority to the FFmpeg process behind an audio source and return it"""
+        process = getattr(source, "_process", None)
+        self.prioritize_realtime(getattr(process, "pid", None))
+        return source
+
+    async def start(self, kind: str, func: Callable, *args: Any, **kwargs: Any) -> asyncio.Future:
+        """Wait for a slot, then start a blocking call in a deprioritized thread and return its future.
+
+        The slot is held until the thread returns, even if nobody awaits the future any more:
+        a running call cannot be interrupted, so giving its slot away would oversubscribe the cores.
+        """
+        await self._acquire(kind)
+        start = time.perf_counter()
+
+        def finished(_: asyncio.Future) -> None:
+            self.metrics.observe(f"compute.{kind}.run", time.perf_counter() - start)
+            self._release(kind)
+
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        except BaseException:
+            self._release(kind)
+            raise
+        future.add_done_callback(finished)
+        return future
+
+    async def run(self, kind: str, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Run a blocking CPU-heavy call in a deprioritized thread under the kind's slot limit"""
+        future = await self.start(kind, func, *args, **kwargs)
+        # Cancelling the caller leaves the thread running; it keeps its slot until it returns
+        return await asyncio.shield(future)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
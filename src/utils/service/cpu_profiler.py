@@ -0,0 +1,200 @@
+import collections
+import json
+import os
+import sys
+import threading
+import time
+from typing import Counter, Dict, List, Optional, Tuple
+
+# A thread that used less CPU than this share of the wall time since its last sample was blocked
+BUSY_CPU_SHARE = 0.25
+
+# Leaf frames that mean a thread is blocked, for platforms without per-thread CPU clocks
+_IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("selectors.py", "EpollSelector.select"),
+    ("selectors.py", "SelectSelector.select"),
+    ("selectors.py", "KqueueSelector.select"),
+    ("threading.py", "wait"),
+    ("threading.py", "Condition.wait"),
+    ("threading.py", "Event.wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("threading.py", "Thread._wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("queue.py", "Queue.get"),
+    ("thread.py", "_worker"),  # Idle ThreadPoolExecutor worker in SimpleQueue.get
+    ("socket.py", "readinto"),
+    ("socket.py", "SocketIO.readinto"),
+    ("ssl.py", "read"),
+    ("ssl.py", "SSLSocket.read"),
+}
+
+Frame = Tuple[str, str, int]  # (qualified name, file, first line)
+
+
+def _frame_key(frame) -> Frame:
+    code = frame.f_code
+    return (getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno)
+
+
+def _frame_label(key: Frame) -> str:
+    name, filename, line = key
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+class ProfileResult:
+    '''Aggregated stack samples from one profiling run'''
+
+    def __init__(self, stacks: Counter, idle: Counter, duration: float, interval: float, samples: int) -> None:
+        self.stacks = stacks  # (thread name, frames root→leaf) -> sample count
+        self.idle = idle  # Same keys -> samples taken while the thread was blocked
+        self.duration = duration
+        self.interval = interval
+        self.samples = samples
+
+    @staticmethod
+    def is_idle(frames: Tuple[Frame, ...]) -> bool:
+        if not frames:
+            return True
+        name, filename, _ = frames[-1]
+        return (os.path.basename(filename), name) in _IDLE_LEAVES
+
+    def busy_stacks(self, include_idle: bool = False) -> Dict[Tuple[str, Tuple[Frame, ...]], int]:
+        if include_idle:
+            return dict(self.stacks)
+        return {key: count - self.idle[key] for key, count in self.stacks.items() if count > self.idle[key]}
+
+    def top_functions(self, limit: int = 15, include_idle: bool = False) -> List[Tuple[str, int, int]]:
+        """Return (label, self samples, total samples) for the hottest functions"""
+        self_counts: Counter = collections.Counter()
+        total_counts: Counter = collections.Counter()
+        for (_, frames), count in self.busy_stacks(include_idle).items():
+            if not frames:
+                continue
+            self_counts[frames[-1]] += count
+            for frame in set(frames):
+                total_counts[frame] += count
+        ranked = sorted(total_counts, key=lambda f: (self_counts[f], total_counts[f]), reverse=True)
+        return [(_frame_label(f), self_counts[f], total_counts[f]) for f in ranked[:limit]]
+
+    def collapsed(self, include_idle: bool = False) -> str:
+        """Brendan Gregg collapsed stacks (thread;root;...;leaf count), readable by speedscope and flamegraph.pl"""
+        lines = []
+        for (thread, frames), count in sorted(self.busy_stacks(include_idle).items(), key=lambda item: -item[1]):
+            path = ";".join([thread] + [_frame_label(f).replace(";", ":") for f in frames])
+            lines.append(f"{path} {count}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, include_idle: bool = False) -> str:
+        """Speedscope JSON with one sampled profile per thread"""
+        frames: List[Dict[str, object]] = []
+        frame_index: Dict[Frame, int] = {}
+        per_thread: Dict[str, List[Tuple[List[int], int]]] = collections.defaultdict(list)
+        for (thread, stack), count in self.busy_stacks(include_idle).items():
+            indices = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                indices.append(frame_index[frame])
+            per_thread[thread].append((indices, count))
+        profiles = []
+        for thread, samples in per_thread.items():
+            weights = [count * self.interval for _, count in samples]
+            profiles.append({
+                "type": "sampled",
+                "name": thread,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": [indices for indices, _ in samples],
+                "weights": weights,
+            })
+        return json.dumps({
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+            "name": "Lucia CPU profile",
+            "exporter": "lucia-sampling-profiler",
+        })
+
+
+class SamplingProfiler:
+    '''
+    Low-overhead wall-clock sampler over every Python thread in the process.
+
+    Call `run` from a worker thread; it samples all other threads' stacks at a fixed
+    interval until the duration elapses. Native code (torch kernels, FFmpeg) is attributed
+    to the Python frame that called into it. A sample counts as idle when the thread's CPU
+    clock barely moved since its previous sample, whatever call it is blocked in.
+    '''
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 128) -> None:
+        self.interval = interval
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def run(self, duration: float) -> ProfileResult:
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running")
+        try:
+            return self._sample(duration)
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def _cpu_time(thread_id: int) -> Optional[float]:
+        """CPU seconds a thread has used, or None where per-thread clocks are unavailable"""
+        try:
+            return time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+        except (AttributeError, OSError):  # Windows, or the thread just exited
+            return None
+
+    def _sample(self, duration: float) -> ProfileResult:
+        own_id = threading.get_ident()
+        stacks: Counter = collections.Counter()
+        idle: Counter = collections.Counter()
+        previous: Dict[int, Tuple[float, float, bool]] = {}  # Thread -> (wall, CPU, blocked) at its last reading
+        samples = 0
+        start = time.perf_counter()
+        deadline = start + duration
+        next_tick = start
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                frames = []
+                while frame is not None and len(frames) < self.max_depth:
+                    frames.append(_frame_key(frame))
+                    frame = frame.f_back
+                frames.reverse()
+                key = (names.get(thread_id, f"thread-{thread_id}"), tuple(frames))
+                stacks[key] += 1
+                cpu = self._cpu_time(thread_id)
+                last = previous.get(thread_id)
+                if cpu is None or last is None:
+                    blocked = ProfileResult.is_idle(key[1])
+                elif now - last[0] < self.interval / 2:
+                    blocked = last[2]  # A late tick right after the previous one; too short to measure
+                else:
+                    blocked = cpu - last[1] < BUSY_CPU_SHARE * (now - last[0])
+                if cpu is not None and (last is None or now - last[0] >= self.interval / 2):
+                    previous[thread_id] = (now, cpu, blocked)
+                if blocked:
+                    idle[key] += 1
+            samples += 1
+            next_tick += self.interval
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.perf_counter()
+        return ProfileResult(stacks, idle, time.perf_counter() - start, self.interval, samples)
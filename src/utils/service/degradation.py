@@ -0,0 +1,175 @@
+import asyncio
+import contextlib
+import itertools
+import logging
+import os
+import statistics
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, Iterator, Optional, Tuple
+
+# Each level keeps every degradation below it
+NORMAL, SMALLER_WHISPER, GREEDY_DECODING, SHORT_LLM, EDGE_TTS, TEXT_ONLY = range(6)
+LEVELS = (
+    "normal",
+    "smaller Whisper model",
+    "greedy decoding",
+    "shorter LLM replies",
+    "Edge TTS instead of RVC",
+    "text-only replies",
+)
+
+SMALLER_MODEL = {
+    "large": "medium", "large-v1": "medium", "large-v2": "medium", "large-v3": "medium", "turbo": "small",
+    "medium": "small", "small": "base", "base": "tiny",
+}
+
+
+def smaller_whisper_model(name: str) -> Optional[str]:
+    """The next Whisper size down ("small.en" -> "base.en"), or None below tiny"""
+    base, dot, suffix = name.partition(".")
+    smaller = SMALLER_MODEL.get(base)
+    return f"{smaller}{dot}{suffix}" if smaller else None
+
+
+class DegradationController:
+    '''
+    Trades quality for latency when voice traffic outgrows the host, and back when it passes.
+
+    Every few seconds the controller measures pressure on the three voice stages: the
+    transcription pool (queue depth and how long jobs wait for a worker), LLM calls and TTS
+    calls (how many are in flight), plus the median latency of each stage's jobs completed in
+    the last `DEGRADE_WINDOW` seconds against its SLO. One slow job therefore cannot degrade
+    every guild on its own. Pressure above 1 steps one level down the ladder in `LEVELS`, at
+    most once per `DEGRADE_STEP_SECONDS`; pressure below half, held for
+    `DEGRADE_RECOVERY_SECONDS`, steps one level back up. Callers ask for the current level at
+    their decision points, so a transition only affects work that starts after it.
+    '''
+
+    def __init__(self, bot) -> None:
+        self.bot = bot
+        self.max_level = max(0, min(TEXT_ONLY, int(os.getenv("DEGRADE_MAX_LEVEL", str(TEXT_ONLY)))))
+        self.interval = float(os.getenv("DEGRADE_INTERVAL", "2"))
+        self.recovery = float(os.getenv("DEGRADE_RECOVERY_SECONDS", "30"))
+        self.step_down = float(os.getenv("DEGRADE_STEP_SECONDS", "15"))
+        self.window = float(os.getenv("DEGRADE_WINDOW", "30"))
+        self.min_samples = max(1, int(os.getenv("DEGRADE_MIN_SAMPLES", "3")))
+        self.slo = {
+            "stt": float(os.getenv("DEGRADE_STT_SLO", "10")),
+            "llm": float(os.getenv("DEGRADE_LLM_SLO", "15")),
+            "tts": float(os.getenv("DEGRADE_TTS_SLO", "10")),
+        }
+        self.max_inflight = max(1, int(os.getenv("DEGRADE_MAX_INFLIGHT", "4")))
+        self.degraded_model = os.getenv("WHISPER_DEGRADED_MODEL") or None
+        self.short_reply_tokens = int(os.getenv("DEGRADED_LLM_TOKENS", "96"))
+        self.level = NORMAL
+        self.since = time.monotonic()
+        self._calm_since: Optional[float] = None
+        self._inflight: Dict[str, Dict[int, float]] = {"llm": {}, "tts": {}}
+        self._latencies: Dict[str, Deque[Tuple[float, float]]] = {stage: deque(maxlen=512) for stage in self._inflight}
+        self._ids = itertools.count()
+        self.transitions = 0
+
+    def active(self, level: int) -> bool:
+        """Whether the degradation at `level` is currently applied"""
+        return self.level >= level
+
+    @contextlib.contextmanager
+    def track(self, stage: str) -> Iterator[None]:
+        """Count a block as in-flight work of an LLM or TTS stage"""
+        token = next(self._ids)
+        self._inflight[stage][token] = time.monotonic()
+        try:
+            yield
+        finally:
+            start = self._inflight[stage].pop(token, None)
+            if start is not None:
+                now = time.monotonic()
+                self._latencies[stage].append((now, now - start))
+
+    def whisper_profile(self) -> Tuple[Optional[str], dict]:
+        """Model name (None = configured) and decoding options Whisper should use right now"""
+        name = None
+        if self.active(SMALLER_WHISPER):
+            smaller = self._smaller_model()
+            # Keep using the loaded model until the smaller one is ready, so no request waits on its load
+            if smaller and self.bot.whisper.prepare(smaller):
+                name = smaller
+        options = {"temperature": 0.0} if self.active(GREEDY_DECODING) else {}
+        return name, options
+
+    def _smaller_model(self) -> Optional[str]:
+        return self.degraded_model or smaller_whisper_model(self.bot.whisper.default_name)
+
+    def reply_tokens(self, max_tokens: Optional[int]) -> Optional[int]:
+        """Cap an LLM reply's token budget while replies are shortened"""
+        if not self.active(SHORT_LLM):
+            return max_tokens
+        return min(max_tokens, self.short_reply_tokens) if max_tokens else self.short_reply_tokens
+
+    def _latency(self, samples: Iterable[Tuple[float, float]], now: float) -> float:
+        """Median latency of jobs that finished within the window and since the last step, 0 with too few to judge"""
+        start = max(now - self.window, self.since)
+        recent = [seconds for finished, seconds in samples if finished >= start]
+        return statistics.median(recent) if len(recent) >= self.min_samples else 0.0
+
+    def pressure(self) -> Tuple[float, str]:
+        """The highest pressure across stages (1.0 = at the SLO or capacity) and the stage causing it"""
+        now = time.monotonic()
+        pool = self.bot.transcription
+        jobs = list(pool.jobs.values())
+        waited = max((now - job.submitted for job in jobs if job.state == "queued"), default=0.0)
+        readings = {"stt": max(
+            2 * len(jobs) / pool.max_jobs,
+            waited / self.slo["stt"],
+            self._latency(pool.latencies, now) / self.slo["stt"],
+        )}
+        for stage, started in self._inflight.items():
+            readings[stage] = max(
+                len(started) / self.max_inflight,
+                self._latency(self._latencies[stage], now) / self.slo[stage],
+            )
+        stage = max(readings, key=readings.get)
+        return readings[stage], stage
+
+    def update(self) -> int:
+        """Take one pressure reading and move at most one level; returns the level"""
+        pressure, stage = self.pressure()
+        self.bot.metrics.set_gauge("degradation.pressure", round(pressure, 2))
+        now = time.monotonic()
+        if pressure > 1.0:
+            self._calm_since = None
+            # Give each step time to take effect before judging whether another is needed
+            if self.level < self.max_level and now - self.since >= self.step_down:
+                self._move(self.level + 1, f"{stage} pressure {pressure:.2f}")
+        elif pressure < 0.5:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif self.level > NORMAL and now - max(self._calm_since, self.since) >= self.recovery:
+                self._move(self.level - 1, f"pressure {pressure:.2f} for {self.recovery:g}s")
+        else:
+            self._calm_since = None
+        return self.level
+
+    def _move(self, level: int, reason: str) -> None:
+        direction = "Degrading" if level > self.level else "Recovering"
+        logging.warning(f"{direction} to level {level} ({LEVELS[level]}) from {self.level} ({LEVELS[self.level]}): {reason}")
+        self.level = level
+        self.since = time.monotonic()
+        self.transitions += 1
+        self.bot.metrics.incr("degradation.transitions")
+        self.bot.metrics.set_gauge("degradation.level", level)
+        if level == SMALLER_WHISPER and self._smaller_model():
+            self.bot.whisper.prepare(self._smaller_model())  # Load it now rather than in the next request
+
+    async def run(self) -> None:
+        """Re-evaluate pressure periodically until cancelled"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.update()
+            except Exception as e:
+                logging.error(f"Error in degradation controller: {e}")
+
+    def describe(self) -> str:
+        return f"level {self.level} ({LEVELS[self.level]})"
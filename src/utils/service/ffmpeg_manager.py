@@ -0,0 +1,215 @@
+import asyncio
+import io
+import logging
+import threading
+import time
+from typing import Dict, Optional, Union
+
+import discord
+
+# Per-source tuning: network streams reconnect, piped clips skip probing so speech starts fast
+PROFILES: Dict[str, Dict[str, str]] = {
+    "stream": {
+        "before_options": "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -probesize 1M -analyzeduration 0 -nostdin",
+        "options": "-vn",
+    },
+    "file": {
+        "before_options": "-analyzeduration 0 -nostdin",
+        "options": "-vn",
+    },
+    "clip": {
+        "before_options": "-probesize 32k -analyzeduration 0 -fflags nobuffer",
+        "options": "-vn",
+    },
+}
+
+
+class FFmpegLimitError(Exception):
+    pass
+
+
+class ManagedFFmpegPCMAudio(discord.FFmpegPCMAudio):
+    '''FFmpegPCMAudio that reports its startup latency and frees its manager slot on cleanup'''
+
+    def __init__(self, manager: "FFmpegManager", kind: str, source, **kwargs) -> None:
+        self._manager = manager
+        self._kind = kind
+        self._created = time.perf_counter()
+        self._first_read = True
+        self._released = False
+        super().__init__(source, **kwargs)
+
+    def read(self) -> bytes:
+        data = super().read()
+        if self._first_read:
+            self._first_read = False
+            self._manager.metrics.observe(f"ffmpeg.startup.{self._kind}", time.perf_counter() - self._created)
+        return data
+
+    def cleanup(self) -> None:
+        process = getattr(self, "_process", None)
+        super().cleanup()
+        if not self._released:
+            self._released = True
+            self._manager._release(process)
+
+
+class GuildClipPlayer:
+    '''
+    Per-guild queue that plays short clips in order. The worker task lives while clips keep
+    arriving; each clip still gets its own FFmpeg process, fed from memory over stdin.
+    '''
+
+    def __init__(self, manager: "FFmpegManager", guild_id: int) -> None:
+        self.manager = manager
+        self.guild_id = guild_id
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.worker: Optional[asyncio.Task] = None
+
+    async def play(self, voice_client, data: bytes, input_format: Optional[str]) -> bool:
+        """Queue a clip and wait until it has finished playing"""
+        done = asyncio.get_running_loop().create_future()
+        await self.queue.put((voice_client, data, input_format, done))
+        if self.worker is None or self.worker.done():
+            self.worker = self.manager.bot.task_supervisor.spawn(
+                self._run(), "clip_player", owner="ffmpeg", guild_id=self.guild_id
+            )
+        return await done
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                voice_client, data, input_format, done = await asyncio.wait_for(
+                    self.queue.get(), timeout=self.manager.clip_player_idle
+                )
+            except asyncio.TimeoutError:
+                return
+            if done.done():
+                continue
+            try:
+                if not voice_client.is_connected() or voice_client.is_playing():
+                    done.set_result(False)
+                    continue
+                source = await self.manager.create_source(
+                    io.BytesIO(data), "clip", guild_id=self.guild_id, pipe=True, input_format=input_format
+                )
+                finished = loop.create_future()
+
+                def after_clip(error, finished=finished):
+                    if error:
+                        logging.error(f"Clip playback error: {error}")
+                    loop.call_soon_threadsafe(lambda: finished.done() or finished.set_result(error is None))
+
+                voice_client.play(source, after=after_clip)
+                done.set_result(await finished)
+            except Exception as e:
+                logging.error(f"Error playing clip in guild {self.guild_id}: {e}")
+                if not done.done():
+                    done.set_result(False)
+
+
+class FFmpegManager:
+    '''
+    Central owner of every FFmpeg process used for playback.
+
+    Applies per-source-type options, caps the number of live processes, tracks spawn
+    counts and startup latency, reaps processes whose sources were never cleaned up, and
+    serialises short clips per guild through a queue worker, spawning one piped FFmpeg per clip.
+    '''
+
+    def __init__(self, bot: discord.Bot) -> None:
+        self.bot = bot
+        self.metrics = bot.metrics
+        self.max_processes = bot.compute.limits["ffmpeg"]
+        self.slot_timeout = 10.0
+        self.orphan_timeout = 30.0  # Seconds a never-played source may hold a process
+        self.clip_player_idle = 120.0
+        self.reap_interval = 15.0
+        self._slots = threading.BoundedSemaphore(self.max_processes)
+        self._lock = threading.Lock()
+        self._live: Dict[int, "tuple"] = {}  # pid -> (process, source, created)
+        self._clip_players: Dict[int, GuildClipPlayer] = {}
+        self.metrics.set_gauge("ffmpeg.max_processes", self.max_processes)
+
+    async def _acquire_slot(self) -> None:
+        deadline = time.monotonic() + self.slot_timeout
+        while not self._slots.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                self.metrics.incr("ffmpeg.limit_rejections")
+                raise FFmpegLimitError(f"All {self.max_processes} FFmpeg slots are busy")
+            self.reap()
+            await asyncio.sleep(0.05)
+
+    def _release(self, process) -> None:
+        with self._lock:
+            pid = getattr(process, "pid", None)
+            if pid is None or self._live.pop(pid, None) is None:
+                return
+            live = len(self._live)
+        self._slots.release()
+        self.metrics.set_gauge("ffmpeg.live", live)
+
+    async def create_source(self, source: Union[str, io.BufferedIOBase], kind: str, guild_id: Optional[int] = None,
+                            pipe: bool = False, input_format: Optional[str] = None) -> ManagedFFmpegPCMAudio:
+        """Spawn an FFmpeg PCM source tuned for the source type, waiting for a free slot"""
+        profile = PROFILES[kind]
+        before_options = profile["before_options"]
+        if input_format:
+            before_options = f"-f {input_format} {before_options}"
+        await self._acquire_slot()
+        start = time.perf_counter()
+        try:
+            audio = ManagedFFmpegPCMAudio(
+                self, kind, source, pipe=pipe, before_options=before_options, options=profile["options"]
+            )
+        except Exception:
+            self._slots.release()
+            self.metrics.incr(f"ffmpeg.spawn_failed.{kind}")
+            raise
+        self.metrics.observe(f"ffmpeg.spawn.{kind}", time.perf_counter() - start)
+        self.metrics.incr(f"ffmpeg.spawned.{kind}")
+        self.bot.compute.realtime_source(audio)
+        with self._lock:
+            self._live[audio._process.pid] = (audio._process, audio, time.monotonic())
+            live = len(self._live)
+        self.metrics.set_gauge("ffmpeg.live", live)
+        logging.debug(f"Spawned FFmpeg {kind} source (pid {audio._process.pid}) for guild {guild_id}")
+        return audio
+
+    async def play_clip(self, voice_client, data: bytes, input_format: Optional[str] = None) -> bool:
+        """Play a short in-memory clip (e.g. TTS) in the voice client's guild and wait for it to finish"""
+        guild_id = voice_client.guild.id
+        player = self._clip_players.get(guild_id)
+        if player is None:
+            player = self._clip_players[guild_id] = GuildClipPlayer(self, guild_id)
+        return await player.play(voice_client, data, input_format)
+
+    def reap(self) -> int:
+        """Collect exited processes and kill ones whose source was never played; returns how many were reaped"""
+        now = time.monotonic()
+        with self._lock:
+            entries = list(self._live.items())
+        reaped = 0
+        for pid, (process, audio, created) in entries:
+            # poll() waits on an exited child, so it no longer lingers as a zombie; the player
+            # may still be draining its stdout, so the source itself is left to its cleanup
+            if process.poll() is not None and not getattr(audio, "_exit_seen", False):
+                audio._exit_seen = True
+                reaped += 1
+            if audio._first_read and now - created > self.orphan_timeout:
+                logging.warning(f"Killing orphaned FFmpeg process {pid}: its source was never played")
+                self.metrics.incr("ffmpeg.killed_orphans")
+                audio.cleanup()
+        if reaped:
+            self.metrics.incr("ffmpeg.reaped", reaped)
+        return reaped
+
+    async def run(self) -> None:
+        """Reap periodically until cancelled"""
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            try:
+                await asyncio.to_thread(self.reap)
+            except Exception as e:
+                logging.error(f"Error reaping FFmpeg processes: {e}")
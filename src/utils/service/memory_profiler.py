@@ -0,0 +1,147 @@
+import asyncio
+import collections
+import io
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+# Frames from these files are allocation noise from the profiler itself
+_IGNORED_FILES = (tracemalloc.__file__, "<frozen importlib._bootstrap>", "<frozen importlib._bootstrap_external>", "<unknown>")
+
+
+def deep_sizeof(obj: Any, max_objects: int = 200_000) -> int:
+    """Approximate the memory held by an object graph (containers, instance dicts, buffers)"""
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack and len(seen) < max_objects:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        if isinstance(current, io.BytesIO):
+            total += sys.getsizeof(current) + current.getbuffer().nbytes
+            continue
+        total += sys.getsizeof(current)
+        if isinstance(current, (str, bytes, bytearray, int, float, bool, type(None))):
+            continue
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset, collections.deque)):
+            stack.extend(current)
+        elif hasattr(current, "__dict__") and not isinstance(current, type):
+            stack.append(vars(current))
+    return total
+
+
+def tensor_bytes(model: Any) -> int:
+    """Return the bytes held by a torch module's parameters and buffers"""
+    if model is None:
+        return 0
+    total = sum(p.numel() * p.element_size() for p in model.parameters())
+    total += sum(b.numel() * b.element_size() for b in model.buffers())
+    for module in model.modules():
+        weight_bias = getattr(module, "_weight_bias", None)  # Quantized layers keep packed weights outside parameters()
+        if callable(weight_bias):
+            total += sum(t.numel() * t.element_size() for t in weight_bias() if t is not None)
+    return total
+
+
+def sink_bytes(sink: Any) -> Tuple[int, int]:
+    """Return (users, buffered bytes) held by a recording sink"""
+    if sink is None:
+        return (0, 0)
+    if hasattr(sink, "buffered"):  # Streaming sinks hand audio on instead of accumulating it
+        return sink.buffered()
+    audio_data = getattr(sink, "audio_data", {}) or {}
+    total = 0
+    for audio in audio_data.values():
+        file = getattr(audio, "file", None)
+        if isinstance(file, io.BytesIO):
+            total += file.getbuffer().nbytes
+    return (len(audio_data), total)
+
+
+class MemoryProfiler:
+    '''
+    Named tracemalloc snapshots that can be diffed while the bot keeps running.
+
+    Tracing is off until started, since it slows allocation-heavy code noticeably.
+    '''
+
+    def __init__(self, max_snapshots: int = 8) -> None:
+        self.max_snapshots = max_snapshots
+        self.snapshots: "collections.OrderedDict[str, Tuple[float, tracemalloc.Snapshot]]" = collections.OrderedDict()
+        self._taken = 0  # Numbers unnamed snapshots; never reused after eviction
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 10) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def stop(self) -> None:
+        tracemalloc.stop()
+        self.snapshots.clear()
+
+    @staticmethod
+    def _capture() -> tracemalloc.Snapshot:
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("Memory tracing is not running")
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, pattern) for pattern in _IGNORED_FILES]
+        )
+
+    async def take_snapshot(self, name: Optional[str] = None) -> str:
+        """Store a filtered snapshot under a name, dropping the oldest beyond the limit"""
+        snapshot = await asyncio.to_thread(self._capture)
+        self._taken += 1
+        name = name or f"snap{self._taken}"
+        self.snapshots.pop(name, None)
+        self.snapshots[name] = (time.time(), snapshot)
+        while len(self.snapshots) > self.max_snapshots:
+            self.snapshots.popitem(last=False)
+        return name
+
+    async def diff(self, older: str, newer: Optional[str] = None, limit: int = 15, key_type: str = "lineno") -> List[str]:
+        """Return the top allocation differences between two snapshots (newer defaults to now).
+
+        Diffing against now uses a throwaway snapshot, so stored ones are neither added nor evicted.
+        """
+        if older not in self.snapshots:
+            raise KeyError(older)
+        if newer is not None and newer not in self.snapshots:
+            raise KeyError(newer)
+        older_snapshot = self.snapshots[older][1]
+        newer_snapshot = self.snapshots[newer][1] if newer is not None else await asyncio.to_thread(self._capture)
+        stats = await asyncio.to_thread(newer_snapshot.compare_to, older_snapshot, key_type)
+        lines = []
+        for stat in stats[:limit]:
+            frame = stat.traceback[0]
+            lines.append(
+                f"{frame.filename}:{frame.lineno} {stat.size_diff / 1024:+.1f} KiB "
+                f"({stat.count_diff:+d} blocks, now {stat.size / 1024:.1f} KiB)"
+            )
+        return lines
+
+    def current(self) -> Tuple[int, int]:
+        """Return (current, peak) traced bytes"""
+        return tracemalloc.get_traced_memory()
+
+    def structure_report(self, bot) -> Dict[str, Dict[str, Tuple[int, int]]]:
+        """Collect (count, bytes) of known in-memory structures from every cog and shared model that reports them"""
+        report = {}
+        owners = list(bot.cogs.items()) + [("Whisper models", getattr(bot, "whisper", None))]
+        for name, cog in owners:
+            stats = getattr(cog, "memory_stats", None)
+            if stats is None:
+                continue
+            try:
+                report[name] = stats()
+            except Exception as e:
+                report[name] = {f"error: {e}": (0, 0)}
+        return report
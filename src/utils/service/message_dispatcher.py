@@ -0,0 +1,105 @@
+import enum
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import discord
+
+
+class MessageKind(enum.Enum):
+    NONE = "none"
+    MENTION = "mention"
+    REPLY = "reply"
+    AUDIO_ATTACHMENT = "audio_attachment"
+
+
+class ClassifiedMessage:
+    '''A message together with what it asks of the bot, worked out once'''
+
+    def __init__(self, message: discord.Message, kind: MessageKind, content: str = "",
+                 audio_attachments: Optional[List[discord.Attachment]] = None,
+                 text_kind: MessageKind = MessageKind.NONE) -> None:
+        self.message = message
+        self.kind = kind
+        self.content = content  # Message text with the bot mention stripped
+        self.audio_attachments = audio_attachments or []
+        self.text_kind = text_kind  # Mention/reply status, kept for audio messages too
+
+
+Predicate = Callable[[ClassifiedMessage], bool]
+Handler = Callable[[ClassifiedMessage], Awaitable[None]]
+
+
+def is_audio_attachment(attachment: discord.Attachment) -> bool:
+    return bool(attachment.content_type) and 'audio' in attachment.content_type
+
+
+class MessageDispatcher:
+    '''
+    Classify each incoming message once and route it to exactly one pipeline.
+
+    Pipelines register a handler per message kind with an optional predicate and a
+    priority; the highest-priority handler whose predicate accepts the message wins.
+    Messages that need no processing are dropped after a few attribute checks.
+    '''
+
+    def __init__(self, bot: discord.Bot) -> None:
+        self.bot = bot
+        self._routes: Dict[MessageKind, List[Tuple[int, str, Predicate, Handler]]] = {kind: [] for kind in MessageKind}
+
+    def register(self, kind: MessageKind, name: str, handler: Handler,
+                 when: Optional[Predicate] = None, priority: int = 0) -> None:
+        """Route messages of a kind to a handler when its predicate accepts them"""
+        routes = self._routes[kind]
+        routes.append((priority, name, when or (lambda classified: True), handler))
+        routes.sort(key=lambda route: -route[0])
+
+    def unregister(self, name: str) -> None:
+        """Remove every route registered under a pipeline name"""
+        for kind, routes in self._routes.items():
+            self._routes[kind] = [route for route in routes if route[1] != name]
+
+    def classify(self, message: discord.Message) -> ClassifiedMessage:
+        """Work out what, if anything, a message needs from the bot"""
+        if message.author.bot:
+            return ClassifiedMessage(message, MessageKind.NONE)
+        me = self.bot.user
+        # Cheap exit for the vast majority of traffic: no attachments, mentions or replies
+        if not message.attachments and not message.mentions and message.reference is None:
+            return ClassifiedMessage(message, MessageKind.NONE)
+
+        text_kind = MessageKind.NONE
+        if me in message.mentions:
+            text_kind = MessageKind.MENTION
+        elif message.reference is not None:
+            author = getattr(message.reference.resolved, 'author', None)
+            if author is not None and author.id == me.id:
+                text_kind = MessageKind.REPLY
+        content = ""
+        if text_kind is not MessageKind.NONE:
+            content = message.content.replace(f'<@{me.id}>', '').replace(f'<@!{me.id}>', '').strip()
+
+        audio = [a for a in message.attachments if is_audio_attachment(a)]
+        kind = MessageKind.AUDIO_ATTACHMENT if audio else text_kind
+        return ClassifiedMessage(message, kind, content, audio, text_kind)
+
+    async def dispatch(self, message: discord.Message) -> Optional[str]:
+        """Classify a message and run the single matching pipeline, returning its name"""
+        classified = self.classify(message)
+        if classified.kind is MessageKind.NONE:
+            return None
+        self.bot.metrics.incr(f"messages.{classified.kind.value}")
+        if message.guild is not None:
+            await self.bot.state.load_guild(message.guild.id)
+        # An audio message nobody handles still gets its mention/reply answered
+        kinds = [classified.kind]
+        if classified.text_kind not in (MessageKind.NONE, classified.kind):
+            kinds.append(classified.text_kind)
+        for kind in kinds:
+            for _, name, when, handler in self._routes[kind]:
+                if not when(classified):
+                    continue
+                logging.debug(f"Routing {kind.value} message {message.id} to {name}")
+                with self.bot.metrics.timer(f"messages.pipeline.{name}"):
+                    await handler(classified)
+                return name
+        return None
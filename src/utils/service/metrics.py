@@ -0,0 +1,61 @@
+import collections
+import contextlib
+import threading
+import time
+from typing import Any, Deque, Dict, Iterator
+
+
+class Metrics:
+    '''
+    Process-wide counters, gauges and timing summaries.
+
+    Cheap enough to call from hot paths and safe to update from worker threads.
+    '''
+
+    def __init__(self, window: int = 512) -> None:
+        self._lock = threading.Lock()
+        self.counters: Dict[str, float] = collections.defaultdict(float)
+        self.gauges: Dict[str, Any] = {}
+        self._timings: Dict[str, Deque[float]] = collections.defaultdict(lambda: collections.deque(maxlen=window))
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] += value
+
+    def set_gauge(self, name: str, value: Any) -> None:
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._timings[name].append(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def summary(self, name: str) -> Dict[str, float]:
+        """Return count/avg/p50/p95/max (seconds) over the recent window of a timing"""
+        with self._lock:
+            values = sorted(self._timings.get(name, ()))
+        if not values:
+            return {'count': 0, 'avg': 0.0, 'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+        return {
+            'count': len(values),
+            'avg': sum(values) / len(values),
+            'p50': values[len(values) // 2],
+            'p95': values[min(len(values) - 1, int(len(values) * 0.95))],
+            'max': values[-1],
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a JSON-serialisable copy of every metric"""
+        with self._lock:
+            names = list(self._timings)
+            snapshot = {'counters': dict(self.counters), 'gauges': dict(self.gauges)}
+        snapshot['timings'] = {name: self.summary(name) for name in names}
+        return snapshot
@@ -0,0 +1,177 @@
+import asyncio
+import gc
+import inspect
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def process_rss_bytes() -> Optional[int]:
+    """Return the resident set size of this process, if it can be determined"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None  # ru_maxrss is the peak, which never drops back under a budget
+
+
+class ManagedResource:
+    '''A heavy resource that can be released when idle and reloaded on demand'''
+
+    def __init__(self, name: str, unload: Callable[[], Any], kind: str = "model",
+                 idle_timeout: Optional[float] = None, in_process: bool = True) -> None:
+        self.name = name
+        self.kind = kind
+        self.unload = unload
+        self.idle_timeout = idle_timeout
+        self.in_process = in_process  # False for memory held by another process (e.g. Ollama)
+        self.size_bytes = 0
+        self.loaded = False
+        self.last_used = time.monotonic()
+
+    @property
+    def idle_for(self) -> float:
+        return time.monotonic() - self.last_used
+
+
+class ResourceManager:
+    '''
+    Track last use of heavy resources and release them when idle or over budget.
+
+    Owners register a resource with an unload callback and call `touch` whenever they use
+    it. A periodic sweep unloads resources idle past their window, leaves voice channels
+    with no listeners, and evicts least-recently-used resources while the process is over
+    its memory budget. Owners reload lazily on their next use.
+    '''
+
+    def __init__(self) -> None:
+        self.resources: Dict[str, ManagedResource] = {}
+        self.default_idle_timeout = float(os.getenv("RESOURCE_IDLE_TIMEOUT", "900"))
+        self.voice_idle_timeout = float(os.getenv("VOICE_IDLE_TIMEOUT", "300"))
+        self.memory_budget = int(float(os.getenv("MEMORY_BUDGET_MB", "0")) * 1024 * 1024)
+        self.sweep_interval = float(os.getenv("RESOURCE_SWEEP_INTERVAL", "30"))
+        self._voice_idle_since: Dict[int, float] = {}
+        self.evictions = 0
+        self._rss_warned = False
+
+    def register(self, name: str, unload: Callable[[], Any], kind: str = "model",
+                 idle_timeout: Optional[float] = None, in_process: bool = True) -> ManagedResource:
+        """Register (or re-register) a resource and its unload callback"""
+        resource = self.resources.get(name)
+        if resource is None:
+            resource = ManagedResource(name, unload, kind, idle_timeout, in_process)
+            self.resources[name] = resource
+        else:
+            resource.unload = unload
+        return resource
+
+    def touch(self, name: str, size_bytes: Optional[int] = None) -> None:
+        """Mark a resource as loaded and just used"""
+        resource = self.resources.get(name)
+        if resource is None:
+            return
+        resource.loaded = True
+        resource.last_used = time.monotonic()
+        if size_bytes is not None:
+            resource.size_bytes = size_bytes
+
+    def loaded_resources(self) -> List[ManagedResource]:
+        return [r for r in self.resources.values() if r.loaded]
+
+    async def release(self, name: str, reason: str) -> bool:
+        """Unload a resource through its callback"""
+        resource = self.resources.get(name)
+        if resource is None or not resource.loaded:
+            return False
+        try:
+            result = resource.unload()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logging.error(f"Failed to unload {name}: {e}")
+            return False
+        resource.loaded = False
+        freed = resource.size_bytes
+        resource.size_bytes = 0
+        gc.collect()
+        logging.info(f"Unloaded {name} ({reason}, idle {resource.idle_for:.0f}s, ~{freed / 1048576:.1f} MB)")
+        return True
+
+    async def _sweep_idle(self) -> None:
+        for resource in self.loaded_resources():
+            timeout = resource.idle_timeout if resource.idle_timeout is not None else self.default_idle_timeout
+            if timeout > 0 and resource.idle_for >= timeout:
+                await self.release(resource.name, "idle")
+
+    async def _sweep_budget(self) -> None:
+        if self.memory_budget <= 0:
+            return
+        rss = process_rss_bytes()
+        if rss is None:
+            if not self._rss_warned:
+                logging.warning("MEMORY_BUDGET_MB is set but this process's RSS cannot be read; install psutil to enforce it")
+                self._rss_warned = True
+            return
+        if rss <= self.memory_budget:
+            return
+        candidates = sorted(
+            (r for r in self.loaded_resources() if r.in_process),
+            key=lambda r: r.last_used
+        )
+        for resource in candidates:
+            logging.warning(
+                f"RSS {rss / 1048576:.0f} MB over budget {self.memory_budget / 1048576:.0f} MB, evicting {resource.name}"
+            )
+            if await self.release(resource.name, "memory budget"):
+                self.evictions += 1
+                rss = process_rss_bytes() or 0
+                if rss <= self.memory_budget:
+                    break
+
+    async def _sweep_voice(self, bot) -> None:
+        if self.voice_idle_timeout <= 0:
+            return
+        now = time.monotonic()
+        active = set()
+        for voice_client in list(bot.voice_clients):
+            guild_id = voice_client.guild.id
+            active.add(guild_id)
+            listeners = [m for m in voice_client.channel.members if not m.bot]
+            busy = voice_client.is_playing() or getattr(voice_client, "recording", False)
+            if listeners or busy:
+                self._voice_idle_since.pop(guild_id, None)
+                continue
+            since = self._voice_idle_since.setdefault(guild_id, now)
+            if now - since >= self.voice_idle_timeout:
+                logging.info(f"Leaving {voice_client.channel.name} in guild {guild_id}: no listeners for {now - since:.0f}s")
+                self._voice_idle_since.pop(guild_id, None)
+                try:
+                    await bot.voice_sessions.disconnect(guild_id)
+                except Exception as e:
+                    logging.error(f"Error leaving idle voice channel: {e}")
+        for guild_id in list(self._voice_idle_since):
+            if guild_id not in active:
+                del self._voice_idle_since[guild_id]
+
+    async def sweep(self, bot) -> None:
+        """Run one pass of idle unloading, voice cleanup and budget enforcement"""
+        await self._sweep_idle()
+        await self._sweep_voice(bot)
+        await self._sweep_budget()
+
+    async def run(self, bot) -> None:
+        """Sweep periodically until cancelled"""
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep(bot)
+            except Exception as e:
+                logging.error(f"Error in resource sweep: {e}")
@@ -0,0 +1,225 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+GLOBAL = 0  # Scope id for bot-wide settings
+
+# The repository root (one level above src), like main.get_project_root
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+
+
+def project_path(name: str) -> str:
+    """A file in the project root, so defaults do not depend on the directory the bot is launched from"""
+    return os.path.join(PROJECT_ROOT, name)
+_DELETED = object()
+
+
+class StateStore:
+    '''
+    Persistent per-guild settings backed by SQLite in WAL mode.
+
+    Reads and writes only touch an in-memory cache, so command handlers never wait on
+    disk. Changes are marked dirty and written in one batched transaction by `run`, and
+    on shutdown. A guild's rows are loaded in a worker thread the first time it is used;
+    bot-wide settings (scope 0) are loaded at startup.
+    '''
+
+    def __init__(self, path: Optional[str] = None, flush_interval: Optional[float] = None) -> None:
+        self.path = path or os.getenv("STATE_DB_PATH") or project_path("lucia_state.db")
+        self.flush_interval = flush_interval if flush_interval is not None else float(os.getenv("STATE_FLUSH_INTERVAL", "5"))
+        self._cache: Dict[int, Dict[Tuple[str, str], Any]] = {}
+        self._dirty: Dict[Tuple[int, str, str], Any] = {}
+        self._flushing: Dict[Tuple[int, str, str], Any] = {}  # Batch currently being written
+        self._loaded: Set[int] = set()
+        self._loading: Dict[int, asyncio.Future] = {}
+        self._lock = threading.Lock()      # Guards cache and dirty set across threads
+        self._db_lock = threading.Lock()   # Serialises use of the connection
+        self._conn: Optional[sqlite3.Connection] = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    def open(self) -> None:
+        """Open the database and load bot-wide settings"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "guild_id INTEGER NOT NULL, scope TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "updated_at REAL NOT NULL, PRIMARY KEY (guild_id, scope, key))"
+        )
+        self._load_rows(GLOBAL)
+        logging.info(f"State store opened at {self.path}")
+
+    def _load_rows(self, guild_id: int) -> None:
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT scope, key, value FROM state WHERE guild_id = ?", (guild_id,)
+            ).fetchall()
+        with self._lock:
+            values = self._cache.setdefault(guild_id, {})
+            for scope, key, value in rows:
+                # Writes made before the load finished are newer than what is on disk
+                if (guild_id, scope, key) in self._dirty or (guild_id, scope, key) in self._flushing:
+                    continue
+                try:
+                    values[(scope, key)] = json.loads(value)
+                except ValueError:
+                    logging.warning(f"Ignoring unreadable state {scope}.{key} for guild {guild_id}")
+            self._loaded.add(guild_id)
+
+    def is_loaded(self, guild_id: Optional[int]) -> bool:
+        return (guild_id or GLOBAL) in self._loaded
+
+    async def load_guild(self, guild_id: Optional[int]) -> None:
+        """Load a guild's settings in a worker thread; no-op once loaded"""
+        guild_id = guild_id or GLOBAL
+        if guild_id in self._loaded or self._conn is None:
+            return
+        pending = self._loading.get(guild_id)
+        if pending is None:
+            pending = self._loading[guild_id] = asyncio.ensure_future(asyncio.to_thread(self._load_rows, guild_id))
+            pending.add_done_callback(lambda _: self._loading.pop(guild_id, None))
+        try:
+            await asyncio.shield(pending)
+        except Exception as e:
+            logging.error(f"Error loading state for guild {guild_id}: {e}")
+
+    def get(self, guild_id: Optional[int], scope: str, key: str, default: Any = None) -> Any:
+        with self._lock:
+            return self._cache.get(guild_id or GLOBAL, {}).get((scope, key), default)
+
+    def set(self, guild_id: Optional[int], scope: str, key: str, value: Any) -> None:
+        """Update a value in memory and queue it for the next flush"""
+        guild_id = guild_id or GLOBAL
+        with self._lock:
+            self._cache.setdefault(guild_id, {})[(scope, key)] = value
+            self._dirty[(guild_id, scope, key)] = value
+
+    def delete(self, guild_id: Optional[int], scope: str, key: str) -> None:
+        guild_id = guild_id or GLOBAL
+        with self._lock:
+            self._cache.setdefault(guild_id, {}).pop((scope, key), None)
+            self._dirty[(guild_id, scope, key)] = _DELETED
+
+    def guilds_with(self, scope: str, key: str) -> Dict[int, Any]:
+        """Return the loaded guilds that have a value for a key"""
+        with self._lock:
+            return {
+                guild_id: values[(scope, key)]
+                for guild_id, values in self._cache.items()
+                if (scope, key) in values
+            }
+
+    def mapping(self, scope: str, key: str) -> "GuildMapping":
+        return GuildMapping(self, scope, key)
+
+    @property
+    def pending(self) -> int:
+        return len(self._dirty)
+
+    def flush(self) -> int:
+        """Write every pending change in one transaction; returns the number of rows written"""
+        if self._conn is None:
+            return 0
+        with self._lock:
+            if not self._dirty:
+                return 0
+            batch, self._dirty = self._dirty, {}
+            self._flushing = batch
+        upserts, deletes = [], []
+        now = time.time()
+        for (guild_id, scope, key), value in batch.items():
+            if value is _DELETED:
+                deletes.append((guild_id, scope, key))
+                continue
+            try:
+                upserts.append((guild_id, scope, key, json.dumps(value), now))
+            except (TypeError, ValueError) as e:
+                logging.error(f"Not persisting {scope}.{key} for guild {guild_id}: {e}")
+        try:
+            with self._db_lock:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT INTO state (guild_id, scope, key, value, updated_at) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (guild_id, scope, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                    upserts,
+                )
+                self._conn.executemany("DELETE FROM state WHERE guild_id = ? AND scope = ? AND key = ?", deletes)
+                self._conn.execute("COMMIT")
+        except sqlite3.Error:
+            with self._db_lock:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+            with self._lock:
+                # Put the batch back unless something newer replaced it meanwhile
+                for item, value in batch.items():
+                    self._dirty.setdefault(item, value)
+                self._flushing = {}
+            raise
+        with self._lock:
+            self._flushing = {}
+        self.flushes += 1
+        self.rows_written += len(batch)
+        return len(batch)
+
+    async def run(self) -> None:
+        """Flush pending changes periodically until cancelled"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if not self._dirty:
+                continue
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logging.error(f"Error flushing state: {e}")
+
+    def close(self) -> None:
+        """Flush what is left and close the database"""
+        if self._conn is None:
+            return
+        try:
+            self.flush()
+        except Exception as e:
+            logging.error(f"Error flushing state on shutdown: {e}")
+        with self._db_lock:
+            self._conn.close()
+            self._conn = None
+
+
+class GuildMapping(MutableMapping):
+    '''Dict-like view of one setting across guilds, keyed by guild id'''
+
+    def __init__(self, store: StateStore, scope: str, key: str) -> None:
+        self.store = store
+        self.scope = scope
+        self.key = key
+
+    def __getitem__(self, guild_id: int) -> Any:
+        value = self.store.get(guild_id, self.scope, self.key, _DELETED)
+        if value is _DELETED:
+            raise KeyError(guild_id)
+        return value
+
+    def __setitem__(self, guild_id: int, value: Any) -> None:
+        self.store.set(guild_id, self.scope, self.key, value)
+
+    def __delitem__(self, guild_id: int) -> None:
+        if guild_id not in self:
+            raise KeyError(guild_id)
+        self.store.delete(guild_id, self.scope, self.key)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.store.guilds_with(self.scope, self.key))
+
+    def __len__(self) -> int:
+        return len(self.store.guilds_with(self.scope, self.key))
@@ -0,0 +1,131 @@
+import importlib.util
+import logging
+import os
+import warnings
+from typing import Any, Dict, Optional
+
+
+def cpu_capability() -> str:
+    """The widest SIMD level torch dispatches to on this CPU ("AVX512", "AVX2", "DEFAULT", ...)"""
+    try:
+        import torch
+        return torch.backends.cpu.get_cpu_capability()
+    except (ImportError, AttributeError):
+        return "DEFAULT"
+
+
+class SttBackend:
+    '''
+    One way of running Whisper. `load` returns an object whose `transcribe(audio, **options)`
+    returns openai-whisper's result shape: {"text", "segments": [{"start", "end", "text"}], ...}
+    '''
+
+    name = ""
+    module = ""  # Package that must be importable
+    precisions = ("fp16", "fp32")
+
+    def available(self, device: str) -> bool:
+        return importlib.util.find_spec(self.module) is not None
+
+    def default_precision(self, device: str) -> str:
+        return "fp16" if device.startswith("cuda") else "fp32"
+
+    def load(self, name: str, device: str, precision: str) -> Any:
+        raise NotImplementedError
+
+
+class OpenAIWhisperBackend(SttBackend):
+    '''The reference PyTorch implementation, fp16 on GPU and fp32 on CPU'''
+
+    name = "openai-whisper"
+    module = "whisper"
+
+    def load(self, name: str, device: str, precision: str) -> Any:
+        import whisper
+        return whisper.load_model(name, device=device)
+
+
+class QuantizedWhisperBackend(SttBackend):
+    '''
+    openai-whisper with every Linear layer dynamically quantized to int8 (torch's fbgemm/x86
+    kernels on AVX2 and newer, qnnpack on ARM). Convolutions and embeddings stay fp32. CPU only.
+    '''
+
+    name = "whisper-int8"
+    module = "whisper"
+    precisions = ("int8",)
+
+    def available(self, device: str) -> bool:
+        if device != "cpu" or not super().available(device):
+            return False
+        import torch
+        engines = set(torch.backends.quantized.supported_engines)
+        return bool(engines & {"x86", "fbgemm", "qnnpack"}) and cpu_capability() != "DEFAULT"
+
+    def default_precision(self, device: str) -> str:
+        return "int8"
+
+    def load(self, name: str, device: str, precision: str) -> Any:
+        import torch
+        import whisper
+        model = whisper.load_model(name, device="cpu")
+        for module in model.modules():
+            # whisper.model.Linear only adds a dtype cast for fp16, which the quantizer does not recognise
+            if isinstance(module, torch.nn.Linear) and type(module) is not torch.nn.Linear:
+                module.__class__ = torch.nn.Linear
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")  # Newer torch flags eager-mode quantization as deprecated
+            return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class FasterWhisperModel:
+    '''Adapts a faster-whisper model to openai-whisper's `transcribe` result shape'''
+
+    def __init__(self, model: Any) -> None:
+        self.model = model
+
+    def transcribe(self, audio: Any, **options) -> dict:
+        options.pop("fp16", None)  # The compute type is fixed at load time
+        options.setdefault("beam_size", 1)  # Greedy, like openai-whisper's default
+        segments, info = self.model.transcribe(audio, **options)
+        segments = [{"start": s.start, "end": s.end, "text": s.text} for s in segments]
+        return {"text": "".join(s["text"] for s in segments), "segments": segments, "language": info.language}
+
+
+class FasterWhisperBackend(SttBackend):
+    '''CTranslate2 inference through faster-whisper, int8 on CPU and fp16 on GPU'''
+
+    name = "faster-whisper"
+    module = "faster_whisper"
+    precisions = ("int8", "fp16", "fp32")
+    COMPUTE_TYPES = {"int8": "int8", "fp16": "float16", "fp32": "float32"}
+
+    def default_precision(self, device: str) -> str:
+        return "fp16" if device.startswith("cuda") else "int8"
+
+    def load(self, name: str, device: str, precision: str) -> Any:
+        from faster_whisper import WhisperModel
+        return FasterWhisperModel(WhisperModel(name, device=device, compute_type=self.COMPUTE_TYPES[precision]))
+
+
+BACKENDS: Dict[str, SttBackend] = {
+    backend.name: backend
+    for backend in (FasterWhisperBackend(), QuantizedWhisperBackend(), OpenAIWhisperBackend())
+}
+
+
+def select_backend(device: str, requested: Optional[str] = None) -> str:
+    """Pick the backend named by WHISPER_BACKEND, or the fastest one this host can run.
+
+    CTranslate2 first when installed, then int8 torch on CPUs with AVX2/NEON, else openai-whisper.
+    """
+    requested = requested if requested is not None else os.getenv("WHISPER_BACKEND", "auto")
+    if requested and requested != "auto":
+        backend = BACKENDS.get(requested)
+        if backend is not None and backend.available(device):
+            return requested
+        logging.warning(f"Whisper backend {requested!r} is not available on {device}, choosing automatically")
+    for name, backend in BACKENDS.items():
+        if backend.available(device):
+            return name
+    return OpenAIWhisperBackend.name
@@ -0,0 +1,168 @@
+import asyncio
+import collections
+import collections.abc
+import functools
+import logging
+import time
+from typing import Any, Coroutine, Deque, Dict, List, Optional, Tuple
+
+
+class TaskRecord:
+    '''Bookkeeping for one supervised task'''
+
+    def __init__(self, name: str, owner: str, guild_id: Optional[int]) -> None:
+        self.name = name
+        self.owner = owner
+        self.guild_id = guild_id
+        self.created_at = time.monotonic()
+        self.cpu_time = 0.0
+        self.state = "pending"
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
+
+    @property
+    def scope(self) -> Tuple[str, Optional[int]]:
+        return (self.owner, self.guild_id)
+
+
+class _TimedCoroutine(collections.abc.Coroutine):
+    '''Drive a coroutine while charging the thread CPU time of each step to its record'''
+
+    def __init__(self, coro: Coroutine, record: TaskRecord) -> None:
+        self._coro = coro
+        self._record = record
+
+    def send(self, value: Any) -> Any:
+        start = time.thread_time()
+        try:
+            return self._coro.send(value)
+        finally:
+            self._record.cpu_time += time.thread_time() - start
+
+    def throw(self, typ, val=None, tb=None) -> Any:
+        start = time.thread_time()
+        try:
+            if val is None and tb is None:
+                return self._coro.throw(typ)
+            return self._coro.throw(typ, val, tb)
+        finally:
+            self._record.cpu_time += time.thread_time() - start
+
+    def close(self) -> None:
+        self._coro.close()
+
+    def __await__(self):
+        return self._coro.__await__()
+
+
+class TaskSupervisor:
+    '''
+    Central registry for background tasks spawned by the bot and its cogs.
+
+    Every task is named and owned by a scope (owner cog + optional guild). Failures are
+    logged and kept in a short history, scopes can be cancelled at once, and each owner
+    can be capped to a number of concurrently running tasks per guild.
+    '''
+
+    def __init__(self, failure_history: int = 50) -> None:
+        self._records: Dict[asyncio.Task, TaskRecord] = {}
+        self._limits: Dict[str, int] = {}
+        self._semaphores: Dict[Tuple[str, Optional[int]], asyncio.Semaphore] = {}
+        self.failures: Deque[Dict[str, Any]] = collections.deque(maxlen=failure_history)
+        self.spawned = 0
+
+    def set_limit(self, owner: str, limit: int) -> None:
+        """Cap how many tasks of an owner may run at once in each guild (0 = unlimited)"""
+        if limit > 0:
+            self._limits[owner] = limit
+        else:
+            self._limits.pop(owner, None)
+        for scope in [s for s in self._semaphores if s[0] == owner]:
+            del self._semaphores[scope]
+
+    def _semaphore_for(self, scope: Tuple[str, Optional[int]]) -> Optional[asyncio.Semaphore]:
+        limit = self._limits.get(scope[0])
+        if not limit:
+            return None
+        if scope not in self._semaphores:
+            self._semaphores[scope] = asyncio.Semaphore(limit)
+        return self._semaphores[scope]
+
+    async def _run(self, coro: Coroutine, record: TaskRecord) -> Any:
+        semaphore = self._semaphore_for(record.scope)
+        if semaphore is None:
+            record.state = "running"
+            return await coro
+        record.state = "waiting"
+        try:
+            async with semaphore:
+                record.state = "running"
+                return await coro
+        finally:
+            coro.close()
+
+    def spawn(self, coro: Coroutine, name: str, owner: str = "bot", guild_id: Optional[int] = None) -> asyncio.Task:
+        """Schedule a coroutine as a supervised task on the running loop"""
+        record = TaskRecord(name, owner, guild_id)
+        task = asyncio.get_running_loop().create_task(
+            _TimedCoroutine(self._run(coro, record), record),
+            name=f"{owner}:{name}"
+        )
+        record.task = task
+        self._records[task] = record
+        self.spawned += 1
+        task.add_done_callback(self._on_done)
+        return task
+
+    def spawn_threadsafe(self, loop: asyncio.AbstractEventLoop, coro: Coroutine, name: str,
+                         owner: str = "bot", guild_id: Optional[int] = None) -> None:
+        """Schedule a supervised task from another thread (e.g. a voice player `after` callback)"""
+        loop.call_soon_threadsafe(functools.partial(self.spawn, coro, name, owner=owner, guild_id=guild_id))
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        record = self._records.pop(task, None)
+        if record is None:
+            return
+        if task.cancelled():
+            record.state = "cancelled"
+            logging.debug(f"Task {task.get_name()} cancelled after {record.age:.1f}s")
+            return
+        exc = task.exception()
+        if exc is None:
+            record.state = "done"
+            return
+        record.state = "failed"
+        logging.error(f"Background task {task.get_name()} failed", exc_info=exc)
+        self.failures.append({
+            'name': record.name,
+            'owner': record.owner,
+            'guild_id': record.guild_id,
+            'error': repr(exc),
+            'at': time.time(),
+        })
+
+    def tasks(self, owner: Optional[str] = None, guild_id: Optional[int] = None) -> List[TaskRecord]:
+        """Return live task records, oldest first, optionally filtered by scope"""
+        records = [
+            r for r in self._records.values()
+            if (owner is None or r.owner == owner) and (guild_id is None or r.guild_id == guild_id)
+        ]
+        return sorted(records, key=lambda r: r.created_at)
+
+    def cancel(self, owner: Optional[str] = None, guild_id: Optional[int] = None) -> int:
+        """Cancel every live task in the given scope, returning how many were cancelled"""
+        records = self.tasks(owner, guild_id)
+        for record in records:
+            record.task.cancel()
+        return len(records)
+
+    async def close(self) -> None:
+        """Cancel all tasks and wait for them to unwind"""
+        tasks = list(self._records)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from utils.service.state_store import project_path
+from utils.service.whisper_batcher import engine_id
+
+HASH_IN_THREAD_BYTES = 1 << 20  # Larger attachments are hashed off the event loop
+
+# Returns (text, engine id of the Whisper model that produced it, or None for text that must not be kept)
+Transcriber = Callable[[], Awaitable[Tuple[Optional[str], Optional[str]]]]
+
+
+class TranscriptCache:
+    '''
+    Remembers transcripts of attachments and recordings by the hash of their bytes.
+
+    The same voice message is often transcribed more than once (`/transcribe`,
+    `/transcribe_voice_message`, voice AI picking up the attachment). Entries are keyed by
+    the SHA-256 of the audio plus the Whisper model that produced them, so changing
+    `WHISPER_MODEL` or precision never returns stale text. Recent transcripts live in an
+    in-memory LRU, older ones in a small SQLite file, and concurrent requests for the same
+    audio share one decode and transcription. Results of the online fallback are not kept,
+    and transcripts made under load by a smaller model are kept apart from full-quality ones.
+    '''
+
+    def __init__(self, bot) -> None:
+        self.bot = bot
+        self.max_entries = max(0, int(os.getenv("TRANSCRIPT_CACHE_SIZE", "256")))
+        path = os.getenv("TRANSCRIPT_CACHE_PATH")
+        self.path = project_path("transcript_cache.db") if path is None else path  # Empty disables the disk tier
+        self.max_disk_entries = max(0, int(os.getenv("TRANSCRIPT_CACHE_DISK_ENTRIES", "10000")))
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._db_failed = False
+        self.hits = 0
+        self.disk_hits = 0
+        self.shared = 0
+        self.misses = 0
+
+    def engine_id(self) -> str:
+        """The model (and decoding mode) a transcription started now is expected to use"""
+        name, options = self.bot.degradation.whisper_profile()
+        return engine_id(self.bot.whisper.key(name), options)
+
+    @staticmethod
+    async def digest(data: bytes) -> str:
+        if len(data) > HASH_IN_THREAD_BYTES:
+            return await asyncio.to_thread(lambda: hashlib.sha256(data).hexdigest())
+        return hashlib.sha256(data).hexdigest()
+
+    async def get_or_transcribe(self, data: bytes, transcribe: Transcriber) -> Optional[str]:
+        """Return the cached transcript of `data`, or await `transcribe()` once for every concurrent caller.
+
+        Lookups use the engine expected right now; a new transcript is stored under the engine
+        `transcribe` reports, since the degradation level may change before the batch runs.
+        Exceptions from `transcribe` (e.g. AudioDecodeError) reach every caller sharing it.
+        """
+        digest = await self.digest(data)
+        key = f"{digest}:{self.engine_id()}"
+        text = self._memory.get(key)
+        if text is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            self.bot.metrics.incr("transcription.cache.hits")
+            return text
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.shared += 1
+            self.bot.metrics.incr("transcription.cache.shared")
+        else:
+            pending = self._inflight[key] = asyncio.ensure_future(self._fill(digest, key, transcribe))
+            pending.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(pending)
+
+    async def _fill(self, digest: str, key: str, transcribe: Transcriber) -> Optional[str]:
+        text = await self._read(key)
+        if text is not None:
+            self.disk_hits += 1
+            self.bot.metrics.incr("transcription.cache.disk_hits")
+            self._remember(key, text)
+            return text
+        self.misses += 1
+        self.bot.metrics.incr("transcription.cache.misses")
+        text, engine = await transcribe()
+        if text and engine is not None:
+            key = f"{digest}:{engine}"
+            self._remember(key, text)
+            await self._write(key, text)
+        return text
+
+    def _remember(self, key: str, text: str) -> None:
+        if self.max_entries == 0:
+            return
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _open(self) -> Optional[sqlite3.Connection]:
+        """Open the disk tier on first use (worker thread); None when disabled or unusable"""
+        if self._conn is not None or self._db_failed or not self.path or self.max_disk_entries == 0:
+            return self._conn
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS transcripts ("
+                "key TEXT PRIMARY KEY, text TEXT NOT NULL, used_at REAL NOT NULL)"
+            )
+            self._conn = conn
+        except sqlite3.Error as e:
+            logging.error(f"Could not open transcript cache at {self.path}, keeping transcripts in memory only: {e}")
+            self._db_failed = True
+        return self._conn
+
+    async def _read(self, key: str) -> Optional[str]:
+        def read() -> Optional[str]:
+            with self._db_lock:
+                conn = self._open()
+                if conn is None:
+                    return None
+                row = conn.execute("SELECT text FROM transcripts WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE transcripts SET used_at = ? WHERE key = ?", (time.time(), key))
+                return row[0] if row else None
+
+        try:
+            return await asyncio.to_thread(read)
+        except sqlite3.Error as e:
+            logging.error(f"Error reading transcript cache: {e}")
+            return None
+
+    async def _write(self, key: str, text: str) -> None:
+        def write() -> None:
+            with self._db_lock:
+                conn = self._open()
+                if conn is None:
+                    return
+                conn.execute(
+                    "INSERT INTO transcripts (key, text, used_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET text = excluded.text, used_at = excluded.used_at",
+                    (key, text, time.time()),
+                )
+                conn.execute(
+                    "DELETE FROM transcripts WHERE key IN (SELECT key FROM transcripts ORDER BY used_at DESC "
+                    "LIMIT -1 OFFSET ?)", (self.max_disk_entries,)
+                )
+
+        try:
+            await asyncio.to_thread(write)
+        except sqlite3.Error as e:
+            logging.error(f"Error writing transcript cache: {e}")
+
+    def close(self) -> None:
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,160 @@
+import asyncio
+import collections
+import itertools
+import logging
+import os
+import time
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+
+class TranscriptionQueueFull(Exception):
+    '''Raised when too many transcriptions are already waiting or running'''
+
+
+class TranscriptionTimeout(Exception):
+    '''Raised when a transcription did not finish within its timeout'''
+
+
+class TranscriptionCancelled(Exception):
+    '''Raised when a transcription was cancelled through the pool (e.g. the bot left the guild)'''
+
+
+class TranscriptionJob:
+    '''One submitted transcription, from queueing until its result is delivered'''
+
+    def __init__(self, job_id: int, engine: str, guild_id: Optional[int], user_id: Optional[int]) -> None:
+        self.id = job_id
+        self.engine = engine
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.submitted = time.monotonic()
+        self.started: Optional[float] = None  # Set by the worker thread when the call begins
+        self.cancelled = False
+        self.waiter: Optional[asyncio.Future] = None
+
+    @property
+    def state(self) -> str:
+        return "running" if self.started is not None else "queued"
+
+    def describe(self) -> dict:
+        now = time.monotonic()
+        return {
+            "id": self.id,
+            "engine": self.engine,
+            "guild_id": self.guild_id,
+            "user_id": self.user_id,
+            "state": self.state,
+            "age": now - self.submitted,
+            "running_for": now - self.started if self.started is not None else 0.0,
+        }
+
+
+class TranscriptionPool:
+    '''
+    Every speech-to-text call goes through here, off the event loop.
+
+    Whisper jobs run on the compute coordinator's heavy threads under its "whisper" slot limit;
+    the online fallback, which is network-bound, runs on the default executor. The number of
+    jobs queued or running is bounded, each job has a timeout, and a guild's jobs can be
+    cancelled. A queued job is dropped before it starts. A running Whisper call cannot be
+    interrupted, so its caller is released immediately and the thread finishes in the
+    background, keeping its compute slot until then.
+    '''
+
+    ENGINES = ("whisper", "google")
+
+    def __init__(self, bot) -> None:
+        self.bot = bot
+        self.max_jobs = max(1, int(os.getenv("TRANSCRIBE_QUEUE_SIZE", "32")))
+        self.timeout = float(os.getenv("TRANSCRIBE_TIMEOUT", "120"))
+        self.jobs: Dict[int, TranscriptionJob] = {}
+        self._ids = itertools.count(1)
+        self.latencies: Deque[Tuple[float, float]] = collections.deque(maxlen=512)  # (finished, seconds) of completed jobs
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.cancelled = 0
+
+    def _gauge(self) -> None:
+        self.bot.metrics.set_gauge("transcription.jobs", len(self.jobs))
+
+    async def _execute(self, job: TranscriptionJob, func: Callable, args: tuple, kwargs: dict) -> Any:
+        def work() -> Any:
+            if job.cancelled:
+                raise TranscriptionCancelled(f"Transcription {job.id} was cancelled before it started")
+            job.started = time.monotonic()
+            return func(*args, **kwargs)
+
+        if job.engine == "whisper":
+            return await self.bot.compute.run("whisper", work)
+        return await asyncio.to_thread(work)
+
+    async def run(self, engine: str, func: Callable, *args: Any, guild_id: Optional[int] = None,
+                  user_id: Optional[int] = None, timeout: Optional[float] = None, **kwargs: Any) -> Any:
+        """Run a blocking transcription call in the pool and return its result.
+
+        Raises TranscriptionQueueFull, TranscriptionTimeout or TranscriptionCancelled.
+        """
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown transcription engine {engine!r}")
+        if len(self.jobs) >= self.max_jobs:
+            self.rejected += 1
+            self.bot.metrics.incr("transcription.rejected")
+            raise TranscriptionQueueFull(f"{len(self.jobs)} transcriptions already pending, try again shortly")
+
+        job = TranscriptionJob(next(self._ids), engine, guild_id, user_id)
+        self.jobs[job.id] = job
+        self._gauge()
+        job.waiter = asyncio.ensure_future(self._execute(job, func, args, kwargs))
+        try:
+            result = await asyncio.wait_for(job.waiter, timeout or self.timeout)
+        except asyncio.TimeoutError:
+            job.cancelled = True
+            self.timeouts += 1
+            self.bot.metrics.incr(f"transcription.{engine}.timeouts")
+            logging.warning(f"Transcription {job.id} ({engine}, guild {guild_id}) timed out as {job.state}")
+            raise TranscriptionTimeout(f"Transcription took longer than {timeout or self.timeout:g}s") from None
+        except asyncio.CancelledError:
+            cancelled_by_pool = job.cancelled  # Set by cancel() before it cancels the waiter
+            job.cancelled = True
+            self.cancelled += 1
+            self.bot.metrics.incr(f"transcription.{engine}.cancelled")
+            if not cancelled_by_pool:
+                raise  # The caller itself was cancelled
+            raise TranscriptionCancelled(f"Transcription {job.id} was cancelled") from None
+        finally:
+            self.jobs.pop(job.id, None)
+            self._gauge()
+        self.completed += 1
+        now = time.monotonic()
+        self.latencies.append((now, now - job.submitted))
+        self.bot.metrics.observe(f"transcription.{engine}.latency", now - job.submitted)
+        return result
+
+    def cancel(self, guild_id: Optional[int] = None) -> int:
+        """Cancel a guild's transcriptions (all of them when guild_id is None); returns how many"""
+        count = 0
+        for job in list(self.jobs.values()):
+            if guild_id is None or job.guild_id == guild_id:
+                job.cancelled = True
+                if job.waiter is not None:
+                    job.waiter.cancel()
+                count += 1
+        return count
+
+    def pending(self, guild_id: Optional[int] = None) -> List[TranscriptionJob]:
+        return [job for job in self.jobs.values() if guild_id is None or job.guild_id == guild_id]
+
+    def report(self) -> dict:
+        """Queue depth and outcome counters for status commands"""
+        jobs = list(self.jobs.values())
+        return {
+            "queued": sum(1 for job in jobs if job.state == "queued"),
+            "running": sum(1 for job in jobs if job.state == "running"),
+            "max_jobs": self.max_jobs,
+            "timeout": self.timeout,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+        }
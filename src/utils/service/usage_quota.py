@@ -0,0 +1,134 @@
+import collections
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+RESOURCES = {
+    "audio_seconds": "audio seconds transcribed",
+    "llm_tokens": "LLM tokens generated",
+    "tts_chars": "TTS characters synthesized",
+    "rvc_seconds": "RVC seconds converted",
+}
+
+
+def trim_text(text: str, max_chars: int) -> str:
+    """Shorten text to a character budget, cutting at a word boundary"""
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars].rsplit(" ", 1)[0]
+    return (cut or text[:max_chars]).rstrip(",;: ") + "..."
+
+
+class TokenBucket:
+    '''Classic token bucket: holds up to `capacity`, refilled continuously at `rate` per second'''
+
+    def __init__(self, capacity: float, rate: float) -> None:
+        self.capacity = capacity
+        self.rate = rate
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def refill(self) -> float:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.level
+
+    def take(self, amount: float) -> None:
+        self.refill()
+        self.level = max(0.0, self.level - amount)
+
+    def seconds_until(self, amount: float) -> float:
+        missing = min(amount, self.capacity) - self.refill()
+        return max(0.0, missing / self.rate) if self.rate > 0 else float("inf")
+
+
+class QuotaDecision:
+    '''What a caller should do with a unit of work given the guild's remaining quota'''
+
+    ALLOW = "allow"
+    DEGRADE = "degrade"  # Some budget left: do a cheaper version of the work
+    DEFER = "defer"      # Budget exhausted: skip or postpone the work
+
+    def __init__(self, action: str, remaining: float = float("inf"), retry_after: float = 0.0) -> None:
+        self.action = action
+        self.remaining = remaining
+        self.retry_after = retry_after
+
+    @property
+    def allowed(self) -> bool:
+        return self.action == self.ALLOW
+
+    @property
+    def deferred(self) -> bool:
+        return self.action == self.DEFER
+
+
+class UsageTracker:
+    '''
+    Per-guild and per-user accounting of expensive work, with token-bucket quotas.
+
+    Quotas are configured per resource as an hourly allowance per guild through
+    `QUOTA_<RESOURCE>_PER_HOUR` (0 or unset = unlimited). A guild may burst up to one
+    hour's allowance, which then refills continuously.
+    '''
+
+    def __init__(self) -> None:
+        self.limits: Dict[str, float] = {
+            resource: float(os.getenv(f"QUOTA_{resource.upper()}_PER_HOUR", "0"))
+            for resource in RESOURCES
+        }
+        self._buckets: Dict[Tuple[int, str], TokenBucket] = {}
+        self.guild_usage: Dict[int, collections.Counter] = collections.defaultdict(collections.Counter)
+        self.user_usage: Dict[Tuple[int, int], collections.Counter] = collections.defaultdict(collections.Counter)
+        self.decisions: collections.Counter = collections.Counter()
+
+    @staticmethod
+    def _guild_key(guild_id: Optional[int]) -> int:
+        return guild_id or 0  # DMs share one scope
+
+    def _bucket(self, guild_id: int, resource: str) -> Optional[TokenBucket]:
+        limit = self.limits.get(resource, 0)
+        if limit <= 0:
+            return None
+        key = (guild_id, resource)
+        if key not in self._buckets:
+            self._buckets[key] = TokenBucket(limit, limit / 3600)
+        return self._buckets[key]
+
+    def check(self, guild_id: Optional[int], resource: str, amount: float = 1) -> QuotaDecision:
+        """Decide whether work of an estimated size may run in full, degraded, or not at all"""
+        bucket = self._bucket(self._guild_key(guild_id), resource)
+        if bucket is None:
+            decision = QuotaDecision(QuotaDecision.ALLOW)
+        else:
+            level = bucket.refill()
+            if level >= amount:
+                decision = QuotaDecision(QuotaDecision.ALLOW, level)
+            elif level >= 1:
+                decision = QuotaDecision(QuotaDecision.DEGRADE, level)
+            else:
+                decision = QuotaDecision(QuotaDecision.DEFER, level, bucket.seconds_until(amount))
+        self.decisions[(resource, decision.action)] += 1
+        return decision
+
+    def record(self, guild_id: Optional[int], user_id: Optional[int], resource: str, amount: float) -> None:
+        """Account for work that was actually done"""
+        if amount <= 0:
+            return
+        guild_key = self._guild_key(guild_id)
+        self.guild_usage[guild_key][resource] += amount
+        if user_id is not None:
+            self.user_usage[(guild_key, user_id)][resource] += amount
+        bucket = self._bucket(guild_key, resource)
+        if bucket is not None:
+            bucket.take(amount)
+
+    def remaining(self, guild_id: Optional[int], resource: str) -> Optional[float]:
+        bucket = self._bucket(self._guild_key(guild_id), resource)
+        return bucket.refill() if bucket is not None else None
+
+    def top_users(self, guild_id: Optional[int], resource: str, limit: int = 5):
+        guild_key = self._guild_key(guild_id)
+        users = [(user_id, usage[resource]) for (g, user_id), usage in self.user_usage.items() if g == guild_key and usage[resource]]
+        return sorted(users, key=lambda item: -item[1])[:limit]
@@ -0,0 +1,310 @@
+import asyncio
+import io
+import logging
+import os
+import threading
+import time
+import wave
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import discord
+import numpy as np
+
+SAMPLE_RATE = 48000  # Discord decodes every speaker to 48 kHz 16-bit stereo
+FRAME_MS = 20
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+
+
+def downmix_into(pcm: np.ndarray, out: np.ndarray) -> None:
+    """Average interleaved stereo int16 into a mono int16 slice, without building a new buffer"""
+    np.add(pcm[0::2] >> 1, pcm[1::2] >> 1, out=out)
+
+
+class Utterance:
+    '''
+    One stretch of a speaker's voice, cut at a pause, as 48 kHz mono 16-bit PCM.
+
+    The samples are a view into one of the sink's pooled buffers; `release()` hands the
+    buffer back once the audio has been converted for the transcription engine.
+    '''
+
+    def __init__(self, sink: "StreamingVADSink", user_id: int, buffer: np.ndarray, length: int,
+                 started: float, ended: float) -> None:
+        self.sink = sink
+        self.user_id = user_id
+        self.sample_rate = SAMPLE_RATE
+        self.started = started  # time.monotonic() of the first voiced frame
+        self.ended = ended  # time.monotonic() of the last frame received
+        self.length = length
+        self._buffer: Optional[np.ndarray] = buffer
+
+    @property
+    def samples(self) -> np.ndarray:
+        if self._buffer is None:
+            raise ValueError("Utterance audio was already released")
+        return self._buffer[:self.length]
+
+    @property
+    def duration(self) -> float:
+        return self.length / self.sample_rate
+
+    def wav_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(self.sample_rate)
+            f.writeframes(self.samples.tobytes())
+        return buffer.getvalue()
+
+    def release(self) -> None:
+        buffer, self._buffer = self._buffer, None
+        if buffer is not None:
+            self.sink.give_back(buffer)
+
+
+class _Segmenter:
+    '''
+    Energy VAD for one speaker.
+
+    While the speaker is quiet, frames go into a small preroll ring. When speech starts, the
+    ring is unrolled into a pooled utterance buffer and later frames are downmixed straight
+    into it; the buffer is cut after a pause.
+    '''
+
+    def __init__(self, sink: "StreamingVADSink", user_id: int) -> None:
+        self.sink = sink
+        self.user_id = user_id
+        self.noise_floor = sink.threshold / 2
+        self.preroll = np.zeros(sink.preroll_frames * FRAME_SAMPLES, dtype=np.int16)
+        self.preroll_pos = 0
+        self.preroll_filled = 0
+        self.scratch = np.zeros(FRAME_SAMPLES, dtype=np.int16)
+        self.buffer: Optional[np.ndarray] = None
+        self.length = 0
+        self.voiced = 0
+        self.silent_samples = 0
+        self.trailing_silence = 0
+        self.started = 0.0
+        self.last_frame = 0.0
+
+    @property
+    def speaking(self) -> bool:
+        return self.buffer is not None
+
+    def _remember(self, frame: np.ndarray) -> None:
+        """Keep a quiet frame in the preroll ring, overwriting the oldest"""
+        size = len(self.preroll)
+        n = min(len(frame), size)
+        first = min(n, size - self.preroll_pos)
+        self.preroll[self.preroll_pos:self.preroll_pos + first] = frame[-n:][:first]
+        self.preroll[:n - first] = frame[-n:][first:]
+        self.preroll_pos = (self.preroll_pos + n) % size
+        self.preroll_filled = min(size, self.preroll_filled + n)
+
+    def _unroll_preroll(self, out: np.ndarray) -> int:
+        """Copy the ring into the start of a buffer, oldest sample first; returns how many"""
+        filled, pos = self.preroll_filled, self.preroll_pos
+        older = filled - pos if filled > pos else 0
+        out[:older] = self.preroll[len(self.preroll) - older:]
+        out[older:filled] = self.preroll[max(0, pos - (filled - older)):pos]
+        self.preroll_pos = self.preroll_filled = 0
+        return filled
+
+    def push(self, pcm: np.ndarray, stereo: bool, now: float) -> Optional[Utterance]:
+        sink = self.sink
+        n = len(pcm) // 2 if stereo else len(pcm)
+        utterance = None
+        if self.speaking and (now - self.last_frame >= sink.silence_seconds or self.length + n > len(self.buffer)):
+            utterance = self.finish()  # The client stopped sending, or the utterance hit its length cap
+        self.last_frame = now
+
+        if self.speaking:
+            frame = self.buffer[self.length:self.length + n]
+        else:
+            if len(self.scratch) < n:
+                self.scratch = np.zeros(n, dtype=np.int16)
+            frame = self.scratch[:n]
+        if stereo:
+            downmix_into(pcm, frame)
+        else:
+            frame[:] = pcm
+
+        rms = float(np.sqrt(np.mean(np.square(frame, dtype=np.float32))))
+        voiced = rms > max(sink.threshold, self.noise_floor * sink.noise_ratio)
+        if not voiced:
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * rms
+
+        if not self.speaking:
+            if voiced:
+                self.buffer = sink.take_buffer()
+                self.length = self._unroll_preroll(self.buffer)
+                self.buffer[self.length:self.length + n] = frame
+                self.length += n
+                self.voiced, self.silent_samples, self.trailing_silence, self.started = 1, 0, 0, now
+            else:
+                self._remember(frame)
+            return utterance
+
+        self.length += n
+        if voiced:
+            self.voiced += 1
+            self.silent_samples = self.trailing_silence = 0
+        else:
+            self.silent_samples += n
+            self.trailing_silence += 1
+        if self.trailing_silence >= sink.silence_frames:
+            utterance = self.finish() or utterance
+        return utterance
+
+    def finish(self) -> Optional[Utterance]:
+        """Cut the current utterance; None when it was too short to be speech"""
+        buffer, voiced = self.buffer, self.voiced
+        # Keep a short tail of the pause
+        length = self.length - max(0, self.silent_samples - len(self.preroll))
+        self.buffer, self.length, self.voiced, self.silent_samples, self.trailing_silence = None, 0, 0, 0, 0
+        if voiced < self.sink.min_speech_frames:
+            self.sink.discarded += 1
+            self.sink.give_back(buffer)
+            return None
+        return Utterance(self.sink, self.user_id, buffer, length, self.started, self.last_frame)
+
+
+class StreamingVADSink(discord.sinks.Sink):
+    '''
+    Recording sink that hands each speaker's utterances over as soon as they pause.
+
+    Frames arrive on pycord's decoder thread and are downmixed to mono and segmented per
+    user with an adaptive energy threshold. Discord stops sending packets when someone stops
+    talking, so a watcher on the event loop also cuts utterances whose speaker went quiet.
+    Each user has a bounded queue drained by one task, so their captions stay in order;
+    when a queue is full the oldest utterance is dropped. Utterance buffers are preallocated
+    at the maximum utterance length and recycled, so capture does no per-packet allocation
+    or bytes concatenation.
+    '''
+
+    def __init__(self, bot: discord.Bot, guild_id: int, handler: Callable[[Utterance], Awaitable[None]],
+                 owner: str = "speech_to_text") -> None:
+        super().__init__()
+        self.bot = bot
+        self.guild_id = guild_id
+        self.handler = handler
+        self.owner = owner
+        self.loop = asyncio.get_running_loop()
+        self.threshold = float(os.getenv("VAD_ENERGY_THRESHOLD", "400"))  # RMS on the 16-bit scale
+        self.noise_ratio = float(os.getenv("VAD_NOISE_RATIO", "3"))
+        self.silence_seconds = int(os.getenv("VAD_SILENCE_MS", "600")) / 1000
+        self.silence_frames = max(1, int(self.silence_seconds * 1000 / FRAME_MS))
+        self.min_speech_frames = max(1, int(os.getenv("VAD_MIN_SPEECH_MS", "200")) // FRAME_MS)
+        self.max_frames = max(1, int(float(os.getenv("VAD_MAX_UTTERANCE_SECONDS", "15")) * 1000 / FRAME_MS))
+        self.preroll_frames = max(1, int(os.getenv("VAD_PREROLL_MS", "200")) // FRAME_MS)
+        self.max_pending = max(1, int(os.getenv("VAD_MAX_PENDING", "4")))
+        self.utterances = 0
+        self.dropped = 0
+        self.discarded = 0
+        self.capacity = (self.max_frames + self.preroll_frames) * FRAME_SAMPLES
+        self.max_free = max(1, int(os.getenv("VAD_SPARE_BUFFERS", "2")))
+        self.allocated = 0
+        self._free: List[np.ndarray] = []
+        self._lock = threading.RLock()  # write() runs on the decoder thread, the watcher on the loop
+        self._segmenters: Dict[int, _Segmenter] = {}
+        self._queues: Dict[int, asyncio.Queue] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._watcher = bot.task_supervisor.spawn(self._watch(), "vad_watch", owner=owner, guild_id=guild_id)
+
+    def write(self, data, user) -> None:
+        if not isinstance(data, (bytes, bytearray, memoryview)):  # pycord 2.7+ passes VoiceData
+            user, data = data.source, data.pcm
+        user_id = getattr(user, "id", user)
+        if self.finished or user_id is None or not data:
+            return
+        pcm = np.frombuffer(data, dtype=np.int16)  # A view of the packet, not a copy
+        with self._lock:
+            segmenter = self._segmenters.get(user_id)
+            if segmenter is None:
+                segmenter = self._segmenters[user_id] = _Segmenter(self, user_id)
+            utterance = segmenter.push(pcm, pcm.size % 2 == 0, time.monotonic())
+        if utterance is not None:
+            self.loop.call_soon_threadsafe(self._enqueue, utterance)
+
+    def take_buffer(self) -> np.ndarray:
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+            self.allocated += 1
+        self.bot.metrics.incr("transcription.live.buffers_allocated")
+        return np.empty(self.capacity, dtype=np.int16)
+
+    def give_back(self, buffer: np.ndarray) -> None:
+        with self._lock:
+            if len(self._free) < self.max_free:
+                self._free.append(buffer)
+            else:
+                self.allocated -= 1
+
+    def _cut_quiet(self, now: float, everyone: bool = False) -> List[Utterance]:
+        with self._lock:
+            cut = [
+                segmenter.finish() for segmenter in self._segmenters.values()
+                if segmenter.speaking and (everyone or now - segmenter.last_frame >= self.silence_seconds)
+            ]
+        return [utterance for utterance in cut if utterance is not None]
+
+    async def _watch(self) -> None:
+        interval = min(0.1, self.silence_seconds / 2)
+        while not self.finished:
+            await asyncio.sleep(interval)
+            for utterance in self._cut_quiet(time.monotonic()):
+                self._enqueue(utterance)
+
+    def _enqueue(self, utterance: Utterance) -> None:
+        user_id = utterance.user_id
+        queue = self._queues.get(user_id)
+        if queue is None:
+            queue = self._queues[user_id] = asyncio.Queue(maxsize=self.max_pending)
+            self._workers[user_id] = self.bot.task_supervisor.spawn(
+                self._work(queue), f"vad_user:{user_id}", owner=self.owner, guild_id=self.guild_id
+            )
+        if queue.full():
+            queue.get_nowait().release()
+            queue.task_done()
+            self.dropped += 1
+            self.bot.metrics.incr("transcription.live.dropped")
+            logging.warning(f"Live transcription in guild {self.guild_id} fell behind, dropped an utterance from {user_id}")
+        queue.put_nowait(utterance)
+        self.utterances += 1
+        self.bot.metrics.incr("transcription.live.utterances")
+
+    async def _work(self, queue: asyncio.Queue) -> None:
+        while True:
+            utterance = await queue.get()
+            try:
+                await self.handler(utterance)
+            except Exception as e:
+                logging.error(f"Error handling utterance from {utterance.user_id}: {e}")
+            finally:
+                utterance.release()
+                queue.task_done()
+
+    def cleanup(self) -> None:
+        """Called by pycord when recording stops: cut whatever is still being spoken"""
+        self.finished = True
+        for utterance in self._cut_quiet(time.monotonic(), everyone=True):
+            self.loop.call_soon_threadsafe(self._enqueue, utterance)
+
+    async def drain(self) -> None:
+        """Wait until every queued utterance has been handled, then stop the sink's tasks"""
+        if not self.finished:
+            self.cleanup()
+        await asyncio.sleep(0)  # Let utterances cut on other threads reach their queues
+        await asyncio.gather(*(queue.join() for queue in list(self._queues.values())))
+        for task in [self._watcher, *self._workers.values()]:
+            task.cancel()
+
+    def buffered(self) -> tuple:
+        """(speakers, bytes) of audio buffers this sink holds, for the memory profiler"""
+        with self._lock:
+            speakers = len(self._segmenters)
+            total = self.allocated * self.capacity * 2
+            total += sum(segmenter.preroll.nbytes + segmenter.scratch.nbytes for segmenter in self._segmenters.values())
+        return (speakers, total)
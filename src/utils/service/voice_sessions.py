@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+import discord
+
+
+class VoiceSession:
+    '''
+    One guild's voice connection and what is using it.
+
+    The client is always read back from the guild, so a session stays correct when discord
+    reconnects or replaces the client underneath it.
+    '''
+
+    def __init__(self, bot: discord.Bot, guild_id: int) -> None:
+        self.bot = bot
+        self.guild_id = guild_id
+        self.channel_id: Optional[int] = None  # Channel the session should be in
+        self.recorder: Optional[str] = None  # Cog that started the running recording
+        self.connected_at = 0.0
+        self.last_active = time.monotonic()
+        self.connects = 0
+        self.reconnects = 0
+        self.lock = asyncio.Lock()  # One connect or move at a time per guild
+
+    @property
+    def voice_client(self) -> Optional[discord.VoiceClient]:
+        guild = self.bot.get_guild(self.guild_id)
+        client = guild.voice_client if guild else None
+        return client if client is not None and client.is_connected() else None
+
+    @property
+    def playing(self) -> bool:
+        client = self.voice_client
+        return bool(client and client.is_playing())
+
+    @property
+    def recording(self) -> bool:
+        client = self.voice_client
+        return bool(client and getattr(client, "recording", False))
+
+    def touch(self) -> None:
+        self.last_active = time.monotonic()
+
+    def describe(self) -> dict:
+        """Snapshot of the session for status commands"""
+        client = self.voice_client
+        return {
+            "channel": client.channel.name if client else None,
+            "playing": self.playing,
+            "recording": self.recorder if self.recording else None,
+            "connected_for": time.monotonic() - self.connected_at if client and self.connected_at else 0.0,
+            "idle_for": time.monotonic() - self.last_active,
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+        }
+
+
+class VoiceSessionManager:
+    '''
+    Voice connections keyed by guild, shared by every cog.
+
+    Cogs ask for their guild's client here instead of connecting themselves or picking from
+    `bot.voice_clients`. Joining a channel reuses a live connection instead of reconnecting;
+    only explicit join commands may move it to another channel. Dropped connections are retried with backoff, and recording
+    ownership is tracked so two cogs cannot start a recording on the same client.
+    '''
+
+    def __init__(self, bot: discord.Bot) -> None:
+        self.bot = bot
+        self.sessions: Dict[int, VoiceSession] = {}
+        self.connect_timeout = float(os.getenv("VOICE_CONNECT_TIMEOUT", "30"))
+        self.connect_attempts = max(1, int(os.getenv("VOICE_CONNECT_ATTEMPTS", "3")))
+
+    def session(self, guild_id: int) -> VoiceSession:
+        session = self.sessions.get(guild_id)
+        if session is None:
+            session = self.sessions[guild_id] = VoiceSession(self.bot, guild_id)
+        return session
+
+    def voice_client(self, guild_id: Optional[int]) -> Optional[discord.VoiceClient]:
+        """Return the guild's connected voice client, if any"""
+        if guild_id is None:
+            return None
+        guild = self.bot.get_guild(guild_id)
+        client = guild.voice_client if guild else None
+        return client if client is not None and client.is_connected() else None
+
+    async def connect(self, channel: discord.VoiceChannel, move: bool = False) -> discord.VoiceClient:
+        """Join a channel, reusing the guild's live connection when there is one.
+
+        A connection in another channel is only moved when `move` is set (explicit join commands)
+        and nothing is recording on it; otherwise this raises discord.ClientException, as
+        `channel.connect()` does, and the existing session is left alone.
+        """
+        session = self.session(channel.guild.id)
+        async with session.lock:
+            client = session.voice_client
+            if client is not None:
+                if client.channel.id != channel.id:
+                    if not move or session.recording:
+                        raise discord.ClientException(f"Already connected to voice channel {client.channel.name}")
+                    await client.move_to(channel)
+                session.channel_id = channel.id
+                session.touch()
+                return client
+            session.channel_id = channel.id
+
+            stale = channel.guild.voice_client  # Half-open client left by a dropped connection
+            if stale is not None:
+                try:
+                    await stale.disconnect(force=True)
+                except Exception as e:
+                    logging.debug(f"Error clearing stale voice client in guild {channel.guild.id}: {e}")
+
+            for attempt in range(1, self.connect_attempts + 1):
+                try:
+                    client = await channel.connect(timeout=self.connect_timeout, reconnect=True)
+                    break
+                except (asyncio.TimeoutError, discord.ConnectionClosed) as e:
+                    if attempt == self.connect_attempts:
+                        raise
+                    logging.warning(f"Voice connect to {channel.name} failed ({e!r}), attempt {attempt}/{self.connect_attempts}")
+                    session.reconnects += 1
+                    await asyncio.sleep(attempt)
+            session.connects += 1
+            session.connected_at = time.monotonic()
+            session.touch()
+            self.bot.metrics.incr("voice.connects")
+            self.bot.metrics.set_gauge("voice.sessions", len(self.bot.voice_clients))
+            return client
+
+    async def ensure_connected(self, guild_id: int) -> Optional[discord.VoiceClient]:
+        """Return the guild's client, reconnecting to the session's channel if the connection dropped"""
+        session = self.sessions.get(guild_id)
+        if session is None:
+            return self.voice_client(guild_id)
+        client = session.voice_client
+        if client is None and session.channel_id is not None:
+            channel = self.bot.get_channel(session.channel_id)
+            if channel is not None:
+                logging.info(f"Reconnecting to {channel.name} in guild {guild_id}")
+                session.reconnects += 1
+                client = await self.connect(channel)
+        return client
+
+    async def disconnect(self, guild_id: int) -> bool:
+        """Leave voice in a guild and forget its session; False if it was not connected"""
+        session = self.sessions.pop(guild_id, None)
+        client = session.voice_client if session else self.voice_client(guild_id)
+        if client is None:
+            return False
+        await client.disconnect()
+        self.bot.metrics.set_gauge("voice.sessions", len(self.bot.voice_clients))
+        return True
+
+    def start_recording(self, guild_id: int, owner: str, sink: discord.sinks.Sink, callback: Callable, *args) -> None:
+        """Start recording on the guild's client for one cog"""
+        session = self.session(guild_id)
+        client = session.voice_client
+        if client is None:
+            raise discord.ClientException("Not connected to a voice channel")
+        if session.recording:
+            raise discord.sinks.RecordingException(f"Already recording for {session.recorder}")
+        client.start_recording(sink, callback, *args)
+        session.recorder = owner
+        session.touch()
+
+    def stop_recording(self, guild_id: int, owner: Optional[str] = None) -> bool:
+        """Stop the guild's recording (only if `owner` started it, when given)"""
+        session = self.sessions.get(guild_id)
+        if session is None or not session.recording or (owner and session.recorder != owner):
+            return False
+        session.voice_client.stop_recording()
+        session.recorder = None
+        session.touch()
+        return True
+
+    def recorder(self, guild_id: int) -> Optional[str]:
+        """Return which cog is recording in a guild"""
+        session = self.sessions.get(guild_id)
+        return session.recorder if session and session.recording else None
+
+    def active(self) -> List[VoiceSession]:
+        return [session for session in self.sessions.values() if session.voice_client is not None]
+
+    async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState,
+                                    after: discord.VoiceState) -> None:
+        """Follow the bot being moved or disconnected by someone else"""
+        if self.bot.user is None or member.id != self.bot.user.id:
+            return
+        if after.channel is None:
+            self.sessions.pop(member.guild.id, None)
+            self.bot.metrics.set_gauge("voice.sessions", len(self.bot.voice_clients))
+        elif member.guild.id in self.sessions:
+            self.sessions[member.guild.id].channel_id = after.channel.id
@@ -0,0 +1,161 @@
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+from utils.service.transcription_pool import TranscriptionCancelled
+from utils.service.whisper_models import BATCH_SAMPLES
+
+
+def engine_id(key: Any, options: dict) -> str:
+    """Names the model and decoding mode behind a transcript, for the transcript cache"""
+    return f"whisper:{key}" + (":greedy" if options else "")
+
+
+class _PendingClip:
+    '''One clip waiting for the next batch, with the future its caller awaits'''
+
+    def __init__(self, audio: Any, guild_id: Optional[int], user_id: Optional[int], future: asyncio.Future) -> None:
+        self.audio = audio
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.future = future
+        self.queued = time.monotonic()
+
+
+class WhisperBatcher:
+    '''
+    Groups Whisper transcriptions from every speaker and guild into batches.
+
+    Whisper pads each clip to a 30 s window, so short utterances cost nearly as much as long
+    ones and a CPU spends most of its time streaming the same weights. Clips that fit one
+    window are collected for up to `WHISPER_BATCH_WINDOW_MS` (or until `WHISPER_BATCH_SIZE`
+    are waiting), decoded in a single pass as one transcription pool job, and each result
+    is handed back to its caller. Longer audio is transcribed on its own as before.
+    '''
+
+    def __init__(self, bot) -> None:
+        self.bot = bot
+        self.window = max(0.0, float(os.getenv("WHISPER_BATCH_WINDOW_MS", "50")) / 1000)
+        self.max_batch = max(1, int(os.getenv("WHISPER_BATCH_SIZE", "8")))
+        self._pending: List[_PendingClip] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.batches = 0
+        self.clips = 0
+
+    async def transcribe(self, audio: Any, guild_id: Optional[int] = None,
+                         user_id: Optional[int] = None) -> Optional[dict]:
+        """Transcribe 16 kHz mono samples; None when no Whisper model can be loaded.
+
+        The result's "engine" names the model that actually ran (see `engine_id`).
+        Raises the transcription pool's errors (queue full, timeout, cancelled).
+        """
+        if self.max_batch <= 1 or len(audio) > BATCH_SAMPLES:
+            async with self._model() as (model, options):
+                if model is None:
+                    return None
+                result = await self.bot.transcription.run(
+                    "whisper", model.transcribe, audio, guild_id=guild_id, user_id=user_id, **options
+                )
+                result["engine"] = engine_id(model.key, options)
+                return result
+
+        loop = asyncio.get_running_loop()
+        clip = _PendingClip(audio, guild_id, user_id, loop.create_future())
+        self._pending.append(clip)
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        try:
+            return await clip.future
+        finally:
+            if clip in self._pending:  # The caller gave up before the batch was sent
+                self._pending.remove(clip)
+
+    @contextlib.asynccontextmanager
+    async def _model(self) -> AsyncIterator[Tuple[Optional[Any], dict]]:
+        """Borrow the model and decoding options the degradation controller currently asks for"""
+        name, options = self.bot.degradation.whisper_profile()
+        handle = await self.bot.whisper.acquire(name)
+        if handle is None and name is not None:
+            handle = await self.bot.whisper.acquire()  # The smaller model could not be loaded, keep the configured one
+        try:
+            yield handle, options
+        finally:
+            if handle is not None:
+                self.bot.whisper.release(handle)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        batch = [clip for clip in batch if not clip.future.done()]
+        if batch:
+            self.bot.task_supervisor.spawn(self._run(batch), "whisper_batch", owner="whisper")
+
+    async def _run(self, batch: List[_PendingClip]) -> None:
+        now = time.monotonic()
+        for clip in batch:
+            self.bot.metrics.observe("whisper.batch.wait", now - clip.queued)
+        self.bot.metrics.observe("whisper.batch.size", len(batch))
+        guilds = {clip.guild_id for clip in batch}
+        try:
+            async with self._model() as (model, options):
+                if model is None:
+                    results = [None] * len(batch)
+                else:
+                    results = await self.bot.transcription.run(
+                        "whisper", model.transcribe_batch, [clip.audio for clip in batch],
+                        guild_id=guilds.pop() if len(guilds) == 1 else None,
+                        user_id=batch[0].user_id if len(batch) == 1 else None,
+                        **options,
+                    )
+                    for result in results:
+                        result["engine"] = engine_id(model.key, options)
+        except asyncio.CancelledError:  # Shutdown or supervisor cancel; callers must not wait forever
+            self._fail(batch, TranscriptionCancelled("Transcription was cancelled"))
+            raise
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        self.batches += 1
+        self.clips += len(batch)
+        for clip, result in zip(batch, results):
+            if not clip.future.done():
+                clip.future.set_result(result)
+
+    @staticmethod
+    def _fail(clips: List[_PendingClip], error: BaseException) -> None:
+        for clip in clips:
+            if not clip.future.done():
+                clip.future.set_exception(error)
+
+    def cancel(self, guild_id: Optional[int] = None) -> int:
+        """Fail a guild's clips that are still waiting for a batch; returns how many"""
+        count = 0
+        for clip in list(self._pending):
+            if guild_id is None or clip.guild_id == guild_id:
+                self._pending.remove(clip)
+                if not clip.future.done():
+                    clip.future.set_exception(TranscriptionCancelled("Transcription was cancelled"))
+                count += 1
+        if not self._pending and self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if count:
+            logging.debug(f"Cancelled {count} clip(s) waiting for a Whisper batch")
+        return count
+
+    def report(self) -> dict:
+        return {
+            "waiting": len(self._pending),
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "clips": self.clips,
+            "mean_batch": self.clips / self.batches if self.batches else 0.0,
+        }
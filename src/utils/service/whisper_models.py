@@ -0,0 +1,372 @@
+import asyncio
+import collections
+import contextlib
+import logging
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, NamedTuple, Optional, Set
+
+import numpy as np
+
+from utils.service.memory_profiler import tensor_bytes
+from utils.service.stt_engines import BACKENDS, select_backend
+
+
+class ModelKey(NamedTuple):
+    name: str
+    device: str
+    precision: str  # "fp16", "fp32" or "int8"
+    backend: str = "openai-whisper"
+
+    def __str__(self) -> str:
+        return f"{self.backend}:{self.name}/{self.device}/{self.precision}"
+
+
+def _default_device() -> str:
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except ImportError:
+        return "cpu"
+
+
+BATCH_SAMPLES = 30 * 16000  # One Whisper window; longer audio needs the sequential sliding transcribe
+
+
+def decode_batch(model: Any, audios: List[Any], fp16: bool = False, **options) -> List[dict]:
+    """Decode clips of up to 30 s through openai-whisper's encoder and decoder as one batch.
+
+    Every clip is padded to the 30 s window, so the encoder costs the same per clip whatever
+    its length and a batch shares one pass over the weights. Clips whose greedy decode fails
+    Whisper's own checks (repetition, low confidence) are re-run with `transcribe`, which
+    retries at higher temperatures, unless a fixed `temperature` was asked for.
+    """
+    import torch
+    import whisper
+
+    fallback = "temperature" not in options
+
+    mel = torch.stack([
+        whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), model.dims.n_mels, device=model.device)
+        for audio in audios
+    ])
+    decoded = whisper.decode(model, mel, whisper.DecodingOptions(fp16=fp16, without_timestamps=True, **options))
+    results = []
+    for audio, result in zip(audios, decoded):
+        if result.no_speech_prob > 0.6 and result.avg_logprob < -1.0:
+            results.append({"text": "", "segments": [], "language": result.language})
+        elif fallback and (result.compression_ratio > 2.4 or result.avg_logprob < -1.0):
+            results.append(model.transcribe(audio, fp16=fp16, **options))
+        else:
+            text = result.text.strip()
+            end = len(audio) / 16000
+            results.append({"text": text, "segments": [{"start": 0.0, "end": end, "text": text}], "language": result.language})
+    return results
+
+
+class LoadedModel:
+    '''One set of Whisper weights in memory, with its users and statistics'''
+
+    def __init__(self, key: ModelKey, model: Any, load_seconds: float) -> None:
+        self.key = key
+        self.model = model
+        self.load_seconds = load_seconds
+        self.size_bytes = tensor_bytes(model) if hasattr(model, "parameters") else 0
+        self.refs = 0
+        self.evict_when_idle = False  # Unload requested while handles were out
+        self.lock = threading.Lock()  # Decoding installs hooks on the model, so calls must not overlap
+        self.inferences = 0
+        self.inference_seconds = 0.0
+
+
+class ModelHandle:
+    '''A shared reference to a loaded Whisper model, valid until released'''
+
+    def __init__(self, loaded: LoadedModel) -> None:
+        self._loaded = loaded
+        self.key = loaded.key
+
+    @property
+    def model(self) -> Any:
+        return self._loaded.model
+
+    def transcribe(self, audio: Any, **options) -> dict:
+        """Run Whisper on a path or array; safe to call from several worker threads at once"""
+        options.setdefault("fp16", self.key.precision == "fp16")
+        loaded = self._loaded
+        with loaded.lock:
+            start = time.perf_counter()
+            try:
+                return loaded.model.transcribe(audio, **options)
+            finally:
+                loaded.inferences += 1
+                loaded.inference_seconds += time.perf_counter() - start
+
+    def transcribe_batch(self, audios: List[Any], **options) -> List[dict]:
+        """Transcribe several arrays of up to 30 s in one model pass, in order"""
+        options.setdefault("fp16", self.key.precision == "fp16")
+        loaded = self._loaded
+        model = loaded.model
+        with loaded.lock:
+            start = time.perf_counter()
+            try:
+                if hasattr(model, "transcribe_batch"):
+                    return model.transcribe_batch(audios, **options)
+                if hasattr(model, "dims"):
+                    return decode_batch(model, audios, **options)
+                return [model.transcribe(audio, **options) for audio in audios]
+            finally:
+                loaded.inferences += len(audios)
+                loaded.inference_seconds += time.perf_counter() - start
+
+
+class WhisperModelManager:
+    '''
+    Loads each (backend, model size, device, precision) once and hands out shared handles.
+
+    Cogs borrow a model with `async with bot.whisper.use() as model:` and transcribe through
+    the handle. Weights are loaded in a worker thread on first use, concurrent requests wait
+    for the same load, and each model is registered with the resource manager. An unload
+    requested while handles are out waits for the last one to be released. The backend
+    (openai-whisper, int8-quantized torch or faster-whisper) is chosen by `select_backend`.
+    '''
+
+    def __init__(self, bot) -> None:
+        self.bot = bot
+        self.default_name = os.getenv("WHISPER_MODEL", "base")
+        self.default_device = os.getenv("WHISPER_DEVICE") or _default_device()
+        self.default_backend = select_backend(self.default_device)
+        self.loader: Optional[Callable[[str, str], Any]] = None  # Replaces every backend (benchmarks)
+        self.models: Dict[ModelKey, LoadedModel] = {}
+        self.failures: Dict[ModelKey, str] = {}
+        self._loading: Dict[ModelKey, asyncio.Future] = {}
+        self.loading_since: Dict[ModelKey, float] = {}
+        self.waiters: Dict[ModelKey, int] = collections.Counter()  # Requests waiting for a load to finish
+        self.warming: Set[ModelKey] = set()
+        self._preload: Optional[asyncio.Task] = None
+
+    def key(self, name: Optional[str] = None, device: Optional[str] = None, precision: Optional[str] = None,
+            backend: Optional[str] = None) -> ModelKey:
+        device = device or self.default_device
+        if backend is None:
+            backend = self.default_backend if device == self.default_device else select_backend(device)
+        precision = precision or os.getenv("WHISPER_PRECISION")
+        if precision not in BACKENDS[backend].precisions:
+            precision = BACKENDS[backend].default_precision(device)
+        return ModelKey(name or self.default_name, device, precision, backend)
+
+    def _resource_name(self, key: ModelKey) -> str:
+        return f"whisper:{key}"
+
+    def _load_weights(self, key: ModelKey) -> Any:
+        if self.loader is not None:
+            return self.loader(key.name, key.device)
+        return BACKENDS[key.backend].load(key.name, key.device, key.precision)
+
+    async def _load(self, key: ModelKey) -> Optional[LoadedModel]:
+        logging.info(f"Loading Whisper model {key}...")
+        start = time.perf_counter()
+        self.loading_since[key] = time.monotonic()
+        try:
+            model = await asyncio.to_thread(self._load_weights, key)
+        except Exception as e:
+            logging.error(f"Failed to load Whisper model {key}: {e}")
+            self.failures[key] = str(e)
+            return None
+        finally:
+            self.loading_since.pop(key, None)
+        loaded = LoadedModel(key, model, time.perf_counter() - start)
+        self.models[key] = loaded
+        self.failures.pop(key, None)
+        resource = self._resource_name(key)
+        self.bot.resource_manager.register(resource, lambda: self._unload(key))
+        self.bot.resource_manager.touch(resource, loaded.size_bytes)
+        self.bot.metrics.observe(f"whisper.load.{key.name}", loaded.load_seconds)
+        self.bot.metrics.set_gauge("whisper.models_loaded", len(self.models))
+        logging.info(f"Whisper model {key} loaded in {loaded.load_seconds:.1f}s, {loaded.size_bytes / 1048576:.0f} MB")
+        return loaded
+
+    def _start_load(self, key: ModelKey) -> asyncio.Future:
+        """The load of `key` in progress, starting one if needed"""
+        pending = self._loading.get(key)
+        if pending is None:
+            pending = self._loading[key] = asyncio.ensure_future(self._load(key))
+            pending.add_done_callback(lambda _: self._loading.pop(key, None))
+        return pending
+
+    async def acquire(self, name: Optional[str] = None, device: Optional[str] = None,
+                      precision: Optional[str] = None, backend: Optional[str] = None) -> Optional[ModelHandle]:
+        """Return a handle to the model, loading it once; None if it cannot be loaded"""
+        key = self.key(name, device, precision, backend)
+        loaded = self.models.get(key)
+        if loaded is None:
+            pending = self._start_load(key)
+            self.waiters[key] += 1
+            try:
+                loaded = await asyncio.shield(pending)
+            finally:
+                self.waiters[key] -= 1
+            if loaded is None:
+                return None
+        loaded.refs += 1
+        loaded.evict_when_idle = False
+        self.bot.resource_manager.touch(self._resource_name(key))
+        return ModelHandle(loaded)
+
+    def prepare(self, name: Optional[str] = None) -> bool:
+        """Whether a model is loaded; if not, start loading it in the background unless it already failed"""
+        key = self.key(name)
+        if key in self.models:
+            return True
+        if key not in self.failures:
+            self._start_load(key)
+        return False
+
+    def release(self, handle: ModelHandle) -> None:
+        loaded = handle._loaded
+        loaded.refs -= 1
+        self.bot.resource_manager.touch(self._resource_name(handle.key))
+        if loaded.refs <= 0 and loaded.evict_when_idle:
+            self._drop(loaded.key)
+
+    @contextlib.asynccontextmanager
+    async def use(self, name: Optional[str] = None, device: Optional[str] = None, precision: Optional[str] = None,
+                  backend: Optional[str] = None) -> AsyncIterator[Optional[ModelHandle]]:
+        """Borrow a model for the duration of a block (None when it cannot be loaded)"""
+        handle = await self.acquire(name, device, precision, backend)
+        try:
+            yield handle
+        finally:
+            if handle is not None:
+                self.release(handle)
+
+    def preload_names(self) -> List[str]:
+        """Models to load at startup: WHISPER_PRELOAD (comma-separated, "none" to disable) or the configured one"""
+        names = os.getenv("WHISPER_PRELOAD")
+        if names is None:
+            return [self.default_name]
+        return [name.strip() for name in names.split(",") if name.strip() and name.strip().lower() != "none"]
+
+    def start_preload(self) -> None:
+        """Begin loading the startup models in the background, once"""
+        if self._preload is None and self.preload_names():
+            self._preload = self.bot.task_supervisor.spawn(self.preload(), "preload", owner="whisper")
+
+    async def preload(self) -> None:
+        """Load each startup model in a worker thread and run one short inference to warm it up.
+
+        Transcriptions arriving meanwhile wait for the same load instead of starting their own.
+        """
+        for name in self.preload_names():
+            key = self.key(name)
+            if key not in self.models and await asyncio.shield(self._start_load(key)) is None:
+                continue  # Not counted as a waiting transcription; a failed load is not retried here
+            handle = await self.acquire(name)
+            if handle is None:
+                continue
+            try:
+                if handle._loaded.inferences == 0:
+                    self.warming.add(key)
+                    start = time.perf_counter()
+                    await self.bot.compute.run("whisper", handle.transcribe, np.zeros(16000, dtype=np.float32))
+                    logging.info(f"Whisper model {key} warmed up in {time.perf_counter() - start:.1f}s")
+            except Exception as e:
+                logging.warning(f"Warm-up of Whisper model {key} failed: {e}")
+            finally:
+                self.warming.discard(key)
+                self.release(handle)
+
+    def readiness(self) -> List[dict]:
+        """Load progress of the startup models and of any model requests are waiting for"""
+        keys = [self.key(name) for name in self.preload_names()]
+        keys += [key for key in self.loading_since if key not in keys]
+        now = time.monotonic()
+        rows = []
+        for key in keys:
+            if key in self.loading_since:
+                state, seconds = "loading", now - self.loading_since[key]
+            elif key in self.warming:
+                state, seconds = "warming up", self.models[key].load_seconds
+            elif key in self.models:
+                state, seconds = "ready", self.models[key].load_seconds
+            elif key in self.failures:
+                state, seconds = "failed", 0.0
+            else:
+                state, seconds = "not loaded", 0.0
+            rows.append({
+                "key": key,
+                "state": state,
+                "seconds": seconds,
+                "waiting": self.waiters.get(key, 0),
+                "error": self.failures.get(key),
+            })
+        return rows
+
+    def _unload(self, key: ModelKey) -> None:
+        """Resource manager callback: drop the weights now, or once the last handle is released"""
+        loaded = self.models.get(key)
+        if loaded is None:
+            return
+        if loaded.refs > 0:
+            loaded.evict_when_idle = True
+            return
+        self._drop(key)
+
+    def _drop(self, key: ModelKey) -> None:
+        self.models.pop(key, None)
+        self.bot.metrics.set_gauge("whisper.models_loaded", len(self.models))
+
+    async def compare(self, audio: np.ndarray, name: Optional[str] = None) -> List[dict]:
+        """Time every backend this host can run on the same 16 kHz clip, one row per backend.
+
+        Models loaded only for the comparison are unloaded again afterwards.
+        """
+        duration = len(audio) / 16000
+        rows = []
+        for backend_name, backend in BACKENDS.items():
+            if not backend.available(self.default_device):
+                rows.append({"backend": backend_name, "error": f"not available on {self.default_device}"})
+                continue
+            key = self.key(name, backend=backend_name)
+            was_loaded = key in self.models
+            handle = await self.acquire(key.name, key.device, key.precision, key.backend)
+            if handle is None:
+                rows.append({"backend": backend_name, "error": self.failures.get(key, "failed to load")})
+                continue
+            try:
+                start = time.perf_counter()
+                result = await self.bot.compute.run("whisper", handle.transcribe, audio)
+                seconds = time.perf_counter() - start
+            finally:
+                loaded = handle._loaded
+                self.release(handle)
+                if not was_loaded and key != self.key():
+                    self._unload(key)
+            rows.append({
+                "backend": backend_name,
+                "key": str(key),
+                "rtf": seconds / duration if duration else 0.0,
+                "load_seconds": loaded.load_seconds,
+                "size_bytes": loaded.size_bytes,
+                "text": result.get("text", "").strip(),
+                "default": key == self.key(),
+            })
+        return rows
+
+    def memory_stats(self) -> dict:
+        """Report (users, bytes) per loaded model"""
+        return {str(key): (loaded.refs, loaded.size_bytes) for key, loaded in self.models.items()}
+
+    def report(self) -> Dict[str, dict]:
+        """Load time, memory and use of every loaded model"""
+        return {
+            str(key): {
+                "load_seconds": loaded.load_seconds,
+                "size_bytes": loaded.size_bytes,
+                "users": loaded.refs,
+                "inferences": loaded.inferences,
+                "inference_seconds": loaded.inference_seconds,
+            }
+            for key, loaded in self.models.items()
+        }